@@ -0,0 +1,78 @@
+"""
+Measures encode and decode throughput of each installed JSON codec on
+realistic websocket 'receivePacket' pushes and JSON-RPC 'getblock' responses.
+
+Usage:
+  python bench/codec.py [iterations]
+"""
+import sys
+import timeit
+
+from nkn_client import codec as mod
+
+RECEIVE_PACKET = {
+  "Action": "receivePacket",
+  "Src": "client.4b8ff1e8e6cd6a9cf4ed5b0ba64a5e0fd4e5ac44c26f7a0ee67b6d68a3fa1d2e",
+  "Payload": "x" * 512,
+  "Digest": "f0a4e6f28c59b6a2b1a9a1e7be0fda7c42c05f1a8a7c4b3d9e2f1a0b9c8d7e6f"
+}
+
+GET_BLOCK = {
+  "jsonrpc": "2.0",
+  "id": "6c9dbb0e-5f7e-4e38-9d2b-7b7b0e6f1c3a",
+  "result": {
+    "hash": "5f85d1286801c2f1129a02b0b19a3312f8113aaa073b5987346c59e27a12bdc6",
+    "header": {
+      "version": 0,
+      "prevBlockHash": "6cf00422b02f3d99f5c006fcdb36bfb7cc8b2c345b2f34274e50a3d8f3bb8193",
+      "transactionsRoot": "327bb43c2e40ccb2f83011d35602829872ab190171b79047397d000eddda18a9",
+      "timestamp": 1530087472,
+      "height": 12345,
+      "consensusData": 4697163132361310211,
+      "nextBookKeeper": "0000000000000000000000000000000000000000",
+      "program": {"code": "", "parameter": ""},
+      "hash": "5f85d1286801c2f1129a02b0b19a3312f8113aaa073b5987346c59e27a12bdc6"
+    },
+    "transactions": [
+      {
+        "txType": 0,
+        "payloadData": "",
+        "attributes": [{"usage": 0, "data": "%064x" % i}],
+        "inputs": [],
+        "outputs": [
+          {
+            "assetId": "4945ca009174097e6614d306b66e1f9cb1fce586cb857729be9e1c5cc04c9c02",
+            "value": 4976000000,
+            "programHash": "%040x" % i
+          }
+        ],
+        "programs": [],
+        "hash": "%064x" % (i * 7919)
+      }
+      for i in range(50)
+    ]
+  }
+}
+
+
+def _bench(fn, iterations):
+  # Returns the rate of calls per second.
+  return iterations / timeit.timeit(fn, number=iterations)
+
+
+def main(iterations=20000):
+  names = [ name for name in mod._PREFERRED if mod._CODECS[name][1] ]
+
+  print("%-16s %-8s %14s %14s" % ("message", "codec", "encode/s", "decode/s"))
+  for label, msg in (("receivePacket", RECEIVE_PACKET), ("getblock", GET_BLOCK)):
+    n = iterations if label == "receivePacket" else max(iterations // 20, 1)
+    for name in names:
+      codec = mod.get_codec(name)
+      encoded = codec.dumps(msg)
+      encode = _bench(lambda: codec.dumps(msg), n)
+      decode = _bench(lambda: codec.loads(encoded), n)
+      print("%-16s %-8s %14.0f %14.0f" % (label, name, encode, decode))
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,74 @@
+"""
+Compares the per-call latency of JSON-RPC calls made with a fresh connection
+per request against calls made on the pooled keep-alive session owned by
+NknJsonRpcApi. Both are run against a local stand-in for an NKN node.
+
+Usage:
+  python bench/jsonrpc_session.py [calls]
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+from socketserver import ThreadingMixIn
+import sys
+import threading
+import time
+
+from nkn_client.jsonrpc.api import NknJsonRpcApi
+from nkn_client.jsonrpc.rpc import call_rpc
+
+
+class _Handler(BaseHTTPRequestHandler):
+  protocol_version = "HTTP/1.1"
+  disable_nagle_algorithm = True
+
+  def do_POST(self):
+    length = int(self.headers["Content-Length"])
+    req = json.loads(self.rfile.read(length))
+    body = json.dumps({
+      "jsonrpc": "2.0",
+      "result": 1234,
+      "id": req["id"]
+    }).encode("utf-8")
+
+    self.send_response(200)
+    self.send_header("Content-Type", "application/json")
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+
+def _measure(fn, calls):
+  start = time.perf_counter()
+  for _ in range(calls):
+    fn()
+  return (time.perf_counter() - start) / calls
+
+
+def main(calls=2000):
+  server = _Server(("127.0.0.1", 0), _Handler)
+  threading.Thread(target=server.serve_forever, daemon=True).start()
+  hostname = "127.0.0.1:%d" % server.server_address[1]
+
+  url = "http://%s/" % hostname
+  bare = _measure(lambda: call_rpc(url, "getlatestblockheight"), calls)
+
+  with NknJsonRpcApi(hostname) as api:
+    pooled = _measure(api.get_latest_block_height, calls)
+
+  server.shutdown()
+
+  print("calls per run     : %d" % calls)
+  print("new connection    : %8.1f us/call" % (bare * 1e6))
+  print("pooled keep-alive : %8.1f us/call" % (pooled * 1e6))
+  print("speedup           : %8.2fx" % (bare / pooled))
+
+
+if __name__ == "__main__":
+  main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,74 @@
+"""
+Measures the memory held by a million queued packets, and the time to build
+and sign each, for NknPacket and for the namedtuple it replaced, which was
+copied to attach the signature. Payloads and signatures are shared between
+packets, so that only the cost of the packets themselves is measured.
+
+Usage:
+  python bench/packets.py [packets]
+"""
+from collections import namedtuple
+import gc
+import sys
+import time
+import tracemalloc
+
+from nkn_client.client.packet import NknSentPacket, sign
+
+_TuplePacket = namedtuple(
+    "_TuplePacket",
+    ["source", "destination", "payload", "digest", "signature"],
+    defaults=[None, None, None, None, None]
+)
+
+def _tuple_sent_packet(dest, payload):
+  return _TuplePacket(destination=dest, payload=payload)
+
+def _tuple_sign(packet, signature):
+  return _TuplePacket(
+      source=packet.source,
+      destination=packet.destination,
+      payload=packet.payload,
+      digest=packet.digest,
+      signature=signature
+  )
+
+DEST = "client.4b8ff1e8e6cd6a9cf4ed5b0ba64a5e0fd4e5ac44c26f7a0ee67b6d68a3fa1d2e"
+PAYLOAD = b"x" * 64
+SIGNATURE = "ab" * 64
+
+
+def _build(make, sign_packet, count):
+  return [ sign_packet(make(DEST, PAYLOAD), SIGNATURE) for _ in range(count) ]
+
+def _measure(make, sign_packet, count):
+  # Returns the bytes allocated for each packet held, and the time to build
+  # and sign each, in seconds. Tracing allocations slows them down, so they
+  # are timed separately.
+  gc.collect()
+  start = time.perf_counter()
+  packets = _build(make, sign_packet, count)
+  elapsed = time.perf_counter() - start
+  del packets
+
+  gc.collect()
+  tracemalloc.start()
+  packets = _build(make, sign_packet, count)
+  held = tracemalloc.get_traced_memory()[0]
+  tracemalloc.stop()
+  del packets
+
+  return held / count, elapsed / count
+
+def main(count=1000000):
+  print("packets : %d" % count)
+  print("%-12s %12s %12s" % ("packet", "bytes held", "ns/packet"))
+  for name, make, sign_packet in (
+      ("namedtuple", _tuple_sent_packet, _tuple_sign),
+      ("NknPacket", NknSentPacket, sign)):
+    held, elapsed = _measure(make, sign_packet, count)
+    print("%-12s %12.1f %12.0f" % (name, held, elapsed * 1e9))
+
+
+if __name__ == "__main__":
+  main(*[ int(arg) for arg in sys.argv[1:] ])
@@ -0,0 +1,93 @@
+"""
+Measures the rate at which payloads are delivered over a reliable session,
+across a simulated relay path with a given round-trip time and loss rate in
+either direction, against stop-and-wait delivery, with a window of one.
+
+Usage:
+  python bench/sessions.py [payloads] [rtt_ms]
+"""
+import asyncio
+import functools
+import random
+import sys
+import time
+
+from nkn_client.client.packet import (
+  NknReceivedPacket,
+  decode_payload,
+  encode_payload
+)
+from nkn_client.client.session import SessionManager
+
+LOSS_RATES = (0.0, 0.01, 0.05, 0.1)
+
+
+class _Path(object):
+  # Carries frames between two session managers, after half the round-trip
+  # time with some jitter, dropping some.
+  def __init__(self, rtt, loss, seed=0):
+    self._delay = rtt / 2
+    self._loss = loss
+    self._random = random.Random(seed)
+    self.managers = {}
+    self.delivered = 0
+
+  def attach(self, addr, **kwargs):
+    self.managers[addr] = SessionManager(
+        functools.partial(self._send, addr),
+        initial_rto=4 * 2 * self._delay,
+        **kwargs
+    )
+    return self.managers[addr]
+
+  async def _send(self, source, destination, frame):
+    if self._random.random() < self._loss:
+      return
+    asyncio.get_event_loop().call_later(
+        self._delay * self._random.uniform(0.9, 1.1),
+        self._arrive,
+        source,
+        destination,
+        encode_payload(frame)
+    )
+
+  def _arrive(self, source, destination, wire):
+    pkt = NknReceivedPacket(source, decode_payload(wire), None)
+    self.delivered += len(self.managers[destination].add(pkt))
+
+async def _measure(count, rtt, loss, max_window):
+  path = _Path(rtt, loss)
+  sender = path.attach("a", max_window=max_window)
+  receiver = path.attach("b", max_window=max_window)
+
+  payload = "x" * 256
+  start = time.perf_counter()
+  for _ in range(count):
+    await sender.send("b", payload)
+  await sender.flush()
+  elapsed = time.perf_counter() - start
+
+  session = sender.get_session("b")
+  stats = session.stats()
+  sender.close()
+  receiver.close()
+  return count / elapsed, stats
+
+def main(count=2000, rtt_ms=50):
+  loop = asyncio.get_event_loop()
+  rtt = rtt_ms / 1000
+
+  print("payloads per run : %d" % count)
+  print("round-trip time  : %d ms" % rtt_ms)
+  print("%-6s %-14s %12s %14s %8s" % ("loss", "sending", "payloads/s",
+                                      "retransmitted", "window"))
+  for loss in LOSS_RATES:
+    for name, window, n in (("stop-and-wait", 1, max(count // 20, 10)),
+                            ("windowed", 1024, count)):
+      rate, stats = loop.run_until_complete(_measure(n, rtt, loss, window))
+      print("%-6.2f %-14s %12.0f %14d %8d" % (
+          loss, name, rate, stats["retransmitted"], stats["window"]))
+
+
+if __name__ == "__main__":
+  main(*[ int(arg) for arg in sys.argv[1:] ])
@@ -0,0 +1,57 @@
+"""
+Measures the rate at which PacketSigner signs packet payloads, on the event
+loop and on increasing numbers of threads, at several payload sizes. Each
+run submits all of its payloads at once, as a burst of concurrent sends
+would.
+
+Usage:
+  python bench/signing.py [payloads]
+"""
+import asyncio
+import os
+import sys
+import time
+
+from nacl.signing import SigningKey
+
+from nkn_client.client.signing import PacketSigner
+
+PAYLOAD_SIZES = (64, 1024, 16384)
+
+
+def _get_worker_counts():
+  # Runs on the event loop, then on up to twice as many threads as cores.
+  counts, workers = [0], 1
+  while workers <= 2 * (os.cpu_count() or 1):
+    counts.append(workers)
+    workers *= 2
+  return counts
+
+async def _measure(key, workers, payloads):
+  signer = PacketSigner(key, workers=workers)
+  start = time.perf_counter()
+  await asyncio.gather(*[ signer.sign(data) for data in payloads ])
+  elapsed = time.perf_counter() - start
+  signer.close()
+  return len(payloads) / elapsed, signer.batches
+
+def main(count=20000):
+  key = SigningKey.generate()
+  loop = asyncio.get_event_loop()
+
+  print("payloads per run : %d" % count)
+  print("cores            : %d" % (os.cpu_count() or 1))
+  print("%-8s %-12s %14s %8s" % ("payload", "workers", "signatures/s",
+                                 "batches"))
+  for size in PAYLOAD_SIZES:
+    payloads = [ os.urandom(size) for _ in range(count) ]
+    for workers in _get_worker_counts():
+      rate, batches = loop.run_until_complete(
+          _measure(key, workers, payloads)
+      )
+      name = "event loop" if workers == 0 else "threads=%d" % workers
+      print("%-8d %-12s %14.0f %8d" % (size, name, rate, batches))
+
+
+if __name__ == "__main__":
+  main(*[ int(arg) for arg in sys.argv[1:] ])
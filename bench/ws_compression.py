@@ -0,0 +1,157 @@
+"""
+Measures the throughput, client CPU time and bytes written of websocket
+messages sent with and without permessage-deflate, at several payload sizes.
+Messages are 'sendPacket' requests carrying JSON payloads, sent to a local
+server run in a separate process, which acknowledges once it has received
+them all. Each payload carries random hashes, so compresses as a real one
+would, rather than against the identical payload before it.
+
+Usage:
+  python bench/ws_compression.py [messages]
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import websockets
+
+from nkn_client.websocket.client import DEFLATE, WebsocketClient
+
+PAYLOAD_SIZES = (256, 4096, 65536)
+
+ASSET_ID = "4945ca009174097e6614d306b66e1f9cb1fce586cb857729be9e1c5cc04c9c02"
+
+SETTINGS = (
+  ("none", {"compression": None}),
+  ("deflate level 1", {"compression": DEFLATE, "compression_level": 1}),
+  ("deflate default", {"compression": DEFLATE}),
+  ("deflate 1KiB window", {"compression": DEFLATE,
+                           "compression_window_bits": 10}),
+)
+
+
+def _make_payload(size):
+  # Builds a JSON payload of about the given size, resembling a list of
+  # transactions, with random hashes among repeated keys.
+  txs = []
+  while len(json.dumps(txs)) < size:
+    txs.append({
+      "hash": os.urandom(32).hex(),
+      "txType": "TransferAsset",
+      "payloadData": "",
+      "attributes": [],
+      "inputs": [ {"referTxID": os.urandom(32).hex(),
+                   "referTxOutputIndex": 0} ],
+      "outputs": [ {"assetID": ASSET_ID,
+                    "value": "1.00000000",
+                    "address": "NcX9CknT7fVDGcBYB6jMkZuNSPxVpJGQDb"} ]
+    })
+  return json.dumps(txs)
+
+def _serve(port):
+  async def handle(socket, path):
+    async for msg in socket:
+      if msg == "done":
+        await socket.send("done")
+
+  loop = asyncio.get_event_loop()
+  loop.run_until_complete(websockets.serve(
+      handle,
+      "127.0.0.1",
+      port,
+      max_size=None
+  ))
+  loop.run_forever()
+
+def _start_server():
+  # Runs the server in a separate process, returning it and its hostname.
+  with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+
+  process = multiprocessing.Process(target=_serve, args=(port,), daemon=True)
+  process.start()
+  return process, "127.0.0.1:%d" % port
+
+
+class _Client(WebsocketClient):
+  def __init__(self, **kwargs):
+    WebsocketClient.__init__(self, **kwargs)
+    self.done = asyncio.get_event_loop().create_future()
+
+  async def recv(self, msg):
+    if msg == "done" and not self.done.done():
+      self.done.set_result(None)
+
+
+async def _wait_listening(hostname):
+  while True:
+    try:
+      conn = await websockets.connect("ws://%s" % hostname)
+    except OSError:
+      await asyncio.sleep(0.05)
+      continue
+    await conn.close()
+    return
+
+async def _measure(hostname, settings, msgs):
+  client = _Client(**settings)
+  await client.connect(hostname)
+
+  # Counts the bytes written to the connection, after any compression.
+  transport = client._socket.writer.transport
+  write = transport.write
+  written = [0]
+  def count(data):
+    written[0] += len(data)
+    write(data)
+  transport.write = count
+
+  start, cpu = time.perf_counter(), time.process_time()
+  for msg in msgs:
+    await client.send(msg)
+  await client.send("done")
+  await client.done
+  elapsed = time.perf_counter() - start
+  cpu = time.process_time() - cpu
+
+  await client.disconnect()
+  return len(msgs) / elapsed, cpu / len(msgs), written[0] / len(msgs)
+
+def main(messages=2000):
+  process, hostname = _start_server()
+  loop = asyncio.get_event_loop()
+  loop.run_until_complete(_wait_listening(hostname))
+
+  print("messages per run : %d" % messages)
+  print("%-8s %-20s %10s %12s %12s %7s" % (
+      "payload", "compression", "msgs/s", "cpu us/msg", "bytes/msg",
+      "ratio"))
+  for size in PAYLOAD_SIZES:
+    # Each message is distinct, since the compressor would otherwise find
+    # each repeated within its window.
+    msgs = [ json.dumps({
+               "Action": "sendPacket",
+               "Dest": "dest.key",
+               "Payload": _make_payload(size),
+               "Signature": "sig"
+             })
+             for _ in range(messages) ]
+    raw = sum( len(msg) for msg in msgs ) / messages
+
+    for name, settings in SETTINGS:
+      rate, cpu, wire = loop.run_until_complete(
+          _measure(hostname, settings, msgs)
+      )
+      print("%-8d %-20s %10.0f %12.1f %12.0f %7.2f" % (
+          size, name, rate, cpu * 1e6, wire, raw / wire))
+
+  process.terminate()
+
+
+if __name__ == "__main__":
+  main(*[ int(arg) for arg in sys.argv[1:] ])
@@ -0,0 +1,109 @@
+"""
+Measures the throughput of 'sendPacket' calls spread over several websocket
+connections by NknWebsocketMultiClient, against a local stand-in for an NKN
+node run in a separate process. The stand-in serves the requests of each
+connection one at a time, taking the given service time for each, as a node
+does, so a single connection is capped at one request per service time.
+With a short service time, the stand-in and client instead contend for the
+CPU, and throughput stops scaling with the number of connections.
+
+Usage:
+  python bench/ws_multiclient.py [packets] [service time in ms]
+"""
+import asyncio
+import json
+import multiprocessing
+import socket
+import sys
+import time
+
+import websockets
+
+from nkn_client.websocket.multi_client import (
+  LEAST_IN_FLIGHT,
+  ROUND_ROBIN,
+  NknWebsocketMultiClient
+)
+
+CONNECTIONS = (1, 2, 4, 8)
+
+
+def _serve(port, service_time):
+  async def handle(socket, path):
+    async for msg in socket:
+      msg = json.loads(msg)
+      await asyncio.sleep(service_time)
+      await socket.send(
+          json.dumps({"Action": msg["Action"], "Error": 0, "Result": None})
+      )
+
+  loop = asyncio.get_event_loop()
+  loop.run_until_complete(websockets.serve(handle, "127.0.0.1", port))
+  loop.run_forever()
+
+def _start_server(service_time):
+  # Runs the stand-in in a separate process, returning it and its hostname.
+  with socket.socket() as sock:
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+
+  process = multiprocessing.Process(
+      target=_serve,
+      args=(port, service_time),
+      daemon=True
+  )
+  process.start()
+  return process, "127.0.0.1:%d" % port
+
+async def _wait_listening(hostname):
+  while True:
+    try:
+      conn = await websockets.connect("ws://%s" % hostname)
+    except OSError:
+      await asyncio.sleep(0.05)
+      continue
+    await conn.close()
+    return
+
+async def _measure(hostname, connections, routing, packets):
+  client = NknWebsocketMultiClient(
+      num_connections=connections,
+      routing=routing,
+      heartbeat_interval=None
+  )
+  await client.connect(hostname)
+  await client.set_client("bench.key")
+
+  start = time.perf_counter()
+  await asyncio.gather(
+      *[ client.send_packet("dest.key", "payload", "sig")
+         for _ in range(packets) ]
+  )
+  elapsed = time.perf_counter() - start
+
+  await client.disconnect()
+  return packets / elapsed
+
+def main(packets=2000, service_ms=5.0):
+  packets = int(packets)
+  process, hostname = _start_server(service_ms / 1000)
+  loop = asyncio.get_event_loop()
+  loop.run_until_complete(_wait_listening(hostname))
+
+  print("packets per run : %d" % packets)
+  print("service time    : %.2f ms" % service_ms)
+  for routing in (ROUND_ROBIN, LEAST_IN_FLIGHT):
+    base = None
+    for connections in CONNECTIONS:
+      rate = loop.run_until_complete(
+          _measure(hostname, connections, routing, packets)
+      )
+      base = base or rate
+      print("%-15s x%d : %8.0f packets/s  (%.2fx)" % (
+          routing, connections, rate, rate / base))
+
+  process.terminate()
+
+
+if __name__ == "__main__":
+  main(*[ float(arg) for arg in sys.argv[1:] ])
@@ -18,10 +18,15 @@ setup(
       'nkn_client': 'src',
     },
     install_requires=[
+      'aiohttp',
       'pynacl',
       'requests',
-      'websockets'
+      'websockets>=7.0,<8'
     ],
+    extras_require={
+      'orjson': ['orjson'],
+      'ujson': ['ujson']
+    },
     test_suite='test',
     tests_require=[
       'asynctest',
@@ -0,0 +1,239 @@
+from collections import OrderedDict
+import json
+import sqlite3
+import threading
+
+
+class LruCache(object):
+  """
+  A size-bounded, in-memory cache which evicts the least recently used entry
+  once full. Safe to share between threads.
+
+  Args:
+    maxsize (int) : Maximum number of entries held.
+  """
+  def __init__(self, maxsize=1024):
+    self._maxsize = maxsize
+    self._entries = OrderedDict()
+    self._lk = threading.Lock()
+
+  def __len__(self):
+    return len(self._entries)
+
+  def get(self, key):
+    """
+    Look up an entry, marking it as recently used.
+
+    Args:
+      key (str) : Key of the entry.
+    Returns:
+      object    : The cached value, or None if there is no such entry.
+    """
+    with self._lk:
+      try:
+        self._entries.move_to_end(key)
+      except KeyError:
+        return None
+      return self._entries[key]
+
+  def put(self, key, value):
+    """
+    Add an entry, evicting the least recently used entry if full.
+
+    Args:
+      key (str)       : Key of the entry.
+      value (object)  : Value to cache.
+    """
+    with self._lk:
+      self._entries[key] = value
+      self._entries.move_to_end(key)
+      if len(self._entries) > self._maxsize:
+        self._entries.popitem(last=False)
+
+
+class SqliteCache(object):
+  """
+  An on-disk cache backed by a SQLite database. Values are stored as JSON.
+  Safe to share between threads.
+
+  Args:
+    path (str)  : Path of the database file.
+  """
+  def __init__(self, path):
+    self._db = sqlite3.connect(path, check_same_thread=False)
+    self._db.execute(
+        "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT)"
+    )
+    self._db.commit()
+    self._lk = threading.Lock()
+
+  def __len__(self):
+    with self._lk:
+      return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+  def get(self, key):
+    """
+    See LruCache.get()
+    """
+    with self._lk:
+      row = self._db.execute(
+          "SELECT value FROM cache WHERE key = ?", (key,)
+      ).fetchone()
+    if row is None:
+      return None
+    return json.loads(row[0])
+
+  def put(self, key, value):
+    """
+    See LruCache.put()
+    """
+    value = json.dumps(value)
+    with self._lk:
+      self._db.execute(
+          "INSERT OR REPLACE INTO cache (key, value) VALUES (?, ?)",
+          (key, value)
+      )
+      self._db.commit()
+
+  def close(self):
+    """
+    Closes the underlying database.
+    """
+    with self._lk:
+      self._db.close()
+
+
+class ChainCache(object):
+  """
+  A cache for chain data which never changes once written: blocks, looked up
+  by hash or height, and transactions, looked up by hash. Entries are held in
+  a size-bounded in-memory LRU, optionally backed by an on-disk tier which
+  persists between runs. May be shared between several API clients.
+
+  Caching blocks by height relies on blocks being final once they appear in
+  the chain; this may be disabled with 'cache_heights'.
+
+  Args:
+    maxsize (int)       : Maximum number of entries held in memory.
+    path (str)          : Path of a SQLite database to use as the on-disk
+                          tier. If not given, entries are only held in memory.
+    cache_heights (bool): Whether blocks may be looked up by height.
+  """
+  def __init__(self, maxsize=1024, path=None, cache_heights=True):
+    self._memory = LruCache(maxsize)
+    self._disk = None
+    if path is not None:
+      self._disk = SqliteCache(path)
+    self._cache_heights = cache_heights
+
+    # Lookup counters.
+    self.hits = 0
+    self.disk_hits = 0
+    self.misses = 0
+
+  def _get(self, key):
+    value = self._memory.get(key)
+    if value is not None:
+      self.hits += 1
+      return value
+
+    if self._disk is not None:
+      value = self._disk.get(key)
+      if value is not None:
+        self.disk_hits += 1
+        self._memory.put(key, value)
+        return value
+
+    self.misses += 1
+    return None
+
+  def _put(self, key, value):
+    self._memory.put(key, value)
+    if self._disk is not None:
+      self._disk.put(key, value)
+
+  def _block_keys(self, block, height=None, hash=None):
+    # Returns the keys under which a block is cached.
+    if hash is None:
+      hash = block.get("hash")
+    if height is None:
+      height = block.get("header", {}).get("height")
+
+    keys = []
+    if hash is not None:
+      keys.append("block:hash:%s" % hash)
+    if height is not None and self._cache_heights:
+      keys.append("block:height:%d" % height)
+    return keys
+
+  def get_block(self, height=None, hash=None):
+    """
+    Look up a block by either height or hash.
+
+    Args:
+      height (int)  : Height of the block.
+      hash (str)    : Hash of the block.
+    Returns:
+      dict          : The block, or None if it is not cached.
+    """
+    if hash is not None:
+      return self._get("block:hash:%s" % hash)
+    if height is not None and self._cache_heights:
+      return self._get("block:height:%d" % height)
+    return None
+
+  def put_block(self, block, height=None, hash=None):
+    """
+    Add a block to the cache. The block is indexed by the given height and
+    hash, along with any height and hash found in the block itself.
+
+    Args:
+      block (dict)  : The block.
+      height (int)  : Height at which the block was looked up.
+      hash (str)    : Hash by which the block was looked up.
+    """
+    for key in self._block_keys(block, height=height, hash=hash):
+      self._put(key, block)
+
+  def get_transaction(self, hash):
+    """
+    Look up a transaction by hash.
+
+    Args:
+      hash (str)  : Hash of the transaction.
+    Returns:
+      dict        : The transaction, or None if it is not cached.
+    """
+    return self._get("tx:%s" % hash)
+
+  def put_transaction(self, transaction, hash):
+    """
+    Add a transaction to the cache.
+
+    Args:
+      transaction (dict)  : The transaction.
+      hash (str)          : Hash of the transaction.
+    """
+    self._put("tx:%s" % hash, transaction)
+
+  def stats(self):
+    """
+    Returns the lookup counters of the cache.
+
+    Returns:
+      dict  : Number of memory hits, disk hits and misses, along with the
+              number of entries held in memory.
+    """
+    return {
+      "hits": self.hits,
+      "disk_hits": self.disk_hits,
+      "misses": self.misses,
+      "size": len(self._memory)
+    }
+
+  def close(self):
+    """
+    Closes the on-disk tier, if any.
+    """
+    if self._disk is not None:
+      self._disk.close()
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ends the subscriptions whose queues it is put in.
+_CLOSED = object()
+
+
+class BlockSubscriptionHub(object):
+  """
+  Detects new blocks in the chain and delivers them to any number of
+  subscribers. Each new block is fetched once, however many subscribers
+  there are.
+
+  The hub wakes whenever the node pushes a new block hash over the websocket.
+  Should those pushes stop, it falls back to polling the latest block height,
+  backing off while no new blocks appear.
+
+  Args:
+    jsonrpc (AsyncNknJsonRpcApi)  : Client used to fetch blocks.
+    ws (NknWebsocketApiClient)    : Client on which block hashes are pushed.
+    min_interval (float)          : Shortest time between polls, in seconds.
+    max_interval (float)          : Longest time between polls, in seconds.
+    queue_size (int)              : Maximum number of blocks buffered for each
+                                    subscriber. A subscriber which falls
+                                    further behind misses its oldest blocks.
+    concurrency (int)             : Maximum number of blocks fetched at once.
+  """
+  def __init__(
+      self,
+      jsonrpc,
+      ws,
+      min_interval=1.0,
+      max_interval=30.0,
+      queue_size=64,
+      concurrency=8
+  ):
+    self._jsonrpc = jsonrpc
+    self._ws = ws
+    self._min_interval = min_interval
+    self._max_interval = max_interval
+    self._queue_size = queue_size
+    self._concurrency = concurrency
+
+    # Current time to wait for a push before polling, in seconds.
+    self.interval = min_interval
+
+    # Queues of the current subscribers.
+    self._subscribers = set()
+
+    # Set when the node pushes a new block hash.
+    self._pushed = asyncio.Event()
+
+    # Height of the last block published, or of the latest block when
+    # watching began, once known.
+    self._height = None
+
+    # Tracks the main loop execution.
+    self._task = None
+
+  async def subscribe(self):
+    """
+    Subscribe to new blocks. Iterated with 'async for', yielding each block
+    added to the chain from the time of subscription. The iteration ends
+    once the hub is closed.
+
+    Yields:
+      dict  : The contents of each new block.
+    """
+    queue = asyncio.Queue(maxsize=self._queue_size)
+    self._subscribers.add(queue)
+    self._start()
+    try:
+      while True:
+        block = await queue.get()
+        if block is _CLOSED:
+          return
+        yield block
+    finally:
+      self._subscribers.discard(queue)
+      if not self._subscribers:
+        await self.close()
+
+  async def close(self):
+    """
+    Stops watching for new blocks, ending every subscription.
+    """
+    subscribers, self._subscribers = self._subscribers, set()
+    for queue in subscribers:
+      if queue.full():
+        queue.get_nowait()
+      queue.put_nowait(_CLOSED)
+
+    if self._task is None:
+      return
+
+    task, self._task = self._task, None
+    self._ws.remove_block_hash_listener(self._on_block_hash)
+    task.cancel()
+    try:
+      await task
+    except asyncio.CancelledError:
+      pass
+
+  def _start(self):
+    if self._task is None:
+      self._ws.add_block_hash_listener(self._on_block_hash)
+      self._task = asyncio.ensure_future(self._main_loop())
+
+  def _on_block_hash(self, block_hash):
+    self._pushed.set()
+
+  def _publish(self, block):
+    for queue in self._subscribers:
+      if queue.full():
+        queue.get_nowait()
+      queue.put_nowait(block)
+
+  async def _fetch_new_blocks(self):
+    # Fetches and publishes the blocks above the last published, keeping
+    # count as it goes, so that none is published twice should fetching
+    # fail partway.
+    latest = await self._jsonrpc.get_latest_block_height()
+    if self._height is None:
+      self._height = latest
+    elif latest > self._height:
+      async for block in self._jsonrpc.iter_blocks(
+          self._height + 1,
+          latest + 1,
+          concurrency=self._concurrency
+      ):
+        self._publish(block)
+        self._height += 1
+
+  async def _main_loop(self):
+    self._height = None
+    pushed = False
+
+    while True:
+      height = self._height
+      try:
+        await self._fetch_new_blocks()
+      except asyncio.CancelledError:
+        raise
+      except Exception:
+        logger.warning("Failed to fetch new blocks.", exc_info=True)
+
+      if height is None:
+        # Blocks are watched for from the first height fetched, which is
+        # retried until it succeeds.
+        if self._height is None:
+          self.interval = min(self.interval * 2, self._max_interval)
+      elif pushed:
+        # Pushes are arriving, so polling is only a fallback.
+        self.interval = self._max_interval
+      elif self._height > height:
+        # Pushes have stopped while blocks are still being added.
+        self.interval = self._min_interval
+      else:
+        self.interval = min(self.interval * 2, self._max_interval)
+
+      try:
+        await asyncio.wait_for(self._pushed.wait(), timeout=self.interval)
+        pushed = True
+      except asyncio.TimeoutError:
+        pushed = False
+      self._pushed.clear()
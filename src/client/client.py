@@ -1,10 +1,42 @@
+import asyncio
+import inspect
+import logging
+
 from nacl.encoding import HexEncoder as Encoder
 from nacl.signing import SigningKey as Key
 
+from nkn_client.client.blocks import BlockSubscriptionHub
+from nkn_client.client.fragment import Reassembler, split_payload
 from nkn_client.client.packet import *
-from nkn_client.jsonrpc.api import NknJsonRpcApi
+from nkn_client.client.session import SessionManager
+from nkn_client.client.signing import PacketSigner, PacketVerifier
+from nkn_client.jsonrpc.async_api import AsyncNknJsonRpcApi
+from nkn_client.jsonrpc.pool import AsyncNknJsonRpcPool
+from nkn_client.websocket.api_client import WebsocketApiClient
+from nkn_client.websocket.client import WebsocketClient
+from nkn_client.websocket.inbox import Inbox
+from nkn_client.websocket.multi_client import (
+  ROUND_ROBIN,
+  NknWebsocketMultiClient
+)
 from nkn_client.websocket.nkn_api import NknWebsocketApiClient
 
+logger = logging.getLogger(__name__)
+
+def _get_websocket_options():
+  # Returns the names of the keyword arguments passed on to the websocket
+  # client, as accepted along its chain of constructors.
+  options = set()
+  for cls in (NknWebsocketApiClient, WebsocketApiClient, WebsocketClient):
+    options.update(
+      name
+      for name, param in inspect.signature(cls.__init__).parameters.items()
+      if param.kind == param.POSITIONAL_OR_KEYWORD and name != "self"
+    )
+  return frozenset(options)
+
+_WEBSOCKET_OPTIONS = _get_websocket_options()
+
 class NknClient(object):
   """
   Client for the NKN blockchain network.
@@ -12,11 +44,109 @@ class NknClient(object):
   Args:
     identifier (str)              : Client identifier.
     seed (str)                    : Private seed for the client key, as hex.
-    rpc_server_addr (str)         : Address to bootstrap from JSON-RPC.
-    reconnect_interval_min (int)  : Unsupported.
-    reconnect_interval_max (int)  : Unsupported.
-    response_timeout_secs (int)   : Unsupported.
-    msg_holding_secs (int)        : Unsupported.
+    rpc_server_addr (str)         : Address to bootstrap from JSON-RPC. May
+                                    also be a list of addresses, in which
+                                    case calls are spread over all of them.
+    reconnect_interval_min (int)  : Shortest time to wait before
+                                    reconnecting the websocket, in
+                                    milliseconds.
+    reconnect_interval_max (int)  : Longest time to wait before
+                                    reconnecting the websocket, in
+                                    milliseconds.
+    response_timeout_secs (int)   : Time after which a packet sent reliably
+                                    is sent again if not acknowledged, in
+                                    seconds, until the round-trip time to
+                                    its destination is measured.
+    msg_holding_secs (int)        : Time after which a packet sent reliably
+                                    and still not acknowledged fails its
+                                    session, in seconds.
+    codec (str)                   : Name of the JSON codec to use for
+                                    JSON-RPC and websocket messages, as for
+                                    nkn_client.codec.get_codec.
+    metrics (MetricsRegistry)     : Registry in which JSON-RPC and websocket
+                                    calls are recorded. If not given, the
+                                    default registry is used.
+    num_connections (int)         : Number of websocket connections over
+                                    which sent packets are spread. If more
+                                    than one, see NknWebsocketMultiClient.
+    routing (str)                 : How to choose the connection on which to
+                                    send each packet, as for
+                                    NknWebsocketMultiClient.
+    signing_workers (int)         : Number of threads signing sent packets.
+                                    If 0, packets are signed on the event
+                                    loop. See PacketSigner.
+    verify (bool)                 : Whether to verify the signature of each
+                                    received packet. Packets which fail are
+                                    dropped. Only the packets pushed with a
+                                    signature can be verified, and the node
+                                    need not forward signatures, in which
+                                    case every packet is unsigned, and
+                                    dropped unless 'allow_unsigned' is set.
+                                    See PacketVerifier.
+    allow_unsigned (bool)         : With verification, whether to deliver
+                                    unsigned packets, unverified, rather than
+                                    drop them. Since anyone may push a packet
+                                    from any source without a signature, such
+                                    packets are not authentic, and nothing
+                                    marks them once delivered.
+    verify_workers (int)          : Number of threads verifying received
+                                    packets. If 0, packets are verified on
+                                    the event loop.
+    verify_cache_size (int)       : Maximum number of source addresses whose
+                                    keys are cached for verification.
+    fragment_size (int)           : Largest payload sent in one packet, in
+                                    bytes. Larger payloads are split into
+                                    fragments of this size, and joined again
+                                    by the receiving client, which must also
+                                    be an NknClient. If None, payloads are
+                                    never split. Fragments received are
+                                    joined either way.
+    fragment_window (int)         : Maximum number of fragments of a payload
+                                    being sent at once. Other packets sent
+                                    meanwhile are interleaved with them.
+    reassembly_max_bytes (int)    : Largest total size of the fragments of
+                                    incomplete payloads held, and of those
+                                    streamed but not yet read, in bytes. See
+                                    Reassembler.
+    reassembly_timeout (float)    : Time after which an incomplete payload is
+                                    abandoned if no more of its fragments
+                                    arrive, in seconds.
+    stream_fragments (bool)       : If True, a fragmented payload is received
+                                    as soon as its first fragment arrives, as
+                                    a PayloadStream of its data. If False, it
+                                    is received once complete.
+    reliable (bool)               : Whether to send packets over reliable
+                                    sessions, which are acknowledged by the
+                                    receiving client, and sent again if lost.
+                                    The receiving client must also be an
+                                    NknClient. Packets sent over sessions are
+                                    received in order and without duplicates
+                                    either way. If enabled, packets are
+                                    received in the background once
+                                    connected, so that acknowledgements are
+                                    handled promptly, and held until read.
+                                    See SessionManager.
+    session_max_window (int)      : Largest number of packets sent reliably
+                                    to a destination which may await
+                                    acknowledgement at once. Also bounds
+                                    those received ahead of order, so must be
+                                    no smaller than that of any client
+                                    sending to this one.
+    delivered_inbox_size (int)    : With reliable sessions, number of
+                                    received packets held until read, beyond
+                                    which packets still arriving are dropped
+                                    before being acknowledged, so that those
+                                    sent reliably are sent again later, while
+                                    acknowledgements keep being handled. A
+                                    batch of packets received at once may
+                                    overshoot it. If 0, unbounded.
+    kwargs                        : Passed to NknWebsocketApiClient, such as
+                                    to bound the inbox of received packets,
+                                    or to configure compression and size
+                                    limits on the websocket connection.
+  Raises:
+    TypeError                     : If any of 'kwargs' is not accepted by
+                                    NknWebsocketApiClient.
   """
   def __init__(
       self,
@@ -27,8 +157,38 @@ class NknClient(object):
       reconnect_interval_max=64000,
       response_timeout_secs=5,
       msg_holding_secs=3600,
+      codec=None,
+      metrics=None,
+      num_connections=1,
+      routing=ROUND_ROBIN,
+      signing_workers=0,
+      verify=False,
+      verify_workers=0,
+      verify_cache_size=1024,
+      allow_unsigned=False,
+      fragment_size=None,
+      fragment_window=4,
+      reassembly_max_bytes=2 ** 26,
+      reassembly_timeout=30.0,
+      stream_fragments=False,
+      reliable=False,
+      session_max_window=1024,
+      delivered_inbox_size=0,
       **kwargs
   ):
+    if fragment_size is not None and fragment_size < 1:
+      raise ValueError("Fragment size must be at least 1!")
+    if fragment_window < 1:
+      raise ValueError("Fragment window must be at least 1!")
+    unknown = set(kwargs) - _WEBSOCKET_OPTIONS
+    if num_connections > 1 and "inbox" in kwargs:
+      # Shared by the connections, so set by NknWebsocketMultiClient.
+      unknown.add("inbox")
+    if unknown:
+      raise TypeError(
+          "Unexpected keyword arguments: %s" % ", ".join(sorted(unknown))
+      )
+
     key = Key.generate()
     if seed is not None:
       key = Key.from_seed(seed, Encoder)
@@ -36,14 +196,106 @@ class NknClient(object):
     self._key = key
     pubkey = self._key.verify_key
 
+    # Signs sent packets.
+    self._signer = PacketSigner(key, workers=signing_workers)
+
+    # Verifies received packets, if enabled.
+    self._verifier = None
+    self._allow_unsigned = allow_unsigned
+    if verify:
+      self._verifier = PacketVerifier(
+          cache_size=verify_cache_size,
+          workers=verify_workers
+      )
+
+    # Splits large sent payloads, and joins received ones.
+    self._fragment_size = fragment_size
+    self._fragment_window = fragment_window
+    self._reassembler = Reassembler(
+        max_bytes=reassembly_max_bytes,
+        timeout=reassembly_timeout,
+        stream=stream_fragments
+    )
+
+    # Sends packets over reliable sessions, if enabled, and receives them
+    # either way.
+    self._reliable = reliable
+    self._sessions = SessionManager(
+        self._send_frame,
+        max_window=session_max_window,
+        holding_secs=msg_holding_secs,
+        initial_rto=response_timeout_secs
+    )
+
+    # With reliable sessions, packets are received as they arrive, so that
+    # acknowledgements are handled even when no packets are being read, and
+    # are held here until read.
+    self._delivered = None
+    self._delivered_inbox_size = delivered_inbox_size
+    self._receiving = None
+    # Whether packets are being dropped, for lack of room to hold them.
+    self._dropping = False
+    if reliable:
+      self._delivered = Inbox()
+
     # NKN client address.
-    self._addr = ".".join([ identifier, str(pubkey.encode(Encoder)) ])
+    self._addr = ".".join([ identifier, pubkey.encode(Encoder).decode() ])
 
     # JSON-RPC API client.
-    self._jsonrpc = NknJsonRpcApi(rpc_server_addr)
+    if isinstance(rpc_server_addr, (list, tuple)):
+      self._jsonrpc = AsyncNknJsonRpcPool(
+          rpc_server_addr,
+          codec=codec,
+          metrics=metrics
+      )
+    else:
+      self._jsonrpc = AsyncNknJsonRpcApi(
+          rpc_server_addr,
+          codec=codec,
+          metrics=metrics
+      )
 
     # Websocket API client.
-    self._ws = NknWebsocketApiClient()
+    kwargs.update(
+        codec=codec,
+        metrics=metrics,
+        reconnect_interval_min=reconnect_interval_min / 1000,
+        reconnect_interval_max=reconnect_interval_max / 1000
+    )
+    if num_connections > 1:
+      self._ws = NknWebsocketMultiClient(
+          num_connections=num_connections,
+          routing=routing,
+          **kwargs
+      )
+    else:
+      self._ws = NknWebsocketApiClient(**kwargs)
+
+    # Delivers new blocks to subscribers, once any subscribe.
+    self._blocks = None
+
+  @property
+  def verifier(self):
+    """
+    Verifier of received packets, counting those which passed and failed,
+    or None if verification is disabled.
+    """
+    return self._verifier
+
+  @property
+  def reassembler(self):
+    """
+    Joins the fragments of received payloads, counting those completed and
+    abandoned.
+    """
+    return self._reassembler
+
+  @property
+  def sessions(self):
+    """
+    Reliable sessions sent and received over. See SessionManager.
+    """
+    return self._sessions
 
   @property
   def sig_chain_block_hash(self):
@@ -52,25 +304,219 @@ class NknClient(object):
     return self._ws.sig_chain_block_hash
 
   async def connect(self):
-    host = self._jsonrpc.get_websocket_address(self._addr)
+    if isinstance(self._ws, NknWebsocketMultiClient):
+      # Each connection is served by the node responsible for its address.
+      host = await asyncio.gather(
+          *[ self._jsonrpc.get_websocket_address(addr)
+             for addr in self._ws.get_addresses(self._addr) ]
+      )
+    else:
+      host = await self._jsonrpc.get_websocket_address(self._addr)
 
     await self._ws.connect(host)
+    await self._ws.set_client(self._addr)
+
+    if self._delivered is not None and self._receiving is None:
+      self._receiving = asyncio.ensure_future(self._receive_loop())
 
   async def disconnect(self):
+    if self._receiving is not None:
+      self._receiving.cancel()
+      self._receiving = None
+    self._sessions.close()
+    if self._blocks is not None:
+      await self._blocks.close()
     await self._ws.disconnect()
+    await self._jsonrpc.close()
+    self._signer.close()
+    if self._verifier is not None:
+      self._verifier.close()
+    self._reassembler.close()
+
+  def subscribe_blocks(self):
+    """
+    Subscribe to new blocks added to the chain. Iterated with 'async for'.
+    Blocks are fetched once and shared among all subscribers.
+
+    See BlockSubscriptionHub.subscribe()
+    """
+    if self._blocks is None:
+      self._blocks = BlockSubscriptionHub(self._jsonrpc, self._ws)
+    return self._blocks.subscribe()
 
-  def _sign_packet(self, packet):
-    signed = self._key.sign(packet.payload.encode("utf-8"))
-    sign(packet, str(signed.signature))
+  async def _sign_packet(self, packet):
+    signature = await self._signer.sign(get_payload_bytes(packet.payload))
+    return sign(packet, signature)
 
   async def send(self, destination, payload):
+    """
+    Send a packet to another client. Payloads larger than the fragment size
+    are sent as several packets.
+
+    Args:
+      destination (str) : NKN address of the client.
+      payload (str, bytes, bytearray or memoryview)
+                        : The message. Binary messages are sent as base64,
+                          and received as bytes.
+    Raises:
+      DeliveryError     : If sending reliably, and packets sent earlier to
+                          the same client were not acknowledged in time.
+    """
+    if self._fragment_size is not None:
+      data = get_payload_bytes(payload)
+      if len(data) > self._fragment_size:
+        return await self._send_fragments(
+            destination,
+            split_payload(data, self._fragment_size, isinstance(payload, str))
+        )
+
+    await self._send_payload(destination, payload)
+
+  async def flush(self, destination=None):
+    """
+    Wait until every packet sent reliably has been acknowledged.
+
+    Args:
+      destination (str) : NKN address of the client whose packets to wait
+                          for. If None, waits for packets to every client.
+    Raises:
+      DeliveryError     : If packets were not acknowledged in time.
+    """
+    await self._sessions.flush(destination)
+
+  async def _send_payload(self, destination, payload):
+    if self._reliable:
+      if isinstance(payload, (bytearray, memoryview)):
+        # Held until acknowledged, so must not change meanwhile.
+        payload = bytes(payload)
+      await self._sessions.send(destination, payload)
+    else:
+      await self._send_frame(destination, payload)
+
+  async def _send_frame(self, destination, payload):
+    # Signs and sends one packet.
     pkt = NknSentPacket(destination, payload)
-    self._sign_packet(pkt)
+    pkt = await self._sign_packet(pkt)
+
+    await self._ws.send_packet(*pkt.to_wire())
+
+  async def _send_fragments(self, destination, fragments):
+    # Sends the fragments of a payload, a few at a time, each signed as a
+    # packet of its own.
+    window = asyncio.Semaphore(self._fragment_window)
+
+    async def send_fragment(fragment):
+      async with window:
+        await self._send_payload(destination, fragment)
+
+    await asyncio.gather(*[ send_fragment(f) for f in fragments ])
 
-    await self._ws.send_packet(pkt.destination, pkt.payload, pkt.signature)
+  async def _verify_packets(self, packets):
+    # Returns the packets which pass verification, with those which cannot
+    # be verified as they are unsigned if allowed, or all of them if
+    # verification is disabled.
+    if self._verifier is None:
+      return packets
+
+    passed = await self._verifier.verify([
+      (pkt.source, get_payload_bytes(pkt.payload), pkt.signature)
+      for pkt in packets
+    ])
+    return [
+      pkt for pkt, ok in zip(packets, passed)
+      if ok or (ok is None and self._allow_unsigned)
+    ]
+
+  async def _accept_packets(self, packets, acks_only=False):
+    # Returns the packets to deliver of those received, decoded, verified
+    # and with any fragments joined. If only acknowledgements are accepted,
+    # the other packets are dropped.
+    decoded = []
+    for src, payload, digest, signature in packets:
+      try:
+        payload = decode_payload(payload)
+      except ValueError:
+        logger.warning("Dropped a malformed packet from %s.", src)
+        continue
+      if acks_only and not (isinstance(payload, SessionFrame)
+                            and payload.payload is None):
+        continue
+      decoded.append(NknReceivedPacket(src, payload, digest, signature))
+
+    accepted = []
+    for pkt in await self._verify_packets(decoded):
+      for pkt in self._sessions.add(pkt):
+        pkt = self._reassembler.add(pkt)
+        if pkt is not None:
+          accepted.append(pkt)
+    return accepted
+
+  async def _receive_loop(self):
+    # Receives packets as they arrive, holding those to deliver until read.
+    while True:
+      packets = await self._ws.get_incoming_packets(256)
+      full = 0 < self._delivered_inbox_size <= self._delivered.qsize()
+      if full and not self._dropping:
+        logger.warning("Too many packets unread, dropping packets.")
+      self._dropping = full
+      try:
+        packets = await self._accept_packets(packets, acks_only=full)
+      except asyncio.CancelledError:
+        raise
+      except Exception:
+        logger.exception("Failed to receive packets.")
+        continue
+      for pkt in packets:
+        await self._delivered.put(pkt)
 
   async def recv(self):
-    src, payload, digest = await self._ws.get_incoming_packet()
-    pkt = NknReceivedPacket(src, payload, digest)
+    """
+    Receive the next packet sent to this client.
+
+    Returns:
+      NknPacket : The packet, whose payload is bytes if it was sent as
+                  binary, or str otherwise. Of a payload sent in fragments,
+                  the packet has no signature, and its payload is a
+                  PayloadStream if streaming fragments. The same holds of a
+                  packet sent over a reliable session.
+    """
+    if self._delivered is not None:
+      return await self._delivered.get()
+
+    while True:
+      packets = await self._accept_packets([
+        await self._ws.get_incoming_packet()
+      ])
+      if packets:
+        return packets[0]
+
+  async def recv_many(self, max_n=256, timeout=None):
+    """
+    Receive the packets sent to this client which are waiting, waiting
+    until there is at least one.
+
+    Args:
+      max_n (int)     : Maximum number of packets to receive.
+      timeout (float) : Maximum time to wait for a packet, in seconds. If
+                        None, waits indefinitely.
+    Returns:
+      list            : The packets, oldest first, as from 'recv'. Empty if
+                        none arrived in time, or if every packet failed
+                        verification or was a fragment of an incomplete
+                        payload.
+    """
+    if self._delivered is not None:
+      return await self._delivered.get_many(max_n, timeout=timeout)
+
+    packets = await self._ws.get_incoming_packets(max_n, timeout=timeout)
+    return await self._accept_packets(packets)
+
+  def __aiter__(self):
+    """
+    Iterate over received packets with 'async for', as from 'recv'. The
+    iteration never ends by itself.
+    """
+    return self
 
-    return pkt
\ No newline at end of file
+  async def __anext__(self):
+    return await self.recv()
\ No newline at end of file
@@ -0,0 +1,344 @@
+import asyncio
+from collections import OrderedDict
+import logging
+import os
+import time
+import weakref
+
+from nkn_client.cache import LruCache
+from nkn_client.client.packet import Fragment, NknReceivedPacket
+
+logger = logging.getLogger(__name__)
+
+
+class IncompleteMessageError(Exception):
+  """
+  Raised from the stream of a fragmented payload which was abandoned before
+  all of its fragments arrived.
+  """
+  pass
+
+
+def split_payload(data, size, text):
+  """
+  Splits a payload into fragments.
+
+  Args:
+    data (bytes)  : The payload, as bytes.
+    size (int)    : Largest number of bytes of the payload in a fragment.
+    text (bool)   : Whether the payload is text, to be decoded once joined.
+  Returns:
+    list          : The fragments, in order.
+  """
+  msg_id = os.urandom(8).hex()
+  view = memoryview(data)
+  count = max(-(-len(data) // size), 1)
+  return [
+    Fragment(msg_id, i, count, text, bytes(view[i * size:(i + 1) * size]))
+    for i in range(count)
+  ]
+
+
+class PayloadStream(object):
+  """
+  The data of a fragmented payload, delivered as its fragments arrive, in
+  order. Iterated with 'async for', yielding the bytes of each fragment, or
+  read whole.
+
+  Args:
+    text (bool)         : Whether the payload is text.
+    on_read (callable)  : Called with the size of each chunk read, if given.
+  """
+  # Marks the end of the payload in the queue of chunks.
+  _END = object()
+
+  def __init__(self, text, on_read=None):
+    self.text = text
+    self._on_read = on_read
+    self._chunks = asyncio.Queue()
+    self._done = False
+
+  def __aiter__(self):
+    return self
+
+  async def __anext__(self):
+    if self._done:
+      raise StopAsyncIteration
+    chunk = await self._chunks.get()
+    if chunk is PayloadStream._END:
+      self._done = True
+      raise StopAsyncIteration
+    if isinstance(chunk, Exception):
+      self._done = True
+      raise chunk
+    if self._on_read is not None:
+      self._on_read(len(chunk))
+    return chunk
+
+  async def read(self):
+    """
+    Waits for the rest of the payload, and returns it.
+
+    Returns:
+      str or bytes            : The payload, as bytes if it was sent as
+                                binary.
+    Raises:
+      IncompleteMessageError  : If the payload was abandoned before all of
+                                its fragments arrived.
+      UnicodeDecodeError      : If the payload was sent as text, but is not
+                                valid UTF-8.
+    """
+    data = b"".join([ chunk async for chunk in self ])
+    if self.text:
+      return data.decode("utf-8")
+    return data
+
+  def _put(self, chunk):
+    self._chunks.put_nowait(chunk)
+
+  def _finish(self):
+    self._chunks.put_nowait(PayloadStream._END)
+
+  def _fail(self, error):
+    # Drops the chunks not yet read, returning their total size.
+    dropped = 0
+    while not self._chunks.empty():
+      chunk = self._chunks.get_nowait()
+      if isinstance(chunk, bytes):
+        dropped += len(chunk)
+    self._chunks.put_nowait(error)
+    return dropped
+
+
+class _Assembly(object):
+  """
+  The fragments of a payload received so far.
+  """
+  __slots__ = ("count", "text", "chunks", "next", "size", "deadline",
+               "stream")
+
+  def __init__(self, count, text, stream):
+    self.count = count
+    self.text = text
+    # Data of each fragment held, by index.
+    self.chunks = {}
+    # Index of the next fragment to deliver to the stream.
+    self.next = 0
+    # Number of bytes held.
+    self.size = 0
+    # Time after which the payload is abandoned, from time.monotonic().
+    self.deadline = None
+    self.stream = stream
+
+
+class Reassembler(object):
+  """
+  Joins the fragments of payloads too large to send in one packet, as they
+  are received, in any order and interleaved with other packets.
+
+  The fragments held are bounded in total size. Beyond the bound, the
+  payloads least recently added to are abandoned. A payload is also
+  abandoned once no fragment of it arrives for the given timeout. Fragments
+  of the payloads most recently completed or abandoned are dropped, so that
+  a late duplicate does not start the payload over.
+
+  Args:
+    max_bytes (int)     : Largest total size of the fragments held, in
+                          bytes.
+    timeout (float)     : Time after which a payload is abandoned if no more
+                          of its fragments arrive, in seconds.
+    stream (bool)       : If True, a packet is delivered once the first
+                          fragment of its payload arrives, with a
+                          PayloadStream as its payload, to which the
+                          fragments are passed in order as they arrive.
+                          Fragments passed to the stream are counted as held
+                          until read from it, or until the stream is no
+                          longer referenced. If False, a packet is
+                          delivered once its payload is complete.
+    max_finished (int)  : Number of payloads completed or abandoned whose
+                          fragments are recognised and dropped.
+  """
+  def __init__(
+      self,
+      max_bytes=2 ** 26,
+      timeout=30.0,
+      stream=False,
+      max_finished=4096
+  ):
+    self._max_bytes = max_bytes
+    self._timeout = timeout
+    self._stream = stream
+
+    # Payloads being assembled, keyed by source and message identifier,
+    # least recently added to first.
+    self._assemblies = OrderedDict()
+
+    # Keys of the payloads most recently completed or abandoned.
+    self._finished = LruCache(maxsize=max_finished)
+
+    # Total size of the fragments held, including those passed to streams
+    # but not yet read, in bytes.
+    self._size = 0
+
+    # Abandons payloads whose fragments have stopped arriving.
+    self._timer = None
+
+    # Numbers of payloads completed, abandoned for lack of room, and
+    # abandoned for lack of fragments.
+    self.completed = 0
+    self.evicted = 0
+    self.expired = 0
+
+  def __len__(self):
+    return len(self._assemblies)
+
+  def add(self, packet):
+    """
+    Add a received packet.
+
+    Args:
+      packet (NknPacket)  : The packet, with its payload decoded.
+    Returns:
+      NknPacket           : The packet to deliver, if any. A packet which is
+                            not a fragment is returned as it is.
+    """
+    fragment = packet.payload
+    if not isinstance(fragment, Fragment):
+      return packet
+
+    key = (packet.source, fragment.msg_id)
+    assembly = self._assemblies.get(key)
+    delivered = None
+    if assembly is None:
+      if self._finished.get(key) is not None:
+        # A late duplicate of a payload already done with.
+        return None
+      stream = None
+      if self._stream:
+        stream = PayloadStream(fragment.text, on_read=self._on_read)
+        weakref.finalize(stream, self._on_dropped, stream._chunks)
+      assembly = self._assemblies[key] = _Assembly(
+          fragment.count,
+          fragment.text,
+          stream
+      )
+      if stream is not None:
+        delivered = NknReceivedPacket(packet.source, stream, packet.digest)
+    else:
+      self._assemblies.move_to_end(key)
+
+    if (fragment.count != assembly.count
+        or fragment.index < assembly.next
+        or fragment.index in assembly.chunks):
+      # A duplicate, or a fragment at odds with the others.
+      return delivered
+
+    assembly.chunks[fragment.index] = fragment.data
+    assembly.size += len(fragment.data)
+    self._size += len(fragment.data)
+    assembly.deadline = time.monotonic() + self._timeout
+
+    if assembly.stream is not None:
+      self._deliver(key, assembly)
+    elif len(assembly.chunks) == assembly.count:
+      payload = self._join(key, assembly)
+      if payload is not None:
+        delivered = NknReceivedPacket(packet.source, payload, packet.digest)
+
+    self._evict()
+    self._schedule_expiry()
+    return delivered
+
+  def close(self):
+    """
+    Abandons every payload being assembled.
+    """
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+    while self._assemblies:
+      self._abandon(next(iter(self._assemblies)), "Reassembly stopped.")
+
+  def _remove(self, key):
+    assembly = self._assemblies.pop(key)
+    self._size -= assembly.size
+    self._finished.put(key, True)
+    return assembly
+
+  def _on_read(self, size):
+    # Called as a chunk passed to a stream is read.
+    self._size -= size
+
+  def _on_dropped(self, chunks):
+    # Called once a stream is no longer referenced, with its queue of
+    # chunks, releasing those left unread.
+    while not chunks.empty():
+      chunk = chunks.get_nowait()
+      if isinstance(chunk, bytes):
+        self._size -= len(chunk)
+
+  def _join(self, key, assembly):
+    # Returns the complete payload, and forgets it, or None if the payload
+    # is malformed.
+    self._remove(key)
+    data = b"".join([ assembly.chunks[i] for i in range(assembly.count) ])
+    if assembly.text:
+      try:
+        data = data.decode("utf-8")
+      except UnicodeDecodeError:
+        logger.warning("Dropped a malformed payload from %s.", key[0])
+        return None
+    self.completed += 1
+    return data
+
+  def _deliver(self, key, assembly):
+    # Passes the fragments which are next in order to the stream.
+    while assembly.next in assembly.chunks:
+      chunk = assembly.chunks.pop(assembly.next)
+      # Still counted in the total, until read.
+      assembly.size -= len(chunk)
+      assembly.stream._put(chunk)
+      assembly.next += 1
+
+    if assembly.next == assembly.count:
+      self._remove(key)
+      self.completed += 1
+      assembly.stream._finish()
+
+  def _abandon(self, key, reason):
+    assembly = self._remove(key)
+    if assembly.stream is not None:
+      self._size -= assembly.stream._fail(IncompleteMessageError(reason))
+
+  def _evict(self):
+    if self._size > self._max_bytes and not self.evicted:
+      logger.warning("Too many fragments held, abandoning payloads.")
+    # Streams already complete may hold the rest, unread, in which case the
+    # payloads being assembled are abandoned as their fragments arrive.
+    while self._size > self._max_bytes and self._assemblies:
+      self._abandon(
+          next(iter(self._assemblies)),
+          "Abandoned for lack of room."
+      )
+      self.evicted += 1
+
+  def _schedule_expiry(self):
+    if self._timer is None and self._assemblies:
+      first = next(iter(self._assemblies.values()))
+      self._timer = asyncio.get_event_loop().call_later(
+          max(first.deadline - time.monotonic(), 0),
+          self._expire
+      )
+
+  def _expire(self):
+    # Abandons the payloads whose deadlines have passed. Payloads are
+    # ordered by when they were last added to, so also by deadline.
+    self._timer = None
+    now = time.monotonic()
+    while self._assemblies:
+      key, assembly = next(iter(self._assemblies.items()))
+      if assembly.deadline > now:
+        break
+      self._abandon(key, "Timed out awaiting fragments.")
+      self.expired += 1
+    self._schedule_expiry()
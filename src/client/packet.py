@@ -1,22 +1,363 @@
-from collections import namedtuple
+import base64
+from collections import OrderedDict
+
+# Marks a payload on the wire as base64 encoded binary. Text payloads are
+# sent as they are, unless they begin with the marker, in which case it is
+# doubled. The marker never occurs in base64, so the two cannot be confused.
+_BINARY_MARKER = "\x00"
+
+# Follows the binary marker on a fragment of a larger payload, which never
+# occurs in base64 either.
+_FRAGMENT_MARKER = "\x01"
+
+# Follows the binary marker on a frame of a reliable session.
+_SESSION_MARKER = "\x02"
+
+
+class NknPacket(object):
+  """
+  A packet sent or received by a client. Packets hold only their fields, so
+  that many may be queued cheaply. As the namedtuple they replace, they are
+  immutable, hashable, and may be unpacked, indexed, and copied with
+  '_replace'.
+
+  Args:
+    source (str)      : NKN address of the sending client.
+    destination (str) : NKN address of the receiving client.
+    payload (str or bytes)
+                      : The message.
+    digest (str)      : Digest of the packet, as pushed by the node.
+    signature (str)   : Signature of the payload by the sending client, as
+                        hex.
+  """
+  __slots__ = ("source", "destination", "payload", "digest", "signature")
+  _fields = __slots__
+
+  def __init__(
+      self,
+      source=None,
+      destination=None,
+      payload=None,
+      digest=None,
+      signature=None
+  ):
+    _set = object.__setattr__
+    _set(self, "source", source)
+    _set(self, "destination", destination)
+    _set(self, "payload", payload)
+    _set(self, "digest", digest)
+    _set(self, "signature", signature)
+
+  def __setattr__(self, name, value):
+    raise AttributeError("NknPacket is immutable!")
+
+  def __delattr__(self, name):
+    raise AttributeError("NknPacket is immutable!")
+
+  def __iter__(self):
+    return iter((
+        self.source,
+        self.destination,
+        self.payload,
+        self.digest,
+        self.signature
+    ))
+
+  def __len__(self):
+    return len(self._fields)
+
+  def __getitem__(self, index):
+    return tuple(self)[index]
+
+  def __eq__(self, other):
+    if not isinstance(other, NknPacket):
+      return NotImplemented
+    return tuple(self) == tuple(other)
+
+  def __hash__(self):
+    return hash(tuple(self))
+
+  def __repr__(self):
+    return "NknPacket(%s)" % ", ".join(
+      "%s=%r" % (field, getattr(self, field)) for field in self._fields
+    )
+
+  def _asdict(self):
+    """
+    Returns the fields of the packet, by name, in order.
+    """
+    return OrderedDict(zip(self._fields, self))
+
+  def _replace(self, **kwargs):
+    """
+    Returns a copy of the packet, with the given fields replaced.
+
+    Raises:
+      ValueError  : If any field is unknown.
+    """
+    fields = self._asdict()
+    unknown = set(kwargs) - set(fields)
+    if unknown:
+      raise ValueError("Got unexpected field names: %r" % sorted(unknown))
+    fields.update(kwargs)
+    return NknPacket(**fields)
+
+  def to_wire(self):
+    """
+    Returns the fields of the packet sent in a 'sendPacket' request.
+
+    Returns:
+      (str, str, str) : Destination, payload as from 'encode_payload', and
+                        signature.
+    """
+    return self.destination, encode_payload(self.payload), self.signature
+
+
+class Fragment(object):
+  """
+  One piece of a payload too large to send in a single packet. On the wire,
+  a fragment is the fragment marker, a header of its fields separated by
+  colons, and its data as base64.
+
+  Args:
+    msg_id (str)  : Identifier of the payload, unique for its sender.
+    index (int)   : Position of the fragment in the payload, from 0.
+    count (int)   : Number of fragments of the payload.
+    text (bool)   : Whether the payload is text, rather than binary.
+    data (bytes)  : The bytes of the payload in this fragment.
+  """
+  __slots__ = ("msg_id", "index", "count", "text", "data")
+
+  def __init__(self, msg_id, index, count, text, data):
+    self.msg_id = msg_id
+    self.index = index
+    self.count = count
+    self.text = text
+    self.data = data
+
+  def __eq__(self, other):
+    if not isinstance(other, Fragment):
+      return NotImplemented
+    return all(
+      getattr(self, field) == getattr(other, field)
+      for field in self.__slots__
+    )
+
+  def __hash__(self):
+    return hash(tuple( getattr(self, field) for field in self.__slots__ ))
+
+  def __repr__(self):
+    return "Fragment(%r, %d, %d, %r, <%d bytes>)" % (
+        self.msg_id, self.index, self.count, self.text, len(self.data))
+
+  def get_header(self):
+    """
+    Returns the fields of the fragment other than its data, as sent.
+    """
+    return "%s:%d:%d:%s:" % (
+        self.msg_id, self.index, self.count, "t" if self.text else "b")
+
+  @classmethod
+  def from_wire(cls, payload):
+    """
+    Parses a fragment from its wire form, following the markers.
+
+    Args:
+      payload (str) : The wire form, without the markers.
+    Returns:
+      Fragment      : The fragment.
+    Raises:
+      ValueError    : If the fragment is malformed.
+    """
+    try:
+      msg_id, index, count, kind, data = payload.split(":", 4)
+    except ValueError:
+      raise ValueError("Malformed fragment header!")
+    index, count = int(index), int(count)
+    if not 0 <= index < count or kind not in ("t", "b"):
+      raise ValueError("Malformed fragment header!")
+    return cls(msg_id, index, count, kind == "t", base64.b64decode(data))
+
+
+class SessionFrame(object):
+  """
+  A frame of a reliable session, either carrying a payload, or
+  acknowledging those received. On the wire, a frame is the session marker,
+  a header of its fields separated by colons, and its payload in its own
+  wire form.
+
+  Args:
+    session_id (str)  : Identifier of the session, unique for its sender.
+    seq (int)         : Sequence number of the payload. Of an
+                        acknowledgement, that of the payload whose receipt
+                        prompted it.
+    ack (int)         : Of a payload, the sequence number below which the
+                        sender has had every payload acknowledged. Of an
+                        acknowledgement, the sequence number below which
+                        every payload has been received.
+    sacks (tuple)     : Ranges of sequence numbers received beyond 'ack', as
+                        (start, end) pairs, end exclusive.
+    payload (str, bytes or Fragment)
+                      : The payload, or None if the frame is an
+                        acknowledgement.
+  """
+  __slots__ = ("session_id", "seq", "ack", "sacks", "payload")
+
+  def __init__(self, session_id, seq, ack, sacks=(), payload=None):
+    self.session_id = session_id
+    self.seq = seq
+    self.ack = ack
+    self.sacks = sacks
+    self.payload = payload
+
+  def __eq__(self, other):
+    if not isinstance(other, SessionFrame):
+      return NotImplemented
+    return all(
+      getattr(self, field) == getattr(other, field)
+      for field in self.__slots__
+    )
+
+  def __hash__(self):
+    return hash(tuple( getattr(self, field) for field in self.__slots__ ))
+
+  def __repr__(self):
+    return "SessionFrame(%s)" % ", ".join(
+      "%s=%r" % (field, getattr(self, field)) for field in self.__slots__
+    )
+
+  def get_header(self):
+    """
+    Returns the fields of the frame other than its payload, as sent.
+    """
+    return "%s:%s:%d:%d:%s:" % (
+        self.session_id,
+        "a" if self.payload is None else "d",
+        self.seq,
+        self.ack,
+        ",".join([ "%d-%d" % sack for sack in self.sacks ])
+    )
+
+  @classmethod
+  def from_wire(cls, payload):
+    """
+    Parses a frame from its wire form, following the markers.
+
+    Args:
+      payload (str) : The wire form, without the markers.
+    Returns:
+      SessionFrame  : The frame.
+    Raises:
+      ValueError    : If the frame is malformed.
+    """
+    try:
+      session_id, kind, seq, ack, sacks, data = payload.split(":", 5)
+      seq, ack = int(seq), int(ack)
+      sacks = tuple(
+        tuple(int(n) for n in sack.split("-")) for sack in sacks.split(",")
+      ) if sacks else ()
+    except ValueError:
+      raise ValueError("Malformed session frame header!")
+    if kind not in ("a", "d") or any( len(sack) != 2 for sack in sacks ):
+      raise ValueError("Malformed session frame header!")
+    if kind == "a":
+      return cls(session_id, seq, ack, sacks)
+    return cls(session_id, seq, ack, sacks, decode_payload(data))
 
-NknPacket = namedtuple(
-    "NknPacket",
-    ["source", "destination", "payload", "digest", "signature"],
-    defaults=[None, None, None, None, None]
-)
 
 def NknSentPacket(dest, payload):
   return NknPacket(destination=dest, payload=payload)
 
-def NknReceivedPacket(source, payload, digest):
-  return NknPacket(source=source, payload=payload, digest=digest)
+def NknReceivedPacket(source, payload, digest, signature=None):
+  return NknPacket(
+      source=source,
+      payload=payload,
+      digest=digest,
+      signature=signature
+  )
 
 def sign(packet, signature):
   return NknPacket(
-      source=packet.source,
-      destination=packet.destination,
-      payload=packet.payload,
-      digest=packet.digest,
-      signature=signature
-  )
\ No newline at end of file
+      packet.source,
+      packet.destination,
+      packet.payload,
+      packet.digest,
+      signature
+  )
+
+def get_payload_bytes(payload):
+  """
+  Returns the bytes of a payload, as signed.
+
+  Args:
+    payload (str, bytes, bytearray, memoryview, Fragment or SessionFrame)
+              : The payload. Text is encoded as UTF-8. Of a fragment or
+                session frame, its header and contents are signed.
+  Returns:
+    bytes     : The payload, as is where already bytes.
+  """
+  if isinstance(payload, bytes):
+    return payload
+  if isinstance(payload, str):
+    return payload.encode("utf-8")
+  if isinstance(payload, Fragment):
+    return payload.get_header().encode("utf-8") + payload.data
+  if isinstance(payload, SessionFrame):
+    header = payload.get_header().encode("utf-8")
+    if payload.payload is None:
+      return header
+    return header + get_payload_bytes(payload.payload)
+  return bytes(payload)
+
+def encode_payload(payload):
+  """
+  Returns the wire form of a payload. Text is sent as it is, and binary
+  payloads as base64.
+
+  Args:
+    payload (str, bytes, bytearray, memoryview, Fragment or SessionFrame)
+              : The payload.
+  Returns:
+    str       : The payload, as sent in a 'sendPacket' request.
+  """
+  if isinstance(payload, str):
+    if payload.startswith(_BINARY_MARKER):
+      return _BINARY_MARKER + payload
+    return payload
+  if isinstance(payload, Fragment):
+    return "".join((
+      _BINARY_MARKER,
+      _FRAGMENT_MARKER,
+      payload.get_header(),
+      base64.b64encode(payload.data).decode("ascii")
+    ))
+  if isinstance(payload, SessionFrame):
+    return "".join((
+      _BINARY_MARKER,
+      _SESSION_MARKER,
+      payload.get_header(),
+      "" if payload.payload is None else encode_payload(payload.payload)
+    ))
+  return _BINARY_MARKER + base64.b64encode(payload).decode("ascii")
+
+def decode_payload(payload):
+  """
+  Returns the payload of its wire form, as from 'encode_payload'.
+
+  Args:
+    payload (str) : The payload, as received in a 'receivePacket' push.
+  Returns:
+    str, bytes, Fragment or SessionFrame
+                  : The payload, as bytes if it was sent as binary.
+  Raises:
+    ValueError    : If the payload is malformed.
+  """
+  if not payload or not payload.startswith(_BINARY_MARKER):
+    return payload
+  if payload.startswith(_BINARY_MARKER, 1):
+    return payload[1:]
+  if payload.startswith(_FRAGMENT_MARKER, 1):
+    return Fragment.from_wire(payload[2:])
+  if payload.startswith(_SESSION_MARKER, 1):
+    return SessionFrame.from_wire(payload[2:])
+  return base64.b64decode(payload[1:])
@@ -0,0 +1,731 @@
+import asyncio
+from collections import deque, OrderedDict
+import logging
+import math
+import os
+import time
+
+from nkn_client.cache import LruCache
+from nkn_client.client.packet import NknReceivedPacket, SessionFrame
+from nkn_client.rtt import RttEstimator
+
+logger = logging.getLogger(__name__)
+
+# Longest time after which a payload is sent again, once backed off, in
+# seconds.
+_MAX_RTO = 60.0
+
+
+class DeliveryError(Exception):
+  """
+  Raised when payloads sent in a reliable session were not acknowledged in
+  time. The session is abandoned, and the next payload sent to the same
+  destination starts a new one.
+  """
+  pass
+
+
+class _Segment(object):
+  """
+  A payload sent in a session, awaiting acknowledgement.
+  """
+  __slots__ = ("payload", "first_sent", "sent_at", "sending", "backoff",
+               "retransmits", "sacked", "delivered", "delivered_at")
+
+  def __init__(self, payload):
+    self.payload = payload
+    # Times the payload was first and last sent, from time.monotonic().
+    self.first_sent = None
+    self.sent_at = None
+    # Whether the payload is being sent again.
+    self.sending = False
+    # Number of times the retransmission timeout of the payload has
+    # doubled, and of times the payload was sent again.
+    self.backoff = 0
+    self.retransmits = 0
+    # Whether the payload was acknowledged beyond the cumulative ack.
+    self.sacked = False
+    # Number of payloads acknowledged, and when the last was, as of sending
+    # the payload, from which the delivery rate is sampled.
+    self.delivered = 0
+    self.delivered_at = None
+
+
+class SendSession(object):
+  """
+  The sending side of a reliable session to another client.
+
+  Payloads are numbered in order, and kept until acknowledged. The receiving
+  client acknowledges every payload below a sequence number, along with
+  ranges received beyond it, so that only the payloads missing are sent
+  again: either once later payloads have been acknowledged past them, or
+  once the retransmission timeout passes without any acknowledgement.
+
+  Payloads are sent without waiting on each other, up to a window sized
+  from the delivery rate and round-trip time measured, at twice the
+  bandwidth-delay product of the path. Lost payloads do not shrink the
+  window, as losses on relay paths are not a sign of congestion.
+
+  Args:
+    destination (str)       : NKN address of the receiving client.
+    send_frame (function)   : Coroutine function sending a SessionFrame, with
+                              the destination.
+    rtt (RttEstimator)      : Estimator of the round-trip time. If not given,
+                              one is created.
+    min_window (int)        : Smallest number of payloads awaiting
+                              acknowledgement at once.
+    max_window (int)        : Largest number of payloads awaiting
+                              acknowledgement at once.
+    holding_secs (float)    : Time after which a payload still not
+                              acknowledged fails the session, in seconds.
+    dupthresh (int)         : Number of later payloads acknowledged after
+                              which a missing payload is sent again, once
+                              outstanding for longer than a round trip.
+  """
+  def __init__(
+      self,
+      destination,
+      send_frame,
+      rtt=None,
+      min_window=16,
+      max_window=1024,
+      holding_secs=3600,
+      dupthresh=3
+  ):
+    if min_window < 1 or max_window < 1:
+      raise ValueError("Window must be at least 1!")
+
+    self.destination = destination
+    self.session_id = os.urandom(8).hex()
+    self.rtt = rtt if rtt is not None else RttEstimator()
+
+    self._send_frame = send_frame
+    self._min_window = min(min_window, max_window)
+    self._max_window = max_window
+    self._holding_secs = holding_secs
+    self._dupthresh = dupthresh
+
+    # Payloads awaiting acknowledgement, by sequence number.
+    self._segments = {}
+
+    # Sequence number of the next payload, and the one below which every
+    # payload has been acknowledged.
+    self._next_seq = 0
+    self._acked = 0
+
+    # Number of payloads acknowledged beyond the cumulative ack.
+    self._sacked = 0
+
+    # Number of payloads acknowledged, and when the last was.
+    self._delivered = 0
+    self._delivered_at = None
+
+    # Recent delivery rates, as (time, payloads per second), each higher
+    # than any sampled after it, so that the first is the highest.
+    self._rates = deque()
+
+    # Largest number of payloads awaiting acknowledgement at once.
+    self.window = self._min_window
+
+    # Set while there is room in the window, and once every payload is
+    # acknowledged, respectively.
+    self._room = asyncio.Event()
+    self._room.set()
+    self._drained = asyncio.Event()
+    self._drained.set()
+
+    # Sends payloads again once their timeouts pass.
+    self._timer = None
+
+    # Retransmissions in progress.
+    self._tasks = set()
+
+    # Error which failed the session, if any.
+    self.error = None
+
+    # Numbers of payloads sent, and sent again.
+    self.sent = 0
+    self.retransmitted = 0
+
+  @property
+  def in_flight(self):
+    """
+    Number of payloads sent and not yet acknowledged. Payloads acknowledged
+    out of order no longer count, so that losses do not hold up others.
+    """
+    return len(self._segments) - self._sacked
+
+  def _has_room(self):
+    # The receiving client buffers no more than the largest window beyond
+    # the first payload missing.
+    return (self.in_flight < self.window
+            and self._next_seq - self._acked < self._max_window)
+
+  async def send(self, payload):
+    """
+    Send a payload, waiting first for room in the window.
+
+    Args:
+      payload (str, bytes or Fragment)  : The payload.
+    Raises:
+      DeliveryError                     : If the session failed.
+    """
+    while self.error is None and not self._has_room():
+      self._room.clear()
+      await self._room.wait()
+    if self.error is not None:
+      raise self.error
+
+    seq = self._next_seq
+    self._next_seq += 1
+    segment = self._segments[seq] = _Segment(payload)
+    self._drained.clear()
+    self.sent += 1
+
+    # Once numbered, the payload is the session's to deliver, and is sent
+    # again on timing out if it could not be sent now.
+    try:
+      await self._transmit(seq, segment)
+    except asyncio.CancelledError:
+      raise
+    except Exception as e:
+      logger.warning("Failed to send a payload, to be sent again: %s", e)
+    finally:
+      self._schedule_timeout()
+
+  async def flush(self):
+    """
+    Wait until every payload sent is acknowledged.
+
+    Raises:
+      DeliveryError : If the session failed.
+    """
+    await self._drained.wait()
+    if self.error is not None:
+      raise self.error
+
+  def on_ack(self, frame):
+    """
+    Handle an acknowledgement from the receiving client.
+
+    Args:
+      frame (SessionFrame)  : The acknowledgement.
+    """
+    if self.error is not None:
+      return
+
+    now = time.monotonic()
+
+    # The round-trip time is sampled from the payload whose receipt prompted
+    # the acknowledgement, unless sent more than once, when it would be
+    # ambiguous.
+    prompt = self._segments.get(frame.seq)
+    if prompt is not None and not prompt.retransmits and not prompt.sacked:
+      self.rtt.record(now - prompt.sent_at)
+
+    acked = []
+    while self._acked < min(frame.ack, self._next_seq):
+      segment = self._segments.pop(self._acked)
+      if segment.sacked:
+        self._sacked -= 1
+      else:
+        acked.append(segment)
+      self._acked += 1
+    highest = self._acked - 1
+
+    for start, end in frame.sacks:
+      for seq in range(max(start, self._acked), min(end, self._next_seq)):
+        segment = self._segments[seq]
+        if not segment.sacked:
+          segment.sacked = True
+          self._sacked += 1
+          acked.append(segment)
+      highest = max(highest, min(end, self._next_seq) - 1)
+
+    base = self._segments.get(self._acked)
+    if base is not None and base.sacked:
+      # The receiver would have delivered the payload, had it kept it, so
+      # it has dropped those received out of order, as when it forgot the
+      # session. Those it no longer acknowledges are sent again.
+      self._unsack(frame.sacks)
+
+    if acked:
+      self._on_delivered(acked, now)
+    self._retransmit_lost(highest, now)
+
+    if self._has_room():
+      self._room.set()
+    if not self._segments:
+      self._drained.set()
+
+  def close(self, error=None):
+    """
+    Stop sending, failing any payloads awaiting acknowledgement.
+
+    Args:
+      error (Exception) : Raised to those awaiting the session. If not
+                          given, a DeliveryError.
+    """
+    if self.error is None:
+      self.error = error or DeliveryError("Session closed.")
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+    for task in self._tasks:
+      task.cancel()
+    self._segments.clear()
+    self._sacked = 0
+    self._room.set()
+    self._drained.set()
+
+  def stats(self):
+    """
+    Returns the state of the session.
+
+    Returns:
+      dict  : The numbers of payloads sent, sent again and in flight, the
+              window, and the round-trip time estimates.
+    """
+    return {
+      "sent": self.sent,
+      "retransmitted": self.retransmitted,
+      "in_flight": self.in_flight,
+      "window": self.window,
+      "rtt": self.rtt.stats()
+    }
+
+  async def _transmit(self, seq, segment):
+    now = time.monotonic()
+    if segment.first_sent is None:
+      segment.first_sent = now
+    segment.sent_at = now
+    segment.delivered = self._delivered
+    segment.delivered_at = self._delivered_at or now
+
+    try:
+      await self._send_frame(
+          self.destination,
+          SessionFrame(
+              self.session_id,
+              seq,
+              self._acked,
+              payload=segment.payload
+          )
+      )
+    finally:
+      segment.sending = False
+
+  def _retransmit(self, seq, segment):
+    # Counted as sent from now, so that acknowledgements handled before the
+    # payload is actually sent do not send it yet again.
+    segment.sending = True
+    segment.sent_at = time.monotonic()
+    segment.retransmits += 1
+    self.retransmitted += 1
+    task = asyncio.ensure_future(self._transmit(seq, segment))
+    self._tasks.add(task)
+    task.add_done_callback(self._on_retransmitted)
+
+  def _on_retransmitted(self, task):
+    self._tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+      logger.warning("Failed to send a payload again: %s", task.exception())
+
+  def _on_delivered(self, segments, now):
+    # Samples the delivery rate from each payload.
+    for segment in segments:
+      self._delivered += 1
+      interval = now - segment.delivered_at
+      if interval > 0:
+        rate = (self._delivered - segment.delivered) / interval
+        while self._rates and self._rates[-1][1] <= rate:
+          self._rates.pop()
+        self._rates.append((now, rate))
+    self._delivered_at = now
+    self._resize_window(now)
+
+  def _resize_window(self, now):
+    # Sizes the window to twice the bandwidth-delay product, at the highest
+    # rate of the last few round trips.
+    if self.rtt.srtt is None:
+      return
+    horizon = now - max(10 * self.rtt.srtt, 1.0)
+    while self._rates and self._rates[0][0] < horizon:
+      self._rates.popleft()
+    if not self._rates:
+      return
+
+    rate = self._rates[0][1]
+    window = math.ceil(2 * rate * self.rtt.srtt)
+    self.window = min(max(window, self._min_window), self._max_window)
+
+  def _unsack(self, sacks):
+    # Clears the acknowledgements beyond the cumulative ack of the payloads
+    # outside the given ranges, so that they time out.
+    for seq, segment in self._segments.items():
+      if segment.sacked and not any(
+          start <= seq < end for start, end in sacks):
+        segment.sacked = False
+        self._sacked -= 1
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+    self._schedule_timeout()
+
+  def _retransmit_lost(self, highest, now):
+    # Sends again the payloads which enough later payloads have overtaken,
+    # once outstanding for longer than a round trip, plus a margin for
+    # payloads reordered on the way.
+    if self.rtt.srtt is None:
+      return
+    wait = self.rtt.srtt + max(2 * self.rtt.rttvar, self.rtt.min_rtt / 4)
+    for seq in range(self._acked, highest - self._dupthresh + 1):
+      segment = self._segments.get(seq)
+      if (segment is None
+          or segment.sacked
+          or segment.sending
+          or now - segment.sent_at < wait):
+        continue
+      self._retransmit(seq, segment)
+
+  def _get_rto(self, segment):
+    # Follows the current estimate, doubled for each timeout of the
+    # payload.
+    return min(self.rtt.rto * 2 ** segment.backoff, _MAX_RTO)
+
+  def _schedule_timeout(self):
+    if self._timer is not None:
+      return
+    deadlines = [ s.sent_at + self._get_rto(s)
+                  for s in self._segments.values() if not s.sacked ]
+    if deadlines:
+      self._timer = asyncio.get_event_loop().call_later(
+          max(min(deadlines) - time.monotonic(), 0),
+          self._on_timeout
+      )
+
+  def _on_timeout(self):
+    # Sends again the payloads whose timeouts have passed, backing off
+    # their timeouts, and fails the session once any is held too long.
+    self._timer = None
+    now = time.monotonic()
+    for seq, segment in list(self._segments.items()):
+      if (segment.sacked
+          or segment.sending
+          or now < segment.sent_at + self._get_rto(segment)):
+        continue
+      if now - segment.first_sent > self._holding_secs:
+        logger.warning("Session to %s failed.", self.destination)
+        self.close(DeliveryError(
+            "Payload not acknowledged within %s seconds!" % self._holding_secs
+        ))
+        return
+      segment.backoff += 1
+      self._retransmit(seq, segment)
+    self._schedule_timeout()
+
+
+class _ReceiveSession(object):
+  """
+  The receiving side of a reliable session from another client.
+  """
+  __slots__ = ("next", "latest", "buffered", "pending", "ack_handle")
+
+  def __init__(self):
+    # Sequence number of the next payload to deliver, and of the latest
+    # received.
+    self.next = 0
+    self.latest = 0
+    # Payloads received ahead of the next, by sequence number.
+    self.buffered = {}
+    # Number of payloads received since the last acknowledgement.
+    self.pending = 0
+    # Sends the next acknowledgement.
+    self.ack_handle = None
+
+  def get_sacks(self, max_ranges):
+    # Returns ranges of the sequence numbers buffered, lowest first.
+    sacks = []
+    for seq in sorted(self.buffered):
+      if sacks and sacks[-1][1] == seq:
+        sacks[-1][1] = seq + 1
+      elif len(sacks) < max_ranges:
+        sacks.append([seq, seq + 1])
+      else:
+        break
+    return tuple( tuple(sack) for sack in sacks )
+
+
+class SessionManager(object):
+  """
+  Sends payloads over reliable sessions, one to each destination, and
+  receives those sent over sessions by other clients, delivering them in
+  order and without duplicates.
+
+  Received payloads are acknowledged after a short delay, so that one
+  acknowledgement covers several payloads, or at once if a payload arrives
+  out of order, so that the sender learns of the loss promptly.
+
+  Args:
+    send_frame (function)   : Coroutine function sending a SessionFrame, with
+                              the destination.
+    min_window (int)        : See SendSession.
+    max_window (int)        : See SendSession. Also bounds how far beyond
+                              the next payload to deliver a payload received
+                              is accepted, so that one sending with a larger
+                              window sends in vain what lies beyond. Clients
+                              must therefore use the same, or the receiver
+                              the larger.
+    holding_secs (float)    : See SendSession.
+    initial_rto (float)     : Time after which a payload is sent again, in
+                              seconds, before the round-trip time is measured.
+    ack_delay (float)       : Longest time for which an acknowledgement is
+                              held back, in seconds.
+    max_sessions (int)      : Largest number of sessions received from at
+                              once. Beyond it, the state of the least
+                              recently active is forgotten, but for the
+                              sequence number of the next payload to
+                              deliver. Payloads received out of order are
+                              lost with it, and sent again.
+    max_forgotten (int)     : Largest number of sessions forgotten, whether
+                              for lack of room or on closing, whose next
+                              sequence numbers are kept, so that payloads
+                              sent again are not delivered twice. Beyond it,
+                              those of the least recently forgotten are
+                              lost, and a payload of such a session is taken
+                              to be new unless below the sender's cumulative
+                              ack.
+    max_sack_ranges (int)   : Largest number of ranges of payloads received
+                              out of order in an acknowledgement.
+  """
+  def __init__(
+      self,
+      send_frame,
+      min_window=16,
+      max_window=1024,
+      holding_secs=3600,
+      initial_rto=1.0,
+      ack_delay=0.01,
+      max_sessions=1024,
+      max_sack_ranges=16,
+      max_forgotten=65536
+  ):
+    self._send_frame = send_frame
+    self._min_window = min_window
+    self._max_window = max_window
+    self._holding_secs = holding_secs
+    self._initial_rto = initial_rto
+    self._ack_delay = ack_delay
+    self._max_sessions = max_sessions
+    self._max_sack_ranges = max_sack_ranges
+
+    # Sessions sent over, by destination and by session identifier.
+    self._sending = {}
+    self._by_id = {}
+
+    # Sessions received from, by source and session identifier, least
+    # recently active first.
+    self._receiving = OrderedDict()
+
+    # Sequence number of the next payload to deliver of each session
+    # forgotten, by source and session identifier.
+    self._forgotten = LruCache(maxsize=max_forgotten)
+
+    # Acknowledgements being sent.
+    self._tasks = set()
+
+    # Numbers of payloads delivered, and received more than once.
+    self.delivered = 0
+    self.duplicates = 0
+
+  def get_session(self, destination):
+    """
+    Returns the session sending to a client, or None if there is none.
+
+    Args:
+      destination (str) : NKN address of the client.
+    """
+    return self._sending.get(destination)
+
+  async def send(self, destination, payload):
+    """
+    Send a payload to a client over a reliable session, starting one if
+    there is none.
+
+    Args:
+      destination (str)                 : NKN address of the client.
+      payload (str, bytes or Fragment)  : The payload.
+    Raises:
+      DeliveryError                     : If the session failed, before or
+                                          while the payload was sent.
+    """
+    session = self._sending.get(destination)
+    if session is not None and session.error is not None:
+      self._forget(session)
+      raise session.error
+    if session is None:
+      session = self._sending[destination] = SendSession(
+          destination,
+          self._send_frame,
+          rtt=RttEstimator(initial_rto=self._initial_rto),
+          min_window=self._min_window,
+          max_window=self._max_window,
+          holding_secs=self._holding_secs
+      )
+      self._by_id[session.session_id] = session
+    await session.send(payload)
+
+  async def flush(self, destination=None):
+    """
+    Wait until every payload sent is acknowledged.
+
+    Args:
+      destination (str) : NKN address of the client whose session to wait
+                          for. If None, waits for every session.
+    Raises:
+      DeliveryError     : If a session failed.
+    """
+    if destination is not None:
+      sessions = [ self._sending.get(destination) ]
+    else:
+      sessions = list(self._sending.values())
+
+    for session in sessions:
+      if session is None:
+        continue
+      try:
+        await session.flush()
+      except DeliveryError:
+        self._forget(session)
+        raise
+
+  def add(self, packet):
+    """
+    Add a received packet.
+
+    Args:
+      packet (NknPacket)  : The packet, with its payload decoded.
+    Returns:
+      list                : The packets to deliver, in order. A packet which
+                            is not of a session is returned as it is.
+    """
+    frame = packet.payload
+    if not isinstance(frame, SessionFrame):
+      return [ packet ]
+
+    if frame.payload is None:
+      session = self._by_id.get(frame.session_id)
+      if session is not None:
+        session.on_ack(frame)
+      return []
+
+    key = (packet.source, frame.session_id)
+    state = self._receiving.get(key)
+    if state is None:
+      state = self._receiving[key] = _ReceiveSession()
+      state.next = self._forgotten.get(key) or 0
+      if len(self._receiving) > self._max_sessions:
+        self._forget_receiving(*self._receiving.popitem(last=False))
+    else:
+      self._receiving.move_to_end(key)
+
+    # Every payload below the sender's cumulative ack was delivered, even if
+    # this state was since forgotten along with its next sequence number.
+    if frame.ack > state.next:
+      for seq in [ s for s in state.buffered if s < frame.ack ]:
+        del state.buffered[seq]
+      state.next = frame.ack
+
+    state.latest = frame.seq
+    delivered = []
+    if (frame.seq < state.next
+        or frame.seq in state.buffered
+        or frame.seq >= state.next + self._max_window):
+      # A duplicate, or beyond any window the sender may use.
+      self.duplicates += 1
+      self._schedule_ack(key, state, 0)
+      return delivered
+
+    state.buffered[frame.seq] = (frame.payload, packet.digest)
+    while state.next in state.buffered:
+      payload, digest = state.buffered.pop(state.next)
+      delivered.append(NknReceivedPacket(packet.source, payload, digest))
+      state.next += 1
+    self.delivered += len(delivered)
+
+    state.pending += 1
+    if state.buffered or state.pending >= 2:
+      self._schedule_ack(key, state, 0)
+    else:
+      self._schedule_ack(key, state, self._ack_delay)
+    return delivered
+
+  def close(self):
+    """
+    Stops every session, failing any payloads awaiting acknowledgement.
+    Sessions received from are forgotten, as for lack of room.
+    """
+    for session in self._sending.values():
+      session.close()
+    self._sending.clear()
+    self._by_id.clear()
+    while self._receiving:
+      self._forget_receiving(*self._receiving.popitem(last=False))
+    for task in self._tasks:
+      task.cancel()
+
+  def stats(self):
+    """
+    Returns the state of the sessions.
+
+    Returns:
+      dict  : The numbers of payloads delivered and received more than
+              once, and of sessions receiving, and the state of each session
+              sending, by destination.
+    """
+    return {
+      "delivered": self.delivered,
+      "duplicates": self.duplicates,
+      "receiving": len(self._receiving),
+      "sending": {
+        dest: session.stats() for dest, session in self._sending.items()
+      }
+    }
+
+  def _forget(self, session):
+    if self._sending.get(session.destination) is session:
+      del self._sending[session.destination]
+    self._by_id.pop(session.session_id, None)
+
+  def _forget_receiving(self, key, state):
+    if state.ack_handle is not None:
+      state.ack_handle.cancel()
+    self._forgotten.put(key, state.next)
+
+  def _schedule_ack(self, key, state, delay):
+    loop = asyncio.get_event_loop()
+    handle = state.ack_handle
+    if handle is not None:
+      if handle.when() <= loop.time() + delay:
+        return
+      handle.cancel()
+    state.ack_handle = loop.call_later(delay, self._send_ack, key, state)
+
+  def _send_ack(self, key, state):
+    state.ack_handle = None
+    state.pending = 0
+    source, session_id = key
+    frame = SessionFrame(
+        session_id,
+        state.latest,
+        state.next,
+        state.get_sacks(self._max_sack_ranges)
+    )
+    task = asyncio.ensure_future(self._send_frame(source, frame))
+    self._tasks.add(task)
+    task.add_done_callback(self._on_ack_sent)
+
+  def _on_ack_sent(self, task):
+    self._tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+      logger.warning("Failed to send an acknowledgement: %s", task.exception())
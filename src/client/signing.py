@@ -0,0 +1,282 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import logging
+
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+from nkn_client.cache import LruCache
+
+logger = logging.getLogger(__name__)
+
+
+def _sign_all(key, payloads):
+  # Signs each payload, returning the signatures as hex. Run on a worker
+  # thread, where libsodium releases the GIL while signing.
+  return [ key.sign(data).signature.hex() for data in payloads ]
+
+def _verify_all(checks):
+  # Verifies each (key, data, signature) triple, returning whether each is
+  # valid. Run on a worker thread, as for '_sign_all'.
+  results = []
+  for key, data, signature in checks:
+    try:
+      key.verify(data, signature)
+      results.append(True)
+    except (BadSignatureError, ValueError):
+      results.append(False)
+  return results
+
+def _on_signed(batch, signing):
+  # Passes the signatures of a batch, or the error in signing it, to the
+  # callers awaiting them.
+  error = signing.exception() if not signing.cancelled() else None
+  for i, (_, future) in enumerate(batch):
+    if future.done():
+      continue
+    if signing.cancelled():
+      future.cancel()
+    elif error is not None:
+      future.set_exception(error)
+    else:
+      future.set_result(signing.result()[i])
+
+
+class PacketSigner(object):
+  """
+  Signs packet payloads with an Ed25519 key, either on the event loop or on
+  a pool of threads.
+
+  With threads, payloads submitted while the event loop is busy are queued,
+  and signed together once it next gets round to them, in batches spread
+  over the threads, so that each thread handoff is shared by many payloads.
+
+  Args:
+    key (nacl.signing.SigningKey) : The key to sign with.
+    workers (int)                 : Number of threads signing payloads. If
+                                    0, each payload is signed on the event
+                                    loop as it is submitted.
+    batch_size (int)              : Maximum number of payloads signed by a
+                                    thread at once.
+  """
+  def __init__(self, key, workers=0, batch_size=64):
+    if workers < 0:
+      raise ValueError("Number of workers must not be negative!")
+    if batch_size < 1:
+      raise ValueError("Batch size must be at least 1!")
+
+    self._key = key
+    self._workers = workers
+    self._batch_size = batch_size
+
+    # Threads signing payloads, started once first needed, and again after
+    # being closed.
+    self._executor = None
+
+    # Payloads awaiting the next batch, each with the future awaiting its
+    # signature.
+    self._queued = []
+
+    # Numbers of payloads signed, and of batches handed to threads.
+    self.signed = 0
+    self.batches = 0
+
+  async def sign(self, data):
+    """
+    Sign a payload.
+
+    Args:
+      data (bytes)  : The payload.
+    Returns:
+      str           : The signature, as hex.
+    Raises:
+      TypeError     : If the payload is not bytes.
+    """
+    # Checked here, so that one bad payload does not fail a whole batch.
+    if not isinstance(data, bytes):
+      raise TypeError("Payload must be bytes, not %s!" % type(data).__name__)
+
+    self.signed += 1
+    if self._workers == 0:
+      return _sign_all(self._key, [ data ])[0]
+
+    loop = asyncio.get_event_loop()
+    future = loop.create_future()
+    if not self._queued:
+      loop.call_soon(self._flush)
+    self._queued.append((data, future))
+    return await future
+
+  def close(self):
+    """
+    Stops the threads once they finish signing any payloads already handed
+    to them. Payloads signed afterwards start new threads.
+    """
+    if self._executor is not None:
+      self._executor.shutdown(wait=False)
+      self._executor = None
+
+  def _flush(self):
+    # Hands the queued payloads to the threads, in batches no larger than
+    # needed to keep every thread busy.
+    queued, self._queued = self._queued, []
+    size = min(self._batch_size, -(-len(queued) // self._workers))
+    if self._executor is None:
+      self._executor = ThreadPoolExecutor(max_workers=self._workers)
+
+    loop = asyncio.get_event_loop()
+    for i in range(0, len(queued), size):
+      batch = queued[i:i + size]
+      try:
+        signing = loop.run_in_executor(
+            self._executor,
+            _sign_all,
+            self._key,
+            [ data for data, _ in batch ]
+        )
+      except Exception as e:
+        # Called from the event loop, so the callers awaiting the payloads
+        # would otherwise never hear of the error.
+        for _, future in queued[i:]:
+          if not future.done():
+            future.set_exception(e)
+        return
+      signing.add_done_callback(functools.partial(_on_signed, batch))
+      self.batches += 1
+
+
+class PacketVerifier(object):
+  """
+  Verifies the signatures of received packets, against the public key in
+  the address of the source client, as "identifier.pubkey". The key of each
+  source address is parsed once, and kept in a cache of the most recently
+  seen sources.
+
+  Nodes need not forward the signatures of the packets they push, and those
+  which do not push every packet unsigned. Unsigned packets can be neither
+  passed nor failed, so they are counted apart, for the caller to decide
+  what to do with them.
+
+  Args:
+    cache_size (int)  : Maximum number of source keys cached.
+    workers (int)     : Number of threads verifying signatures. If 0,
+                        signatures are verified on the event loop.
+  """
+  def __init__(self, cache_size=1024, workers=0):
+    if workers < 0:
+      raise ValueError("Number of workers must not be negative!")
+
+    self._workers = workers
+
+    # Verify key of each recent source address.
+    self._keys = LruCache(maxsize=cache_size)
+
+    # Threads verifying signatures, started once first needed, and again
+    # after being closed.
+    self._executor = None
+
+    # Numbers of packets which passed and failed verification, and which
+    # were unsigned.
+    self.verified = 0
+    self.failed = 0
+    self.unsigned = 0
+
+  def _get_key(self, source):
+    # Returns the verify key of the source address, or None if the address
+    # holds no valid public key.
+    key = self._keys.get(source)
+    if key is None:
+      try:
+        key = VerifyKey(bytes.fromhex(source.rpartition(".")[2]))
+      except (AttributeError, TypeError, ValueError):
+        return None
+      self._keys.put(source, key)
+    return key
+
+  async def verify(self, packets):
+    """
+    Verify the signatures of several packets at once. Packets from addresses
+    without a valid public key fail.
+
+    Args:
+      packets (list)  : Source address, payload bytes and signature as hex
+                        of each packet.
+    Returns:
+      list            : Whether each packet passed, or None for each packet
+                        which was unsigned.
+    """
+    results = [ False ] * len(packets)
+
+    # Packets which fail before checking the signature are left out.
+    checks, indices = [], []
+    for i, (source, data, signature) in enumerate(packets):
+      if signature is None:
+        results[i] = None
+        continue
+      key = self._get_key(source)
+      if key is None:
+        continue
+      try:
+        signature = bytes.fromhex(signature)
+      except (TypeError, ValueError):
+        continue
+      checks.append((key, data, signature))
+      indices.append(i)
+
+    if self._workers == 0:
+      passed = _verify_all(checks)
+    else:
+      if self._executor is None:
+        self._executor = ThreadPoolExecutor(max_workers=self._workers)
+      # Split into a batch for each thread.
+      size = max(-(-len(checks) // self._workers), 1)
+      loop = asyncio.get_event_loop()
+      batches = await asyncio.gather(
+          *[ loop.run_in_executor(
+                 self._executor,
+                 _verify_all,
+                 checks[i:i + size]
+             )
+             for i in range(0, len(checks), size) ]
+      )
+      passed = [ result for batch in batches for result in batch ]
+
+    for i, result in zip(indices, passed):
+      results[i] = result
+
+    failed = results.count(False)
+    unsigned = results.count(None)
+    if failed and not self.failed:
+      logger.warning("Received packets which failed verification.")
+    if unsigned and not self.unsigned:
+      logger.warning(
+          "Received unsigned packets, as the node does not forward "
+          "signatures."
+      )
+    self.failed += failed
+    self.unsigned += unsigned
+    self.verified += len(results) - failed - unsigned
+    return results
+
+  def stats(self):
+    """
+    Returns the numbers of packets which passed and failed verification,
+    and which were unsigned.
+
+    Returns:
+      dict  : The counts, under 'verified', 'failed' and 'unsigned'.
+    """
+    return {
+      "verified": self.verified,
+      "failed": self.failed,
+      "unsigned": self.unsigned
+    }
+
+  def close(self):
+    """
+    See PacketSigner.close()
+    """
+    if self._executor is not None:
+      self._executor.shutdown(wait=False)
+      self._executor = None
@@ -0,0 +1,127 @@
+import json
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+try:
+  import ujson
+except ImportError:
+  ujson = None
+
+
+class JsonCodec(object):
+  """
+  Encodes and decodes JSON messages, using the implementation of the standard
+  library. Subclasses use faster implementations where one is installed.
+  """
+  name = "json"
+
+  def dumps(self, obj):
+    """
+    Encode an object as a JSON string.
+
+    Args:
+      obj (object)  : The object to encode.
+    Returns:
+      str           : The encoded object.
+    """
+    return json.dumps(obj)
+
+  def dumpb(self, obj):
+    """
+    Encode an object as UTF-8 encoded JSON.
+
+    Args:
+      obj (object)  : The object to encode.
+    Returns:
+      bytes         : The encoded object.
+    """
+    return self.dumps(obj).encode("utf-8")
+
+  def loads(self, data):
+    """
+    Decode a JSON message.
+
+    Args:
+      data (str)  : The message, as a string or as UTF-8 encoded bytes.
+    Returns:
+      object      : The decoded object.
+    Raises:
+      ValueError  : If the message is not valid JSON.
+    """
+    return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+  """
+  Encodes and decodes JSON messages using orjson.
+  """
+  name = "orjson"
+
+  def dumps(self, obj):
+    return orjson.dumps(obj).decode("utf-8")
+
+  def dumpb(self, obj):
+    return orjson.dumps(obj)
+
+  def loads(self, data):
+    return orjson.loads(data)
+
+
+class UjsonCodec(JsonCodec):
+  """
+  Encodes and decodes JSON messages using ujson.
+  """
+  name = "ujson"
+
+  def dumps(self, obj):
+    return ujson.dumps(obj, ensure_ascii=False)
+
+  def loads(self, data):
+    return ujson.loads(data)
+
+
+# Codecs by name, along with whether each is installed.
+_CODECS = {
+  "orjson": (OrjsonCodec, orjson is not None),
+  "ujson": (UjsonCodec, ujson is not None),
+  "json": (JsonCodec, True)
+}
+
+# Order in which codecs are preferred when chosen automatically.
+_PREFERRED = ("orjson", "ujson", "json")
+
+def get_codec(name="auto"):
+  """
+  Get a JSON codec by name.
+
+  Args:
+    name (str)  : One of 'orjson', 'ujson' or 'json'. If 'auto', the fastest
+                  installed implementation is used, falling back to the
+                  standard library. If None, the default codec is used. A
+                  codec may also be given in place of a name.
+  Returns:
+    JsonCodec   : The codec.
+  Raises:
+    ValueError  : If the named codec is unknown or not installed.
+  """
+  if name is None:
+    return DEFAULT_CODEC
+  if isinstance(name, JsonCodec):
+    return name
+
+  if name == "auto":
+    name = next( n for n in _PREFERRED if _CODECS[n][1] )
+
+  try:
+    cls, installed = _CODECS[name]
+  except KeyError:
+    raise ValueError("Unknown JSON codec '%s'!" % name)
+  if not installed:
+    raise ValueError("JSON codec '%s' is not installed!" % name)
+  return cls()
+
+# Codec used where none is specified.
+DEFAULT_CODEC = get_codec()
@@ -1,26 +1,142 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import itertools
 import json
 
-from nkn_client.jsonrpc.rpc import call_rpc
+from nkn_client.codec import get_codec
+from nkn_client.metrics import get_registry
+from nkn_client.jsonrpc.rpc import call_rpc, call_rpc_batch, create_session
+
+def _get_result(response):
+  # Returns the result from a JSON-RPC response, raising if it holds an error.
+  if "error" in response:
+    raise RuntimeError(
+        "JSON-RPC server reported error!\n%s" % (json.dumps(response["error"]))
+    )
+  return response["result"]
+
+def _get_batch_results(responses, raise_errors):
+  # Returns the results from a list of JSON-RPC responses. Errors are raised,
+  # or otherwise returned in place of the result.
+  results = []
+  for response in responses:
+    try:
+      results.append(_get_result(response))
+    except RuntimeError as err:
+      if raise_errors:
+        raise
+      results.append(err)
+  return results
 
 class NknJsonRpcApi(object):
   """
   A client for the NKN JSON-RPC API. Communicates over plaintext HTTP to submit
   RPC requests according to the JSON-RPC 2.0 specification.
 
+  Requests are issued on a pooled session, so that consecutive calls reuse
+  keep-alive connections to the server rather than opening a new connection
+  for every call.
+
   Args:
-    hostname (str) : The hostname on which the API is served.
+    hostname (str)          : The hostname on which the API is served.
+    pool_maxsize (int)      : Maximum number of connections kept open to the
+                              server.
+    max_retries (int)       : Number of times a failed request is retried.
+    backoff_factor (float)  : Factor for the exponential delay between
+                              retries, in seconds.
+    cache (ChainCache)      : Cache for blocks and transactions. If not given,
+                              every call is sent to the server.
+    codec (str)             : Name of the JSON codec to use, as for
+                              nkn_client.codec.get_codec.
+    metrics (MetricsRegistry)
+                            : Registry in which calls are recorded. If not
+                              given, the default registry is used.
   """
-  def __init__(self, hostname):
+  def __init__(
+      self,
+      hostname,
+      pool_maxsize=10,
+      max_retries=0,
+      backoff_factor=0,
+      cache=None,
+      codec=None,
+      metrics=None
+  ):
     self._url = "http://%s/" % hostname
+    self._cache = cache
+    self._codec = get_codec(codec)
+    self._metrics = get_registry(metrics)
+
+    # Pooled HTTP session, shared by all calls made through this client.
+    self._session = create_session(
+        pool_maxsize=pool_maxsize,
+        max_retries=max_retries,
+        backoff_factor=backoff_factor
+    )
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def close(self):
+    """
+    Closes all pooled connections held by this client.
+    """
+    self._session.close()
+
+  def _call_rpc(self, method, params=None):
+    result = call_rpc(
+        self._url,
+        method,
+        params=params,
+        session=self._session,
+        codec=self._codec,
+        metrics=self._metrics
+    )
+    return _get_result(result)
+
+  def _call_rpc_cached(self, method, params, lookup, store):
+    # Calls the RPC unless its result is found with the 'lookup' function,
+    # and then caches the result with the 'store' function.
+    if self._cache is not None:
+      result = lookup(self._cache)
+      if result is not None:
+        return result
 
-  def _call_rpc(self, *args, **kwargs):
-    result = call_rpc(self._url, *args, **kwargs)
+    result = self._call_rpc(method, params=params)
+    if self._cache is not None and result is not None:
+      store(self._cache, result)
+    return result
 
-    if "error" in result:
-      raise RuntimeError(
-          "JSON-RPC server reported error!\n%s" % (json.dumps(error))
+  def _call_rpc_batch(self, calls, max_size, raise_errors):
+    responses = []
+    for i in range(0, len(calls), max_size):
+      responses.extend(
+          call_rpc_batch(
+              self._url,
+              calls[i:i + max_size],
+              session=self._session,
+              codec=self._codec,
+              metrics=self._metrics
+          )
       )
-    return result["result"]
+    return _get_batch_results(responses, raise_errors)
+
+  def batch(self, max_size=100):
+    """
+    Start a batch of calls, to be sent to the server together as JSON-RPC 2.0
+    batch requests rather than one request per call.
+
+    Args:
+      max_size (int)  : Maximum number of calls sent in a single request.
+                        Larger batches are split over several requests.
+    Returns:
+      NknJsonRpcBatch : The batch, which exposes the same API methods as this
+                        client for queueing calls.
+    """
+    return NknJsonRpcBatch(self, max_size=max_size)
 
   def get_latest_block_height(self):
     """
@@ -66,7 +182,12 @@ class NknJsonRpcApi(object):
     if hash is not None:
       params["hash"] = hash
 
-    return self._call_rpc("getblock", params=params)
+    return self._call_rpc_cached(
+        "getblock",
+        params,
+        lambda cache: cache.get_block(height=height, hash=hash),
+        lambda cache, block: cache.put_block(block, height=height, hash=hash)
+    )
 
   def get_block_transactions_by_height(self, height):
     """
@@ -82,6 +203,47 @@ class NknJsonRpcApi(object):
     """
     return self._call_rpc("getblocktxsbyheight", params={"height": height})
 
+  def _get_block_fetcher(self, transactions_only):
+    # Returns the function used to fetch a block at a given height.
+    if transactions_only:
+      return self.get_block_transactions_by_height
+    return lambda height: self.get_block(height=height)
+
+  def iter_blocks(self, start, end, concurrency=8, transactions_only=False):
+    """
+    Iterate over a range of blocks in the chain, in order of height. Up to
+    'concurrency' blocks are fetched in parallel ahead of the block being
+    yielded, so at most that many blocks are held in memory at once.
+
+    Args:
+      start (int)               : Height of the first block to retrieve.
+      end (int)                 : Height at which to stop, exclusive.
+      concurrency (int)         : Maximum number of blocks fetched at once.
+                                  Should not exceed the connection pool size.
+      transactions_only (bool)  : If set, yields only the transaction hashes
+                                  of each block, as from
+                                  'get_block_transactions_by_height'.
+    Yields:
+      dict                      : The contents of each block.
+    """
+    fetch = self._get_block_fetcher(transactions_only)
+    heights = iter(range(start, end))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+      pending = deque(
+          executor.submit(fetch, height)
+          for height in itertools.islice(heights, concurrency)
+      )
+      try:
+        while pending:
+          block = pending.popleft().result()
+          for height in itertools.islice(heights, 1):
+            pending.append(executor.submit(fetch, height))
+          yield block
+      finally:
+        for future in pending:
+          future.cancel()
+
   def get_connection_count(self):
     """
     Returns the number of connections to this node.
@@ -104,7 +266,12 @@ class NknJsonRpcApi(object):
       dict        : Contents of the transaction, or None if no such transaction
                     exists.
     """
-    return self._call_rpc("gettransaction", params={"hash": hash})
+    return self._call_rpc_cached(
+        "gettransaction",
+        {"hash": hash},
+        lambda cache: cache.get_transaction(hash),
+        lambda cache, transaction: cache.put_transaction(transaction, hash)
+    )
 
   def get_websocket_address(self, client_addr):
     """
@@ -143,3 +310,96 @@ class NknJsonRpcApi(object):
     Returns the chord information of this server.
     """
     return self._call_rpc("getchordringinfo")
+
+
+class NknJsonRpcBatch(NknJsonRpcApi):
+  """
+  A batch of calls to the NKN JSON-RPC API. Calling any of the API methods on
+  the batch queues the call and returns its index, rather than its result. The
+  queued calls are sent together by 'execute', which returns the results in
+  the order the calls were queued. Methods which cannot be queued, such as
+  'iter_blocks', raise instead.
+
+  The batch may also be used as a context manager, in which case it is
+  executed on exit and the results are made available as 'results'.
+
+      with api.batch() as batch:
+        for height in range(100):
+          batch.get_block(height=height)
+      blocks = batch.results
+
+  Args:
+    api (NknJsonRpcApi) : The client to send the calls through.
+    max_size (int)      : Maximum number of calls sent in a single request.
+  """
+  def __init__(self, api, max_size=100):
+    # NknJsonRpcApi.__init__ is not called, as the batch holds no session of
+    # its own. Every inherited method which would use one is overridden, to
+    # queue its call or to raise.
+    self._api = api
+    self._max_size = max_size
+
+    # Queued calls, as tuples of method name and parameters.
+    self._calls = []
+
+    # Results of the last execution, if any.
+    self.results = None
+
+  def __len__(self):
+    return len(self._calls)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, *exc_info):
+    if exc_type is None:
+      self.execute()
+
+  def close(self):
+    """
+    Discards all queued calls.
+    """
+    self._calls = []
+
+  def _call_rpc(self, method, params=None):
+    self._calls.append( (method, params) )
+    return len(self._calls) - 1
+
+  def _call_rpc_cached(self, method, params, lookup, store):
+    return self._call_rpc(method, params=params)
+
+  def batch(self, max_size=100):
+    raise RuntimeError("Cannot start a batch within a batch!")
+
+  def _call_rpc_batch(self, calls, max_size, raise_errors):
+    raise RuntimeError("Cannot send a batch within a batch!")
+
+  def iter_blocks(self, start, end, concurrency=8, transactions_only=False):
+    raise RuntimeError("Cannot iterate over blocks within a batch!")
+
+  def execute(self, raise_errors=True):
+    """
+    Send all queued calls to the server, and clear the queue.
+
+    Args:
+      raise_errors (bool) : If set, an error reported for any call is raised.
+                            Otherwise, the error is returned in place of the
+                            result for that call.
+    Returns:
+      list                : Results of the calls, in the order they were
+                            queued.
+    Raises:
+      RuntimeError        : If the server reported an error, or did not
+                            respond to every call.
+    """
+    calls, self._calls = self._calls, []
+    if not calls:
+      self.results = []
+      return self.results
+
+    self.results = self._api._call_rpc_batch(
+        calls,
+        self._max_size,
+        raise_errors
+    )
+    return self.results
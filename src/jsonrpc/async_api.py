@@ -0,0 +1,210 @@
+import asyncio
+from collections import deque
+import itertools
+
+from nkn_client.codec import get_codec
+from nkn_client.metrics import get_registry
+from nkn_client.jsonrpc.api import (
+  NknJsonRpcApi,
+  NknJsonRpcBatch,
+  _get_batch_results,
+  _get_result
+)
+from nkn_client.jsonrpc.async_rpc import (
+  call_rpc,
+  call_rpc_batch,
+  create_session
+)
+
+class AsyncNknJsonRpcApi(NknJsonRpcApi):
+  """
+  An asynchronous client for the NKN JSON-RPC API. Exposes the same methods
+  as NknJsonRpcApi, each of which must be awaited, and issues its requests
+  without blocking the event loop.
+
+  Requests are issued on a pooled session, which is opened on the first call
+  and must be closed with 'close' once the client is no longer needed.
+
+  Args:
+    hostname (str)            : The hostname on which the API is served.
+    pool_maxsize (int)        : Maximum number of connections kept open to the
+                                server.
+    max_retries (int)         : Number of times a failed request is retried.
+    backoff_factor (float)    : Factor for the exponential delay between
+                                retries, in seconds.
+    keepalive_timeout (float) : Time for which an idle connection is kept
+                                open, in seconds.
+    cache (ChainCache)        : Cache for blocks and transactions. If not
+                                given, every call is sent to the server.
+    codec (str)               : Name of the JSON codec to use, as for
+                                nkn_client.codec.get_codec.
+    metrics (MetricsRegistry) : Registry in which calls are recorded. If not
+                                given, the default registry is used.
+  """
+  def __init__(
+      self,
+      hostname,
+      pool_maxsize=10,
+      max_retries=0,
+      backoff_factor=0,
+      keepalive_timeout=15,
+      cache=None,
+      codec=None,
+      metrics=None
+  ):
+    self._url = "http://%s/" % hostname
+    self._cache = cache
+    self._codec = get_codec(codec)
+    self._metrics = get_registry(metrics)
+
+    self._pool_maxsize = pool_maxsize
+    self._max_retries = max_retries
+    self._backoff_factor = backoff_factor
+    self._keepalive_timeout = keepalive_timeout
+
+    # Pooled HTTP session, opened lazily since it must be created from within
+    # the event loop.
+    self._session = None
+
+  def __enter__(self):
+    raise TypeError("Use 'async with' for AsyncNknJsonRpcApi.")
+
+  def __exit__(self, *exc_info):
+    pass
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc_info):
+    await self.close()
+
+  async def close(self):
+    """
+    Closes all pooled connections held by this client.
+    """
+    if self._session is not None:
+      await self._session.close()
+      self._session = None
+
+  def _get_session(self):
+    if self._session is None:
+      self._session = create_session(
+          pool_maxsize=self._pool_maxsize,
+          keepalive_timeout=self._keepalive_timeout
+      )
+    return self._session
+
+  async def _call_rpc(self, method, params=None):
+    result = await call_rpc(
+        self._url,
+        method,
+        params=params,
+        session=self._get_session(),
+        max_retries=self._max_retries,
+        backoff_factor=self._backoff_factor,
+        codec=self._codec,
+        metrics=self._metrics
+    )
+    return _get_result(result)
+
+  async def _call_rpc_cached(self, method, params, lookup, store):
+    if self._cache is not None:
+      result = lookup(self._cache)
+      if result is not None:
+        return result
+
+    result = await self._call_rpc(method, params=params)
+    if self._cache is not None and result is not None:
+      store(self._cache, result)
+    return result
+
+  async def _call_rpc_batch(self, calls, max_size, raise_errors):
+    responses = []
+    for i in range(0, len(calls), max_size):
+      responses.extend(
+          await call_rpc_batch(
+              self._url,
+              calls[i:i + max_size],
+              session=self._get_session(),
+              max_retries=self._max_retries,
+              backoff_factor=self._backoff_factor,
+              codec=self._codec,
+              metrics=self._metrics
+          )
+      )
+    return _get_batch_results(responses, raise_errors)
+
+  async def iter_blocks(
+      self,
+      start,
+      end,
+      concurrency=8,
+      transactions_only=False
+  ):
+    """
+    See NknJsonRpcApi.iter_blocks()
+
+    Iterated with 'async for'.
+    """
+    fetch = self._get_block_fetcher(transactions_only)
+    heights = iter(range(start, end))
+
+    pending = deque(
+        asyncio.ensure_future(fetch(height))
+        for height in itertools.islice(heights, concurrency)
+    )
+    try:
+      while pending:
+        block = await pending.popleft()
+        for height in itertools.islice(heights, 1):
+          pending.append(asyncio.ensure_future(fetch(height)))
+        yield block
+    finally:
+      for task in pending:
+        task.cancel()
+
+  def batch(self, max_size=100):
+    """
+    See NknJsonRpcApi.batch()
+
+    Returns:
+      AsyncNknJsonRpcBatch  : The batch, whose 'execute' method must be
+                              awaited.
+    """
+    return AsyncNknJsonRpcBatch(self, max_size=max_size)
+
+
+class AsyncNknJsonRpcBatch(NknJsonRpcBatch):
+  """
+  A batch of calls to the asynchronous NKN JSON-RPC API. Calls are queued as
+  for NknJsonRpcBatch, while 'execute' must be awaited, and the batch is used
+  with 'async with' rather than 'with'.
+  """
+  def __enter__(self):
+    raise TypeError("Use 'async with' for AsyncNknJsonRpcBatch.")
+
+  def __exit__(self, *exc_info):
+    pass
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, exc_type, *exc_info):
+    if exc_type is None:
+      await self.execute()
+
+  async def execute(self, raise_errors=True):
+    """
+    See NknJsonRpcBatch.execute()
+    """
+    calls, self._calls = self._calls, []
+    if not calls:
+      self.results = []
+      return self.results
+
+    self.results = await self._api._call_rpc_batch(
+        calls,
+        self._max_size,
+        raise_errors
+    )
+    return self.results
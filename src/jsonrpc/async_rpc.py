@@ -0,0 +1,179 @@
+import aiohttp
+import asyncio
+import time
+
+from nkn_client.codec import DEFAULT_CODEC
+from nkn_client.jsonrpc.rpc import (
+  _build_batch_payload,
+  _build_payload,
+  _check_response,
+  _generate_id,
+  _get_outcome,
+  _match_batch
+)
+from nkn_client.metrics import ERROR, TIMEOUT, get_registry
+
+# Response statuses on which a request is retried.
+_RETRY_STATUSES = (502, 503, 504)
+
+def create_session(pool_maxsize=10, keepalive_timeout=15):
+  """
+  Create an asynchronous HTTP session for issuing JSON-RPC calls. Connections
+  made by the session are kept alive and pooled, so that consecutive calls to
+  the same server reuse the same TCP connection. Must be called from within a
+  running event loop.
+
+  Args:
+    pool_maxsize (int)        : Maximum number of connections to keep open to
+                                a single host.
+    keepalive_timeout (float) : Time for which an idle connection is kept
+                                open, in seconds.
+  Returns:
+    aiohttp.ClientSession     : The configured session.
+  """
+  connector = aiohttp.TCPConnector(
+      limit=0,
+      limit_per_host=pool_maxsize,
+      keepalive_timeout=keepalive_timeout
+  )
+  return aiohttp.ClientSession(connector=connector)
+
+# Headers sent with every request.
+_HEADERS = {"Content-Type": "application/json"}
+
+async def _post(url, payload, session, max_retries, backoff_factor, codec,
+                metrics, method):
+  # Posts the payload, and returns the decoded JSON response. The call,
+  # including any retries, is recorded under the given method name.
+  if codec is None:
+    codec = DEFAULT_CODEC
+  metrics = get_registry(metrics)
+
+  data = codec.dumpb(payload)
+  body = b""
+  outcome = ERROR
+  start = time.perf_counter()
+  try:
+    body = await _post_with_retries(
+        url,
+        data,
+        session,
+        max_retries,
+        backoff_factor
+    )
+    result = codec.loads(body)
+    outcome = _get_outcome(result)
+    return result
+  except asyncio.TimeoutError:
+    outcome = TIMEOUT
+    raise
+  finally:
+    metrics.record(
+        "http",
+        method,
+        time.perf_counter() - start,
+        outcome=outcome,
+        sent=len(data),
+        received=len(body)
+    )
+
+async def _post_with_retries(url, data, session, max_retries, backoff_factor):
+  # Posts the encoded payload, retrying on connection failures and on
+  # transient server errors, and returns the body of the response.
+  attempt = 0
+  while True:
+    try:
+      async with session.post(url, data=data, headers=_HEADERS) as resp:
+        if resp.status in _RETRY_STATUSES and attempt < max_retries:
+          raise aiohttp.ClientResponseError(
+              resp.request_info,
+              resp.history,
+              status=resp.status
+          )
+        if resp.status >= 400:
+          raise RuntimeError(
+              "Error calling RPC!\n%s : %s" % (resp.status, await resp.text())
+          )
+        return await resp.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+      if attempt >= max_retries:
+        raise
+
+    await asyncio.sleep(backoff_factor * (2 ** attempt))
+    attempt += 1
+
+async def _with_session(session, coro_fn):
+  # Runs the coroutine function with the given session, or with a session
+  # opened for this request alone if none is given.
+  if session is not None:
+    return await coro_fn(session)
+  async with aiohttp.ClientSession() as session:
+    return await coro_fn(session)
+
+async def call_rpc(
+    url,
+    method,
+    params=None,
+    req_id=None,
+    session=None,
+    max_retries=0,
+    backoff_factor=0,
+    codec=None,
+    metrics=None
+):
+  """
+  Asynchronously call a JSON-RPC at the given URL.
+
+  See nkn_client.jsonrpc.rpc.call_rpc for args.
+
+  Args:
+    session (aiohttp.ClientSession)
+                            : Session to issue the request on. If none is
+                              provided, a new connection is opened for this
+                              request alone.
+    max_retries (int)       : Number of times a failed request is retried.
+    backoff_factor (float)  : Factor for the exponential delay between
+                              retries, in seconds.
+    codec (JsonCodec)       : Codec used to encode the request and decode the
+                              response. If none is provided, the default is
+                              used.
+    metrics (MetricsRegistry)
+                            : Registry in which the call is recorded. If none
+                              is provided, the default is used.
+  """
+  if req_id is None:
+    req_id = _generate_id()
+
+  payload = _build_payload(method, params, req_id)
+
+  result = await _with_session(
+      session,
+      lambda s: _post(url, payload, s, max_retries, backoff_factor, codec,
+                      metrics, method)
+  )
+  return _check_response(result, req_id)
+
+async def call_rpc_batch(
+    url,
+    calls,
+    session=None,
+    max_retries=0,
+    backoff_factor=0,
+    codec=None,
+    metrics=None
+):
+  """
+  Asynchronously call several JSON-RPCs at the given URL within a single HTTP
+  request, as a JSON-RPC 2.0 batch.
+
+  See nkn_client.jsonrpc.rpc.call_rpc_batch and call_rpc in this module for
+  args.
+  """
+  req_ids, payload = _build_batch_payload(calls)
+
+  results = await _with_session(
+      session,
+      lambda s: _post(url, payload, s, max_retries, backoff_factor, codec,
+                      metrics, "batch")
+  )
+  return _match_batch(results, req_ids)
@@ -0,0 +1,144 @@
+import asyncio
+from collections import namedtuple
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+MempoolEvent = namedtuple("MempoolEvent", ["kind", "hash", "transaction"])
+
+# Kinds of mempool events.
+ADDED = "added"
+REMOVED = "removed"
+
+
+class MempoolWatcher(object):
+  """
+  Watches the transaction mempool of a node, reporting only the changes
+  between polls rather than the whole mempool. Iterated with 'async for',
+  yielding a MempoolEvent whenever a transaction arrives in or leaves the
+  mempool. Polls which fail are logged, and retried after the poll interval.
+
+  The poll interval adapts to activity: it is halved after each poll which
+  found changes, and grows after each poll which found none.
+
+  The hashes of transactions which left the mempool are remembered for a
+  while, so that a transaction which briefly drops out of a node's view is
+  not reported as new again when it reappears.
+
+  Args:
+    api (AsyncNknJsonRpcApi)  : The client to poll through.
+    min_interval (float)      : Shortest time between polls, in seconds.
+    max_interval (float)      : Longest time between polls, in seconds.
+    expiry (float)            : Time for which the hash of a removed
+                                transaction is remembered, in seconds.
+    fetch_transactions (bool) : If set, each new transaction is fetched in
+                                full when the mempool only lists its hash.
+    concurrency (int)         : Maximum number of transactions fetched at once.
+  """
+  def __init__(
+      self,
+      api,
+      min_interval=0.5,
+      max_interval=10.0,
+      expiry=600.0,
+      fetch_transactions=False,
+      concurrency=8
+  ):
+    self._api = api
+    self._min_interval = min_interval
+    self._max_interval = max_interval
+    self._expiry = expiry
+    self._fetch_transactions = fetch_transactions
+    self._concurrency = concurrency
+
+    # Current time between polls, in seconds.
+    self.interval = min_interval
+
+    # Hashes of the transactions in the mempool as of the last poll.
+    self._present = set()
+
+    # Hashes of transactions which left the mempool, mapped to the time at
+    # which they are forgotten.
+    self._removed = {}
+
+  def __aiter__(self):
+    return self._watch()
+
+  async def _watch(self):
+    while True:
+      try:
+        events = await self.poll()
+      except asyncio.CancelledError:
+        raise
+      except Exception:
+        logger.exception("Failed to poll the mempool.")
+        self.interval = min(self.interval * 1.5, self._max_interval)
+        events = []
+      for event in events:
+        yield event
+      await asyncio.sleep(self.interval)
+
+  def _expire(self, now):
+    expired = [ h for h, until in self._removed.items() if until <= now ]
+    for h in expired:
+      del self._removed[h]
+
+  async def _fetch(self, hashes):
+    # Fetches the transactions with the given hashes, at most 'concurrency'
+    # at a time.
+    sem = asyncio.Semaphore(self._concurrency)
+    async def fetch(h):
+      async with sem:
+        return await self._api.get_transaction(h)
+    return await asyncio.gather(*[ fetch(h) for h in hashes ])
+
+  async def poll(self):
+    """
+    Poll the mempool once, and adjust the poll interval.
+
+    Returns:
+      list  : A MempoolEvent for each transaction which arrived in or left
+              the mempool since the last poll. If the poll fails, nothing is
+              recorded, so that its changes are reported by the next.
+    """
+    entries = await self._api.get_raw_mempool() or []
+
+    # The mempool may list transactions either in full or by hash alone.
+    current = {}
+    for entry in entries:
+      if isinstance(entry, dict):
+        current[entry["hash"]] = entry
+      else:
+        current[entry] = None
+
+    now = time.monotonic()
+    self._expire(now)
+
+    added = [
+      h for h in current if h not in self._present and h not in self._removed
+    ]
+    removed = [ h for h in self._present if h not in current ]
+
+    # Fetched before recording the poll, so that a failed fetch leaves the
+    # new transactions to be reported again.
+    if self._fetch_transactions:
+      missing = [ h for h in added if current[h] is None ]
+      for h, tx in zip(missing, await self._fetch(missing)):
+        current[h] = tx
+
+    for h in current:
+      self._removed.pop(h, None)
+    for h in removed:
+      self._removed[h] = now + self._expiry
+    self._present = set(current)
+
+    events = [ MempoolEvent(ADDED, h, current[h]) for h in added ]
+    events.extend( MempoolEvent(REMOVED, h, None) for h in removed )
+
+    if events:
+      self.interval = max(self.interval / 2, self._min_interval)
+    else:
+      self.interval = min(self.interval * 1.5, self._max_interval)
+
+    return events
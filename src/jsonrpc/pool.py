@@ -0,0 +1,473 @@
+import asyncio
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import math
+import time
+
+import aiohttp
+import requests
+
+from nkn_client.codec import get_codec
+from nkn_client.metrics import get_registry
+from nkn_client.jsonrpc.api import (
+  NknJsonRpcApi,
+  _get_batch_results,
+  _get_result
+)
+from nkn_client.jsonrpc.async_api import AsyncNknJsonRpcApi
+from nkn_client.jsonrpc import async_rpc
+from nkn_client.jsonrpc import rpc
+
+# Methods for which duplicate requests are sent when hedging is enabled.
+HEDGED_METHODS = ("getwsaddr", "getlatestblockheight")
+
+# Errors which indicate that an endpoint failed to serve a request.
+_SYNC_ERRORS = (RuntimeError, ValueError, requests.RequestException)
+_ASYNC_ERRORS = (RuntimeError, ValueError, aiohttp.ClientError,
+                 asyncio.TimeoutError)
+
+
+class Endpoint(object):
+  """
+  A JSON-RPC server within a pool, along with the statistics used to rank it
+  against the other servers in the pool.
+
+  Args:
+    hostname (str)      : The hostname on which the API is served.
+    alpha (float)       : Weight of each new sample in the moving averages.
+    window (int)        : Number of latency samples kept for percentiles.
+  """
+  def __init__(self, hostname, alpha=0.2, window=64):
+    self.hostname = hostname
+    self.url = "http://%s/" % hostname
+
+    self._alpha = alpha
+
+    # Exponentially weighted moving averages of latency, in seconds, and of
+    # the fraction of calls which failed.
+    self.latency = None
+    self.error_rate = 0.0
+
+    # Time before which the endpoint is not used, following a failure.
+    self.down_until = 0.0
+
+    # Recent latency samples.
+    self._samples = deque(maxlen=window)
+
+  def record_success(self, latency):
+    """
+    Record a call which the endpoint served.
+
+    Args:
+      latency (float) : Duration of the call, in seconds.
+    """
+    if self.latency is None:
+      self.latency = latency
+    else:
+      self.latency += self._alpha * (latency - self.latency)
+    self.error_rate -= self._alpha * self.error_rate
+    self._samples.append(latency)
+
+  def record_failure(self, cooldown):
+    """
+    Record a call which the endpoint failed to serve.
+
+    Args:
+      cooldown (float)  : Time for which the endpoint is not used, in seconds.
+    """
+    self.error_rate += self._alpha * (1.0 - self.error_rate)
+    self.down_until = time.monotonic() + cooldown
+
+  def score(self, error_penalty):
+    """
+    Returns the cost of routing a call to this endpoint; lower is better.
+    Endpoints without any latency samples score best, so that each endpoint
+    is measured.
+
+    Args:
+      error_penalty (float) : Factor by which the error rate inflates the
+                              latency.
+    """
+    if self.latency is None:
+      return 0.0
+    return self.latency * (1.0 + error_penalty * self.error_rate)
+
+  def percentile(self, p):
+    """
+    Returns the given percentile of recent latencies, in seconds, or None if
+    there are no samples.
+
+    Args:
+      p (float) : The percentile, from 0 to 100.
+    """
+    if not self._samples:
+      return None
+    samples = sorted(self._samples)
+    index = max(int(math.ceil(p / 100.0 * len(samples))) - 1, 0)
+    return samples[index]
+
+  def stats(self):
+    """
+    Returns the statistics of this endpoint, as a dict.
+    """
+    return {
+      "hostname": self.hostname,
+      "latency": self.latency,
+      "error_rate": self.error_rate,
+      "down": self.down_until > time.monotonic()
+    }
+
+
+class _EndpointPool(object):
+  # Endpoint selection shared by the synchronous and asynchronous pools.
+  def _init_pool(
+      self,
+      hostnames,
+      hedge,
+      hedge_percentile,
+      hedge_delay,
+      error_penalty,
+      cooldown
+  ):
+    if not hostnames:
+      raise ValueError("Must supply at least one hostname!")
+
+    self._endpoints = [ Endpoint(hostname) for hostname in hostnames ]
+    self._hedge = hedge
+    self._hedge_percentile = hedge_percentile
+    self._hedge_delay = hedge_delay
+    self._error_penalty = error_penalty
+    self._cooldown = cooldown
+
+    # Calls are not routed through a single URL.
+    self._url = None
+
+  def _ranked(self):
+    # Returns endpoints from best to worst. Endpoints which recently failed
+    # are ranked last, but still tried if all others fail.
+    now = time.monotonic()
+    return sorted(
+        self._endpoints,
+        key=lambda ep: (ep.down_until > now, ep.score(self._error_penalty))
+    )
+
+  def _should_hedge(self, method, endpoints):
+    return self._hedge and method in HEDGED_METHODS and len(endpoints) > 1
+
+  def _get_hedge_delay(self, endpoint):
+    # Returns the time to wait on an endpoint before sending a duplicate.
+    delay = endpoint.percentile(self._hedge_percentile)
+    if delay is None:
+      return self._hedge_delay
+    return delay
+
+  def endpoint_stats(self):
+    """
+    Returns the statistics of each endpoint in the pool.
+
+    Returns:
+      list  : A dict of statistics for each endpoint, as from Endpoint.stats.
+    """
+    return [ ep.stats() for ep in self._endpoints ]
+
+
+class NknJsonRpcPool(_EndpointPool, NknJsonRpcApi):
+  """
+  A client for the NKN JSON-RPC API which spreads calls over a pool of
+  servers. Each call is routed to the server with the lowest moving average
+  latency, weighted by its moving average error rate, and fails over to the
+  next best server if it cannot be served.
+
+  Optionally, latency-critical calls are hedged: if the best server has not
+  responded within the given percentile of its recent latencies, a duplicate
+  request is sent to the next best server, and the first response is used.
+
+  See NknJsonRpcApi for remaining args.
+
+  Args:
+    hostnames (list)          : The hostnames of the servers in the pool.
+    hedge (bool)              : Whether to hedge latency-critical calls.
+    hedge_percentile (float)  : Percentile of latency after which a hedged
+                                request is sent.
+    hedge_delay (float)       : Delay before sending a hedged request to a
+                                server without latency samples, in seconds.
+    error_penalty (float)     : Factor by which a server's error rate inflates
+                                its latency when ranking servers.
+    cooldown (float)          : Time for which a server is ranked last after a
+                                failure, in seconds.
+  """
+  def __init__(
+      self,
+      hostnames,
+      pool_maxsize=10,
+      max_retries=0,
+      backoff_factor=0,
+      cache=None,
+      codec=None,
+      metrics=None,
+      hedge=False,
+      hedge_percentile=95,
+      hedge_delay=0.5,
+      error_penalty=10.0,
+      cooldown=5.0
+  ):
+    self._init_pool(
+        hostnames,
+        hedge,
+        hedge_percentile,
+        hedge_delay,
+        error_penalty,
+        cooldown
+    )
+    self._cache = cache
+    self._codec = get_codec(codec)
+    self._metrics = get_registry(metrics)
+
+    # Pooled HTTP session, holding a connection pool for each server.
+    self._session = rpc.create_session(
+        pool_connections=len(hostnames),
+        pool_maxsize=pool_maxsize,
+        max_retries=max_retries,
+        backoff_factor=backoff_factor
+    )
+
+    # Runs requests for hedged calls.
+    self._executor = None
+
+  def close(self):
+    """
+    See NknJsonRpcApi.close()
+    """
+    NknJsonRpcApi.close(self)
+    if self._executor is not None:
+      self._executor.shutdown(wait=False)
+      self._executor = None
+
+  def _call_endpoint(self, endpoint, fn):
+    # Calls the function with the endpoint URL, recording the outcome.
+    start = time.monotonic()
+    try:
+      result = fn(endpoint.url)
+    except _SYNC_ERRORS:
+      endpoint.record_failure(self._cooldown)
+      raise
+    endpoint.record_success(time.monotonic() - start)
+    return result
+
+  def _call_failover(self, endpoints, fn):
+    # Calls the function on each endpoint in turn, until one succeeds.
+    error = None
+    for endpoint in endpoints:
+      try:
+        return self._call_endpoint(endpoint, fn)
+      except _SYNC_ERRORS as err:
+        error = err
+    raise error
+
+  def _call_hedged(self, endpoints, fn):
+    # Calls the function on the best endpoint, and once more on the next best
+    # if the first has not responded in time. Endpoints which fail are
+    # replaced by the next in line. The first success is returned.
+    if self._executor is None:
+      self._executor = ThreadPoolExecutor(max_workers=len(self._endpoints))
+
+    remaining = deque(endpoints)
+    delay = self._get_hedge_delay(remaining[0])
+    pending = {
+      self._executor.submit(self._call_endpoint, remaining.popleft(), fn)
+    }
+    hedged = False
+    error = None
+    while pending:
+      done, pending = wait(
+          pending,
+          timeout=(None if hedged else delay),
+          return_when=FIRST_COMPLETED
+      )
+      if not done:
+        hedged = True
+      for future in done:
+        if future.exception() is None:
+          return future.result()
+        error = future.exception()
+      if remaining and (not done or not pending):
+        pending.add(
+            self._executor.submit(self._call_endpoint, remaining.popleft(), fn)
+        )
+    raise error
+
+  def _route(self, method, fn):
+    endpoints = self._ranked()
+    if self._should_hedge(method, endpoints):
+      return self._call_hedged(endpoints, fn)
+    return self._call_failover(endpoints, fn)
+
+  def _call_rpc(self, method, params=None):
+    result = self._route(
+        method,
+        lambda url: rpc.call_rpc(
+            url,
+            method,
+            params=params,
+            session=self._session,
+            codec=self._codec,
+            metrics=self._metrics
+        )
+    )
+    return _get_result(result)
+
+  def _call_rpc_batch(self, calls, max_size, raise_errors):
+    def call(url):
+      responses = []
+      for i in range(0, len(calls), max_size):
+        responses.extend(
+            rpc.call_rpc_batch(
+                url,
+                calls[i:i + max_size],
+                session=self._session,
+                codec=self._codec,
+                metrics=self._metrics
+            )
+        )
+      return responses
+
+    responses = self._route(None, call)
+    return _get_batch_results(responses, raise_errors)
+
+
+class AsyncNknJsonRpcPool(_EndpointPool, AsyncNknJsonRpcApi):
+  """
+  An asynchronous client for the NKN JSON-RPC API which spreads calls over a
+  pool of servers.
+
+  See NknJsonRpcPool and AsyncNknJsonRpcApi for args.
+  """
+  def __init__(
+      self,
+      hostnames,
+      pool_maxsize=10,
+      max_retries=0,
+      backoff_factor=0,
+      keepalive_timeout=15,
+      cache=None,
+      codec=None,
+      metrics=None,
+      hedge=False,
+      hedge_percentile=95,
+      hedge_delay=0.5,
+      error_penalty=10.0,
+      cooldown=5.0
+  ):
+    AsyncNknJsonRpcApi.__init__(
+        self,
+        None,
+        pool_maxsize=pool_maxsize,
+        max_retries=max_retries,
+        backoff_factor=backoff_factor,
+        keepalive_timeout=keepalive_timeout,
+        cache=cache,
+        codec=codec,
+        metrics=metrics
+    )
+    self._init_pool(
+        hostnames,
+        hedge,
+        hedge_percentile,
+        hedge_delay,
+        error_penalty,
+        cooldown
+    )
+
+  async def _call_endpoint(self, endpoint, fn):
+    start = time.monotonic()
+    try:
+      result = await fn(endpoint.url)
+    except _ASYNC_ERRORS:
+      endpoint.record_failure(self._cooldown)
+      raise
+    endpoint.record_success(time.monotonic() - start)
+    return result
+
+  async def _call_failover(self, endpoints, fn):
+    error = None
+    for endpoint in endpoints:
+      try:
+        return await self._call_endpoint(endpoint, fn)
+      except _ASYNC_ERRORS as err:
+        error = err
+    raise error
+
+  async def _call_hedged(self, endpoints, fn):
+    remaining = deque(endpoints)
+    delay = self._get_hedge_delay(remaining[0])
+    pending = {
+      asyncio.ensure_future(self._call_endpoint(remaining.popleft(), fn))
+    }
+    hedged = False
+    error = None
+    try:
+      while pending:
+        done, pending = await asyncio.wait(
+            pending,
+            timeout=(None if hedged else delay),
+            return_when=asyncio.FIRST_COMPLETED
+        )
+        if not done:
+          hedged = True
+        for task in done:
+          if task.exception() is None:
+            return task.result()
+          error = task.exception()
+        if remaining and (not done or not pending):
+          pending.add(
+              asyncio.ensure_future(
+                  self._call_endpoint(remaining.popleft(), fn)
+              )
+          )
+    finally:
+      # Abandon any duplicate requests still in flight.
+      for task in pending:
+        task.cancel()
+    raise error
+
+  async def _route(self, method, fn):
+    endpoints = self._ranked()
+    if self._should_hedge(method, endpoints):
+      return await self._call_hedged(endpoints, fn)
+    return await self._call_failover(endpoints, fn)
+
+  async def _call_rpc(self, method, params=None):
+    result = await self._route(
+        method,
+        lambda url: async_rpc.call_rpc(
+            url,
+            method,
+            params=params,
+            session=self._get_session(),
+            max_retries=self._max_retries,
+            backoff_factor=self._backoff_factor,
+            codec=self._codec,
+            metrics=self._metrics
+        )
+    )
+    return _get_result(result)
+
+  async def _call_rpc_batch(self, calls, max_size, raise_errors):
+    async def call(url):
+      responses = []
+      for i in range(0, len(calls), max_size):
+        responses.extend(
+            await async_rpc.call_rpc_batch(
+                url,
+                calls[i:i + max_size],
+                session=self._get_session(),
+                max_retries=self._max_retries,
+                backoff_factor=self._backoff_factor,
+                codec=self._codec,
+                metrics=self._metrics
+            )
+        )
+      return responses
+
+    responses = await self._route(None, call)
+    return _get_batch_results(responses, raise_errors)
@@ -1,11 +1,163 @@
 import requests
+from requests.adapters import HTTPAdapter
+import time
+from urllib3.util.retry import Retry
 import uuid
 
+from nkn_client.codec import DEFAULT_CODEC
+from nkn_client.metrics import ERROR, OK, TIMEOUT, get_registry
+
+# Headers sent with every request.
+_HEADERS = {"Content-Type": "application/json"}
+
 def _generate_id():
   # Returns a randomly generated ID.
   return str(uuid.uuid4())
 
-def call_rpc(url, method, params=None, req_id=None):
+def _create_retry(max_retries, backoff_factor):
+  # Builds the retry policy for a session. JSON-RPC requests are all sent as
+  # POST, which urllib3 does not retry by default, so the method filter is
+  # disabled. The name of that option differs between urllib3 releases.
+  kwargs = {
+    "total": max_retries,
+    "backoff_factor": backoff_factor,
+    "status_forcelist": (502, 503, 504),
+    "raise_on_status": False
+  }
+  try:
+    return Retry(allowed_methods=None, **kwargs)
+  except TypeError:
+    return Retry(method_whitelist=False, **kwargs)
+
+def create_session(
+    pool_connections=1,
+    pool_maxsize=10,
+    max_retries=0,
+    backoff_factor=0
+):
+  """
+  Create an HTTP session for issuing JSON-RPC calls. Connections made by the
+  session are kept alive and pooled, so that consecutive calls to the same
+  server reuse the same TCP connection.
+
+  Args:
+    pool_connections (int)  : Number of per-host connection pools to cache.
+    pool_maxsize (int)      : Maximum number of connections to keep open to a
+                              single host.
+    max_retries (int)       : Number of times a failed request is retried.
+    backoff_factor (float)  : Factor for the exponential delay between
+                              retries, in seconds.
+  Returns:
+    requests.Session        : The configured session.
+  """
+  adapter = HTTPAdapter(
+      pool_connections=pool_connections,
+      pool_maxsize=pool_maxsize,
+      max_retries=_create_retry(max_retries, backoff_factor)
+  )
+
+  session = requests.Session()
+  session.mount("http://", adapter)
+  session.mount("https://", adapter)
+  return session
+
+def _build_payload(method, params, req_id):
+  # Builds the request object for a single call.
+  payload = {
+    "jsonrpc": "2.0",
+    "method": method,
+    "id": req_id
+  }
+  if params is not None:
+    payload["params"] = params
+  return payload
+
+def _build_batch_payload(calls):
+  # Builds the request array for a batch of calls, along with the IDs
+  # assigned to each call.
+  req_ids = [ _generate_id() for _ in calls ]
+  payload = [
+    _build_payload(method, params, req_id)
+    for (method, params), req_id in zip(calls, req_ids)
+  ]
+  return req_ids, payload
+
+def _check_response(result, req_id):
+  # Verifies that a response answers the request with the given ID.
+  if result["id"] != req_id:
+    raise RuntimeError(
+        "RPC server returned a reponse with the wrong ID!\n"
+        "  Sent: %s\n  Received: %s" % (req_id, result["id"])
+    )
+  return result
+
+def _match_batch(results, req_ids):
+  # Responses to a batch may arrive in any order, so they are matched back to
+  # their calls by ID.
+  if not isinstance(results, list):
+    results = [ results ]
+  by_id = { result.get("id"): result for result in results }
+
+  missing = [ req_id for req_id in req_ids if req_id not in by_id ]
+  if missing:
+    raise RuntimeError(
+        "RPC server did not respond to all calls in the batch!\n"
+        "  Missing: %s" % (", ".join(missing))
+    )
+
+  return [ by_id[req_id] for req_id in req_ids ]
+
+def _get_outcome(result):
+  # Returns the outcome of a call, for metrics, given its decoded response.
+  results = result if isinstance(result, list) else [ result ]
+  if any( "error" in r for r in results if isinstance(r, dict) ):
+    return ERROR
+  return OK
+
+def _post(url, payload, session, codec, metrics, method):
+  # Posts the payload, and returns the decoded JSON response. The call is
+  # recorded under the given method name.
+  if codec is None:
+    codec = DEFAULT_CODEC
+  metrics = get_registry(metrics)
+
+  data = codec.dumpb(payload)
+  received = 0
+  outcome = ERROR
+  start = time.perf_counter()
+  try:
+    post = requests.post if session is None else session.post
+    resp = post(url, data=data, headers=_HEADERS)
+    if resp is None or not resp.ok:
+      raise RuntimeError(
+          "Error calling RPC!\n%s : %s" % (resp.status_code, resp.text)
+      )
+    received = len(resp.content)
+    result = codec.loads(resp.content)
+    outcome = _get_outcome(result)
+    return result
+  except requests.Timeout:
+    outcome = TIMEOUT
+    raise
+  finally:
+    metrics.record(
+        "http",
+        method,
+        time.perf_counter() - start,
+        outcome=outcome,
+        sent=len(data),
+        received=received
+    )
+
+def call_rpc(
+    url,
+    method,
+    params=None,
+    req_id=None,
+    session=None,
+    codec=None,
+    metrics=None
+):
   """
   Call a JSON-RPC at the given URL.
 
@@ -16,6 +168,14 @@ def call_rpc(url, method, params=None, req_id=None):
                         and named arguments are given as a dict.
     req_id (str)      : An identifier for this request. If none is provided,
                         one will be generated automatically.
+    session (requests.Session)
+                      : Session to issue the request on. If none is provided,
+                        a new connection is opened for this request alone.
+    codec (JsonCodec) : Codec used to encode the request and decode the
+                        response. If none is provided, the default is used.
+    metrics (MetricsRegistry)
+                      : Registry in which the call is recorded. If none is
+                        provided, the default is used.
   Returns:
     dict              : JSON response from the server.
   Raises:
@@ -25,25 +185,35 @@ def call_rpc(url, method, params=None, req_id=None):
   if req_id is None:
     req_id = _generate_id()
 
-  payload = {
-    "jsonrpc": "2.0",
-    "method": method,
-    "id": (req_id if req_id is not None else _generate_id())
-  }
-  if params is not None:
-    payload["params"] = params
+  payload = _build_payload(method, params, req_id)
 
-  resp = requests.post(url, json=payload)
-  if resp is None or not resp.ok:
-    raise RuntimeError(
-        "Error calling RPC!\n%s : %s" % (resp.status_code, resp.text)
-    )
+  result = _post(url, payload, session, codec, metrics, method)
+  return _check_response(result, req_id)
 
-  result = resp.json()
-  if result["id"] != req_id:
-    raise RuntimeError(
-        "RPC server returned a reponse with the wrong ID!\n"
-        "  Sent: %s\n  Received: %s" % (req_id, result["id"])
-    )
+def call_rpc_batch(url, calls, session=None, codec=None, metrics=None):
+  """
+  Call several JSON-RPCs at the given URL within a single HTTP request, as a
+  JSON-RPC 2.0 batch.
 
-  return result
+  Args:
+    calls (list)      : The calls to make, each given as a tuple of the
+                        method name and its parameters (or None).
+    session (requests.Session)
+                      : Session to issue the request on. If none is provided,
+                        a new connection is opened for this request alone.
+    codec (JsonCodec) : Codec used to encode the request and decode the
+                        response. If none is provided, the default is used.
+    metrics (MetricsRegistry)
+                      : Registry in which the call is recorded. If none is
+                        provided, the default is used.
+  Returns:
+    list              : JSON responses from the server, in the same order as
+                        the given calls.
+  Raises:
+    RuntimeError      : If the response indicated failure, or the server did
+                        not return exactly one response for each call.
+  """
+  req_ids, payload = _build_batch_payload(calls)
+
+  results = _post(url, payload, session, codec, metrics, "batch")
+  return _match_batch(results, req_ids)
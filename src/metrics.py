@@ -0,0 +1,315 @@
+import bisect
+import threading
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (
+  0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+# Outcomes of a call.
+OK = "ok"
+ERROR = "error"
+TIMEOUT = "timeout"
+
+
+class MethodMetrics(object):
+  """
+  Counters for the calls made to a single method over a single transport.
+  """
+  __slots__ = (
+    "calls",
+    "errors",
+    "timeouts",
+    "latency_sum",
+    "latency_counts",
+    "bytes_sent",
+    "bytes_received"
+  )
+
+  def __init__(self, num_buckets):
+    self.calls = 0
+    self.errors = 0
+    self.timeouts = 0
+    self.latency_sum = 0.0
+    # Count of calls in each latency bucket, with a final overflow bucket.
+    self.latency_counts = [0] * (num_buckets + 1)
+    self.bytes_sent = 0
+    self.bytes_received = 0
+
+
+class MetricsRegistry(object):
+  """
+  Records the count, latency, outcome and payload sizes of RPC calls, keyed by
+  transport and method, along with gauges such as queue depths. Recording is
+  a dict lookup, a bisection and a few additions, so it is cheap enough to
+  leave enabled. Safe to share between threads.
+
+  Args:
+    buckets (tuple) : Upper bounds of the latency histogram buckets, in
+                      seconds, in increasing order.
+  """
+  def __init__(self, buckets=LATENCY_BUCKETS):
+    self._buckets = tuple(buckets)
+    self._methods = {}
+    self._lk = threading.Lock()
+
+    # Functions reporting the value of each gauge, keyed by name and labels.
+    self._gauges = {}
+
+    # Observed values of each histogram, keyed by name and labels, as a list
+    # of the count in each bucket followed by the sum of the values.
+    self._histograms = {}
+
+  def _get(self, transport, method):
+    # Must be called with the lock held.
+    key = (transport, method)
+    try:
+      return self._methods[key]
+    except KeyError:
+      metrics = self._methods[key] = MethodMetrics(len(self._buckets))
+      return metrics
+
+  def record(self, transport, method, latency, outcome=OK, sent=0, received=0):
+    """
+    Record a completed call.
+
+    Args:
+      transport (str) : The transport carrying the call, such as 'http' or
+                        'websocket'.
+      method (str)    : The name of the remote procedure.
+      latency (float) : Duration of the call, in seconds.
+      outcome (str)   : One of OK, ERROR or TIMEOUT.
+      sent (int)      : Size of the request, in bytes.
+      received (int)  : Size of the response, in bytes.
+    """
+    bucket = bisect.bisect_left(self._buckets, latency)
+    with self._lk:
+      metrics = self._get(transport, method)
+      metrics.calls += 1
+      if outcome == ERROR:
+        metrics.errors += 1
+      elif outcome == TIMEOUT:
+        metrics.timeouts += 1
+      metrics.latency_sum += latency
+      metrics.latency_counts[bucket] += 1
+      metrics.bytes_sent += sent
+      metrics.bytes_received += received
+
+  def record_received(self, transport, method, received):
+    """
+    Record the size of a response which is received separately from the
+    completion of its call.
+
+    Args:
+      transport (str) : The transport carrying the call.
+      method (str)    : The name of the remote procedure.
+      received (int)  : Size of the response, in bytes.
+    """
+    with self._lk:
+      self._get(transport, method).bytes_received += received
+
+  def observe(self, name, value, **labels):
+    """
+    Record a value in a histogram, such as the time a message spends queued.
+    The histogram shares the latency buckets of the registry.
+
+    Args:
+      name (str)      : Name of the histogram.
+      value (float)   : The value, usually a duration in seconds.
+      labels (str)    : Labels distinguishing this histogram from others of
+                        the same name.
+    """
+    key = (name, tuple(sorted(labels.items())))
+    bucket = bisect.bisect_left(self._buckets, value)
+    with self._lk:
+      try:
+        counts = self._histograms[key]
+      except KeyError:
+        counts = self._histograms[key] = [0] * (len(self._buckets) + 2)
+      counts[bucket] += 1
+      counts[-1] += value
+
+  def histograms(self):
+    """
+    Returns the values observed in each histogram.
+
+    Returns:
+      dict  : For each histogram name, a list of (labels, counts, sum)
+              triples. The labels are given as a dict, and the counts as a
+              list of (upper bound, count) pairs as for 'snapshot'.
+    """
+    bounds = list(self._buckets) + [ None ]
+    with self._lk:
+      histograms = [ (key, list(counts))
+                     for key, counts in self._histograms.items() ]
+
+    values = {}
+    for (name, labels), counts in sorted(histograms, key=lambda h: h[0]):
+      values.setdefault(name, []).append(
+          (dict(labels), list(zip(bounds, counts[:-1])), counts[-1])
+      )
+    return values
+
+  def register_gauge(self, name, fn, **labels):
+    """
+    Register a function which reports the current value of a gauge, such as
+    the depth of a queue. The function is only called when the gauges are
+    read. Where several functions are registered under the same name and
+    labels, the gauge reports the sum of their values.
+
+    Args:
+      name (str)    : Name of the gauge.
+      fn (function) : Function taking no arguments and returning a number.
+      labels (str)  : Labels distinguishing this gauge from others of the
+                      same name.
+    """
+    key = (name, tuple(sorted(labels.items())))
+    with self._lk:
+      self._gauges.setdefault(key, []).append(fn)
+
+  def unregister_gauge(self, name, fn, **labels):
+    """
+    Unregister a function added with 'register_gauge'.
+
+    Args:
+      name (str)    : Name of the gauge.
+      fn (function) : The function to remove.
+      labels (str)  : Labels of the gauge.
+    """
+    key = (name, tuple(sorted(labels.items())))
+    with self._lk:
+      fns = self._gauges.get(key, [])
+      if fn in fns:
+        fns.remove(fn)
+      if not fns:
+        self._gauges.pop(key, None)
+
+  def gauges(self):
+    """
+    Returns the current value of each gauge.
+
+    Returns:
+      dict  : For each gauge name, a list of (labels, value) pairs, where the
+              labels are given as a dict.
+    """
+    with self._lk:
+      gauges = [ (key, list(fns)) for key, fns in self._gauges.items() ]
+
+    values = {}
+    for (name, labels), fns in sorted(gauges, key=lambda g: g[0]):
+      value = sum( fn() for fn in fns )
+      values.setdefault(name, []).append((dict(labels), value))
+    return values
+
+  def reset(self):
+    """
+    Discards all recorded metrics. Registered gauges are kept.
+    """
+    with self._lk:
+      self._methods = {}
+      self._histograms = {}
+
+  def snapshot(self):
+    """
+    Returns a copy of all recorded metrics.
+
+    Returns:
+      dict  : For each transport, a dict mapping each method to its counters.
+              Latencies are given as a list of (upper bound, count) pairs,
+              one for each histogram bucket, where the final bound is None.
+    """
+    bounds = list(self._buckets) + [ None ]
+    snapshot = {}
+    with self._lk:
+      for (transport, method), metrics in self._methods.items():
+        snapshot.setdefault(transport, {})[method] = {
+          "calls": metrics.calls,
+          "errors": metrics.errors,
+          "timeouts": metrics.timeouts,
+          "latency_sum": metrics.latency_sum,
+          "latency": list(zip(bounds, metrics.latency_counts)),
+          "bytes_sent": metrics.bytes_sent,
+          "bytes_received": metrics.bytes_received
+        }
+    return snapshot
+
+  def to_prometheus(self, prefix="nkn_rpc"):
+    """
+    Returns all recorded metrics in the Prometheus text exposition format.
+
+    Args:
+      prefix (str)  : Prefix of each metric name.
+    Returns:
+      str           : The metrics, one sample per line.
+    """
+    calls, latency, sent, received = [], [], [], []
+    for transport, methods in sorted(self.snapshot().items()):
+      for method, m in sorted(methods.items()):
+        labels = 'transport="%s",method="%s"' % (transport, method)
+
+        ok = m["calls"] - m["errors"] - m["timeouts"]
+        for outcome, count in ((OK, ok), (ERROR, m["errors"]),
+                               (TIMEOUT, m["timeouts"])):
+          calls.append('%s_calls_total{%s,outcome="%s"} %d' % (
+              prefix, labels, outcome, count))
+
+        cumulative = 0
+        for bound, count in m["latency"]:
+          cumulative += count
+          le = "+Inf" if bound is None else repr(bound)
+          latency.append('%s_latency_seconds_bucket{%s,le="%s"} %d' % (
+              prefix, labels, le, cumulative))
+        latency.append('%s_latency_seconds_sum{%s} %r' % (
+            prefix, labels, m["latency_sum"]))
+        latency.append('%s_latency_seconds_count{%s} %d' % (
+            prefix, labels, m["calls"]))
+
+        sent.append('%s_bytes_sent_total{%s} %d' % (
+            prefix, labels, m["bytes_sent"]))
+        received.append('%s_bytes_received_total{%s} %d' % (
+            prefix, labels, m["bytes_received"]))
+
+    lines = []
+    for name, kind, samples in (
+        ("calls_total", "counter", calls),
+        ("latency_seconds", "histogram", latency),
+        ("bytes_sent_total", "counter", sent),
+        ("bytes_received_total", "counter", received)):
+      lines.append("# TYPE %s_%s %s" % (prefix, name, kind))
+      lines.extend(samples)
+
+    for name, samples in sorted(self.histograms().items()):
+      lines.append("# TYPE %s_%s histogram" % (prefix, name))
+      for labels, counts, total in samples:
+        labels = _format_labels(labels)
+        cumulative = 0
+        for bound, count in counts:
+          cumulative += count
+          le = "+Inf" if bound is None else repr(bound)
+          lines.append('%s_%s_bucket{%s,le="%s"} %d' % (
+              prefix, name, labels, le, cumulative))
+        lines.append("%s_%s_sum{%s} %r" % (prefix, name, labels, total))
+        lines.append("%s_%s_count{%s} %d" % (
+            prefix, name, labels, cumulative))
+
+    for name, samples in sorted(self.gauges().items()):
+      lines.append("# TYPE %s_%s gauge" % (prefix, name))
+      for labels, value in samples:
+        lines.append("%s_%s{%s} %r" % (
+            prefix, name, _format_labels(labels), value))
+    return "\n".join(lines) + "\n"
+
+def _format_labels(labels):
+  # Formats a dict of labels for the Prometheus text exposition format.
+  return ",".join( '%s="%s"' % (k, v) for k, v in sorted(labels.items()) )
+
+# Registry used where none is specified.
+REGISTRY = MetricsRegistry()
+
+def get_registry(registry=None):
+  """
+  Returns the given registry, or the default registry if none is given.
+  """
+  if registry is None:
+    return REGISTRY
+  return registry
@@ -0,0 +1,86 @@
+class RttEstimator(object):
+  """
+  Estimates the round-trip time of a connection from a stream of samples, in
+  the manner of TCP (RFC 6298). Tracks a smoothed round-trip time and its
+  variation, from which a timeout is derived beyond which a response is
+  unlikely to arrive.
+
+  Args:
+    alpha (float)       : Weight of each new sample in the smoothed
+                          round-trip time.
+    beta (float)        : Weight of each new sample in the variation.
+    initial_rto (float) : Timeout used before any samples are recorded, in
+                          seconds.
+    min_rto (float)     : Shortest timeout, in seconds.
+    max_rto (float)     : Longest timeout, in seconds.
+  """
+  def __init__(
+      self,
+      alpha=0.125,
+      beta=0.25,
+      initial_rto=1.0,
+      min_rto=0.2,
+      max_rto=60.0
+  ):
+    self._alpha = alpha
+    self._beta = beta
+    self._initial_rto = initial_rto
+    self._min_rto = min_rto
+    self._max_rto = max_rto
+
+    # Smoothed round-trip time and its mean deviation, in seconds.
+    self.srtt = None
+    self.rttvar = None
+
+    # Latest and lowest samples, in seconds.
+    self.latest = None
+    self.min_rtt = None
+
+    # Number of samples recorded.
+    self.samples = 0
+
+  def record(self, rtt):
+    """
+    Record a round-trip time.
+
+    Args:
+      rtt (float) : The round-trip time, in seconds.
+    """
+    if self.srtt is None:
+      self.srtt = rtt
+      self.rttvar = rtt / 2
+    else:
+      self.rttvar += self._beta * (abs(self.srtt - rtt) - self.rttvar)
+      self.srtt += self._alpha * (rtt - self.srtt)
+
+    self.latest = rtt
+    if self.min_rtt is None or rtt < self.min_rtt:
+      self.min_rtt = rtt
+    self.samples += 1
+
+  @property
+  def rto(self):
+    """
+    Time after which a response is unlikely to arrive, in seconds.
+    """
+    if self.srtt is None:
+      return self._initial_rto
+    rto = self.srtt + 4 * self.rttvar
+    return min(max(rto, self._min_rto), self._max_rto)
+
+  def stats(self):
+    """
+    Returns a summary of the estimates.
+
+    Returns:
+      dict  : The smoothed, latest and lowest round-trip times, the
+              variation and timeout, in seconds, and the number of samples.
+    """
+    return {
+      "srtt": self.srtt,
+      "rttvar": self.rttvar,
+      "latest": self.latest,
+      "min_rtt": self.min_rtt,
+      "rto": self.rto,
+      "samples": self.samples
+    }
@@ -1,26 +1,161 @@
 import asyncio
-import json
+from collections import deque
+import functools
+import itertools
+import logging
+import time
+
+from nkn_client.codec import get_codec
+from nkn_client.metrics import ERROR, OK, TIMEOUT
+from nkn_client.websocket.client import (
+  WebsocketClient,
+  WebsocketClientException
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _PendingCall(object):
+  """
+  A request which has been sent to the peer, and for which a response is
+  expected.
+  """
+  __slots__ = ("method", "msg", "future", "seq", "sent")
+
+  def __init__(self, method, msg, future, seq):
+    self.method = method
+    self.msg = msg
+    self.future = future
+    # Order in which the call was made, among all calls on the client.
+    self.seq = seq
+    # Whether the request has been sent on the current connection.
+    self.sent = False
+
+
+def _on_written(call, written):
+  # Marks the call as sent once its request is written, or fails it if the
+  # client disconnected before it could be.
+  call.sent = written.result()
+  if not call.sent and not call.future.done():
+    call.future.set_exception(
+        WebsocketClientException("Client disconnected before sending!")
+    )
+
+
+def _get_size(msg):
+  # Returns the size of a message on the wire, in bytes. Text is sent as
+  # UTF-8, and is most often ASCII, whose length is its size.
+  if isinstance(msg, str) and not msg.isascii():
+    return len(msg.encode("utf-8"))
+  return len(msg)
 
-from nkn_client.websocket.client import WebsocketClient
 
 class WebsocketApiClient(WebsocketClient):
   """
   Extends the original WebsocketClient by implementing a flow for
-  API call-and-response. This flow is synchronous in nature, and
-  calls made are therefore blocking. An additional 'interrupt'
-  interface is provided for handling messages received outside of
-  such a context.
+  API call-and-response. Any number of calls may be outstanding at once,
+  including several calls to the same method, so that requests are pipelined
+  over the one connection. An additional 'interrupt' interface is provided
+  for handling messages received outside of such a context.
+
+  Responses carry no request identifier, only the name of the method, and the
+  peer answers the requests for each method in the order they are sent. Each
+  outstanding call is therefore queued under its method, and each response
+  completes the oldest call queued for that method.
+
+  Calls left unanswered when the connection is lost are sent again once the
+  client reconnects, so a call may reach the peer more than once. Should a
+  call time out once sent, its response may come late or not at all, and
+  responses to its method could no longer be told apart, so the connection
+  is abandoned and the client reconnects. Calls to methods whose responses
+  are all alike, such as heartbeats, may be made unordered instead, in
+  which case a call which times out is only dropped, and its late response
+  taken by the next call.
+
+  Args:
+    codec (str)               : Name of the JSON codec to use, as for
+                                nkn_client.codec.get_codec.
+    metrics (MetricsRegistry) : Registry in which calls are recorded. If not
+                                given, the default registry is used.
+    kwargs                    : Passed to WebsocketClient.
   """
-  def __init__(self):
-    WebsocketClient.__init__(self)
+  def __init__(self, codec=None, metrics=None, **kwargs):
+    WebsocketClient.__init__(self, metrics=metrics, **kwargs)
+
+    # Encodes and decodes messages.
+    self._codec = get_codec(codec)
+
+    # Calls awaiting a response. Each key is a method name, and the value is
+    # a queue of the calls made on that method, oldest first. A call which
+    # has timed out before its request was sent is left in place, since the
+    # request is still to be sent, so that its late response is discarded
+    # rather than taken for the response to a later call.
+    self._pending = {}
+
+    # Numbers the calls in the order they are made.
+    self._seq = itertools.count()
+
+    # Methods called unordered, whose late responses are expected.
+    self._unordered = set()
 
-    # Set of response handlers. Each key is a method name, and
-    # the value is a list of functions which handle responses for
-    # responses on that method.
-    self._handlers = {}
+    # Number of calls awaiting a response.
+    self._in_flight = 0
 
-    # Locks access to the handlers dict.
-    self._handlers_lk = asyncio.Lock()
+  @property
+  def in_flight(self):
+    """
+    The number of calls awaiting a response.
+    """
+    return self._in_flight
+
+  async def on_connect(self):
+    """
+    See WebsocketClient.on_connect()
+
+    Re-sends the calls left unanswered by a previous connection.
+    """
+    await self._replay(self._take_unanswered())
+
+  def _take_unanswered(self):
+    # Discards the calls which can no longer be answered, since they were
+    # sent on a lost connection and have since timed out, and returns the
+    # others which were sent, in the order they were made. Each is marked
+    # as unsent, to be sent again.
+    unanswered = []
+    for calls in self._pending.values():
+      live = [
+        call for call in calls if not (call.sent and call.future.done())
+      ]
+      calls.clear()
+      calls.extend(live)
+      for call in live:
+        if call.sent and not call.future.done():
+          call.sent = False
+          unanswered.append(call)
+    unanswered.sort(key=lambda call: call.seq)
+    return unanswered
+
+  async def _replay(self, calls):
+    # Sends the given calls again, in order.
+    if calls:
+      logger.info("Re-sending %d unanswered calls.", len(calls))
+    for call in calls:
+      await self.send(call.msg)
+      call.sent = True
+
+  def may_drop(self, msg):
+    """
+    See WebsocketClient.may_drop()
+
+    Responses to outstanding calls are never discarded, since each is taken
+    for the response to the oldest call on its method, so that one discarded
+    would pass every later response to the wrong call.
+    """
+    try:
+      method = self._codec.loads(msg).get("Action")
+    except (AttributeError, ValueError):
+      return True
+    return not self._pending.get(method)
 
   async def interrupt(self, msg):
     """
@@ -32,90 +167,138 @@ class WebsocketApiClient(WebsocketClient):
     """
     pass
 
-  async def call_rpc(self, method, timeout=None, **kwargs):
+  async def call_rpc(self, method, timeout=None, ordered=True, **kwargs):
     """
     Invoke an RPC on the peer.
 
     Args:
-      method (str)      : The name of the remote API to call.
-      timeout (int)     : Maximum time to await a response, in
-                          seconds.
-      kwargs            : Additional parameters to supply with the API call.
+      method (str)          : The name of the remote API to call.
+      timeout (int)         : Maximum time to await a response, in
+                              seconds.
+      ordered (bool)        : Whether the response must be that to this
+                              call. If False, any response to the method
+                              will do, and the client does not reconnect
+                              should the call time out.
+      kwargs                : Additional parameters to supply with the API
+                              call.
     Returns:
-      dict              : The API response.
+      dict                  : The API response.
+    Raises:
+      asyncio.TimeoutError  : If no response is received in time.
+      WebsocketClientException
+                            : If the client is not connected, or
+                              disconnects before the request is sent.
     """
-    resp = None
-    done = asyncio.Event()
-    def handle(msg):
-      resp = msg
-      done.set()
-
     msg = {
       "Action": method
     }
-    if kwargs is not None:
-      msg.update(kwargs)
-    msg = json.dumps(msg)
-
-    # Register the response handler at the same time as we issue
-    # the request.
-    async with self._handlers_lk:
-      handlers = []
-      try:
-        handlers = self._handlers[method]
-      except KeyError:
-        self._handlers[method] = handlers
-      handlers.append(handle)
+    msg.update(kwargs)
+    msg = self._codec.dumps(msg)
 
-      await self.send(msg)
+    # Queue the call before sending, since the response may be handled before
+    # 'send' returns.
+    call = _PendingCall(
+        method,
+        msg,
+        asyncio.get_event_loop().create_future(),
+        next(self._seq)
+    )
+    calls = self._pending.setdefault(method, deque())
+    calls.append(call)
+    self._in_flight += 1
+    if not ordered:
+      self._unordered.add(method)
 
+    start = time.perf_counter()
+    outcome = ERROR
     try:
-      await asyncio.wait_for(done.wait(), timeout=timeout)
+      try:
+        written = await self.send(msg)
+      except BaseException:
+        # The request never reached the peer, so no response will come.
+        calls.remove(call)
+        raise
+      written.add_done_callback(functools.partial(_on_written, call))
+
+      resp = await asyncio.wait_for(call.future, timeout=timeout)
+      outcome = ERROR if resp.get("Error") else OK
+      return resp
     except asyncio.TimeoutError:
-      # TODO: Log timeout with error or warning.
-      pass
+      logger.warning("Timed out awaiting response to '%s'.", method)
+      outcome = TIMEOUT
+      self._on_timed_out(call, ordered)
+      raise
     finally:
-      async with self._handlers_lk:
-        handlers = self._handlers[method]
-        handlers.pop()
+      self._in_flight -= 1
+      self._metrics.record(
+          "websocket",
+          method,
+          time.perf_counter() - start,
+          outcome=outcome,
+          sent=_get_size(msg)
+      )
 
-    return resp
+  def _on_timed_out(self, call, ordered):
+    # Once its request is sent, a call which times out may be answered late,
+    # or never, so later responses to its method can no longer be matched
+    # by order. The call is dropped and the connection abandoned, after which
+    # the calls still awaiting a response are sent again on a new one. An
+    # unordered call is only dropped, as any response will do for the next.
+    calls = self._pending[call.method]
+    if not ordered:
+      if call in calls:
+        calls.remove(call)
+      return
+    if not call.sent:
+      return
+    calls.remove(call)
+    logger.warning(
+        "Reconnecting, as responses to '%s' may be out of order.",
+        call.method
+    )
+    self.abort()
 
   async def recv(self, msg):
     """
     See WebsocketClient.recv()
 
-    If an API request is outstanding, messages are attempted
-    to be handled via the corresponding response handler.
-    Otherwise, the message defaults to the interrupt handler.
-
-    Raises:
-      WebsocketJsonRpcException : If the message could not be
-                                  handled.
+    If a call is outstanding on the method of the message, the message
+    completes the oldest such call. Otherwise, the message defaults to the
+    interrupt handler.
     """
+    size = _get_size(msg)
     try:
-      msg = json.loads(msg)
+      msg = self._codec.loads(msg)
     except ValueError:
       # If we cannot parse the response, defer to the interrupt handler.
-      # TODO: Log parse failure.
+      logger.debug("Failed to parse message: %r", msg)
       await self.interrupt(msg)
       return
 
-    method = msg["Action"]
-    async with self._handlers_lk:
-      try:
-        # Find the handler for this message, and call it.
-        handlers = self._handlers[method]
-        handler = handlers[0]
-
-        handler(msg)
-      except KeyError:
-        # A method for which a request was never sent, defer to the
-        # interrupt handler.
-        # TODO: Log unknown message.
-        await self.interrupt(msg)
-      except IndexError:
-        # A request was sent at one point for this method, but all
-        # of the handlers have either been consumed or timed out.
-        # TODO: Log stray message.
-        return
\ No newline at end of file
+    # Nothing is awaited until the call is completed, so that responses are
+    # matched in the order they are received, whichever dispatcher handles
+    # them.
+    method = msg.get("Action")
+    try:
+      calls = self._pending[method]
+    except KeyError:
+      # A method for which a request was never sent, defer to the
+      # interrupt handler.
+      await self.interrupt(msg)
+      return
+
+    if not calls:
+      # A request was sent at one point for this method, but all of the
+      # calls have since been answered, or dropped if unordered.
+      if method in self._unordered:
+        logger.debug("Dropping late response to '%s'.", method)
+      else:
+        logger.warning("Dropping stray response to '%s'.", method)
+      return
+
+    self._metrics.record_received("websocket", method, size)
+    call = calls.popleft()
+    if call.future.done():
+      logger.debug("Discarding late response to '%s'.", method)
+    else:
+      call.future.set_result(msg)
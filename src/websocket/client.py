@@ -1,14 +1,93 @@
 import asyncio
 from concurrent.futures import CancelledError
+import logging
+import random
 import threading
+import time
 import websockets
 from websockets.exceptions import ConnectionClosed
+from websockets.extensions.permessage_deflate import (
+  ClientPerMessageDeflateFactory
+)
+from websockets.framing import OP_BINARY, OP_TEXT, Frame
+
+from nkn_client.metrics import get_registry
+
+logger = logging.getLogger(__name__)
+
+# Behaviours when the dispatch queue is full.
+BLOCK = "block"
+DROP = "drop"
+
+# Compression negotiated on connecting, if any.
+DEFLATE = "deflate"
 
 
 class WebsocketClientException(Exception):
   pass
 
 
+class _Outgoing(object):
+  """
+  A message awaiting the writer.
+  """
+  __slots__ = ("msg", "enqueued", "written")
+
+  def __init__(self, msg, enqueued, written):
+    self.msg = msg
+    # Time at which the message was queued, from time.perf_counter().
+    self.enqueued = enqueued
+    # Resolved with whether the message was written.
+    self.written = written
+
+
+async def _write_messages(socket, msgs):
+  # Writes several messages to the connection at once, and waits for them to
+  # be flushed. The websockets library only sends a message at a time, each
+  # in its own write, so this builds the frames as its 'send' and
+  # 'write_frame' do, for the pinned version of the library.
+  await socket.ensure_open()
+
+  chunks = []
+  for msg in msgs:
+    if isinstance(msg, str):
+      frame = Frame(True, OP_TEXT, msg.encode("utf-8"))
+    else:
+      frame = Frame(True, OP_BINARY, bytes(msg))
+    frame.write(
+        chunks.append,
+        mask=socket.is_client,
+        extensions=socket.extensions
+    )
+  socket.writer.writelines(chunks)
+
+  try:
+    # The library's own frames, such as pongs, are drained under this lock.
+    async with socket._drain_lock:
+      await socket.writer.drain()
+  except ConnectionError:
+    socket.fail_connection()
+    await socket.ensure_open()
+
+def _get_deflate_factory(level, window_bits):
+  # Returns the permessage-deflate offer made on connecting. Without any
+  # settings, this is the offer the websockets library makes by default.
+  compress_settings = None
+  if level is not None:
+    compress_settings = {"level": level}
+
+  if window_bits is None:
+    return ClientPerMessageDeflateFactory(
+        client_max_window_bits=True,
+        compress_settings=compress_settings
+    )
+  return ClientPerMessageDeflateFactory(
+      server_max_window_bits=window_bits,
+      client_max_window_bits=window_bits,
+      compress_settings=compress_settings
+  )
+
+
 class WebsocketClient(object):
   """
   Client class for interacting with a Websocket server. Handles the connect
@@ -17,30 +96,179 @@ class WebsocketClient(object):
   asynchronously; the handler for received messages must be implemented by a
   subclass.
 
+  Should the connection be lost, the client reconnects, waiting a random
+  interval between attempts which doubles with each failure, within the
+  given bounds. Messages sent meanwhile wait until the client is reconnected.
+
+  Messages sent are queued, and written by a single task, which writes all
+  the messages queued at once together.
+
+  Messages are read from the connection as they arrive, and queued to be
+  handled by a pool of dispatcher tasks, so that a slow handler does not hold
+  up reading. With a single dispatcher, messages are handled in the order they
+  are received. With several, a message may be handled while an earlier one
+  is still awaiting something.
+
   Args:
-    url (str) : The remote server to communicate with.
+    dispatchers (int)         : Number of tasks handling received messages.
+    dispatch_queue_size (int) : Maximum number of received messages awaiting
+                                a dispatcher.
+    backpressure (str)        : What to do with a message received while the
+                                queue is full. If BLOCK, reading pauses until
+                                there is room, and the server's buffers fill
+                                in turn. If DROP, the message is discarded,
+                                unless 'may_drop' says otherwise, in which
+                                case reading pauses as for BLOCK.
+    reconnect_interval_min (float)
+                              : Shortest time to wait before reconnecting, in
+                                seconds.
+    reconnect_interval_max (float)
+                              : Longest time to wait before reconnecting, in
+                                seconds.
+    send_queue_size (int)     : Maximum number of sent messages awaiting the
+                                writer, beyond which senders wait.
+    metrics (MetricsRegistry) : Registry on which the depths of the queues,
+                                and the time messages spend queued to be
+                                sent, are reported. If not given, the default
+                                registry is used.
+    compression (str)         : If DEFLATE, the permessage-deflate extension
+                                is offered on connecting, and messages are
+                                compressed if the server accepts. If None,
+                                messages are never compressed.
+    compression_level (int)   : zlib compression level, from 1 (fastest) to
+                                9 (smallest). If None, the zlib default is
+                                used.
+    compression_window_bits (int)
+                              : Base-two logarithm of the compression window
+                                requested in each direction, from 8 to 15.
+                                Smaller windows use less memory on each
+                                connection, at some cost in compression. If
+                                None, the largest window is used.
+    max_size (int)            : Largest message accepted from the server, in
+                                bytes, beyond which the connection is closed.
+                                If None, there is no limit.
+    max_queue (int)           : Maximum number of received messages buffered
+                                by the websockets library ahead of the reader.
+                                If None, there is no limit.
+    read_limit (int)          : High-water mark of the buffer of received
+                                bytes, in bytes.
+    write_limit (int)         : High-water mark of the buffer of bytes to
+                                send, in bytes, above which writes wait for
+                                it to drain.
   """
-  def __init__(self):
+  def __init__(
+      self,
+      dispatchers=1,
+      dispatch_queue_size=1024,
+      backpressure=BLOCK,
+      reconnect_interval_min=0.1,
+      reconnect_interval_max=64,
+      send_queue_size=1024,
+      metrics=None,
+      compression=DEFLATE,
+      compression_level=None,
+      compression_window_bits=None,
+      max_size=2 ** 20,
+      max_queue=2 ** 5,
+      read_limit=2 ** 16,
+      write_limit=2 ** 16
+  ):
+    if dispatchers < 1:
+      raise ValueError("At least one dispatcher is required!")
+    if backpressure not in (BLOCK, DROP):
+      raise ValueError("Unknown backpressure behaviour '%s'!" % backpressure)
+    if compression not in (DEFLATE, None):
+      raise ValueError("Unknown compression '%s'!" % compression)
+
+    self._dispatchers = dispatchers
+    self._backpressure = backpressure
+    self._reconnect_interval_min = reconnect_interval_min
+    self._reconnect_interval_max = reconnect_interval_max
+    self._metrics = get_registry(metrics)
+
+    # Options of each connection opened.
+    self._connect_kwargs = {
+      "compression": None,
+      "extensions": None,
+      "max_size": max_size,
+      "max_queue": max_queue,
+      "read_limit": read_limit,
+      "write_limit": write_limit
+    }
+    if compression == DEFLATE:
+      self._connect_kwargs["extensions"] = [
+        _get_deflate_factory(compression_level, compression_window_bits)
+      ]
+
+    # Received messages awaiting a dispatcher.
+    self._dispatch_queue = asyncio.Queue(maxsize=dispatch_queue_size)
+
+    # Number of received messages discarded because the queue was full.
+    self.dropped = 0
+
+    # Sent messages awaiting the writer.
+    self._send_queue = asyncio.Queue(maxsize=send_queue_size)
+
+    # Numbers of messages written, and of writes made.
+    self.messages_written = 0
+    self.writes = 0
+
     # Tracks the main loop execution.
     self._task = None
 
-    # The underlying connection.
+    # The underlying connection, and the task reading from it.
     self._socket = None
+    self._reader = None
 
     # Manages intended connection state.
     self._running = False
 
+    # Whether the connection is open and set up. Notified on any change to
+    # the connection state.
+    self._connected = False
+    self._state = asyncio.Condition()
+
+    # Task setting up a new connection, whose messages are sent without
+    # waiting for the set up to finish.
+    self._setup_task = None
+
+    # Number of times the connection has been re-established.
+    self.reconnects = 0
+
+    # Time at which a message was last received, or the connection opened,
+    # from time.monotonic().
+    self.last_received = time.monotonic()
+
+  @property
+  def connected(self):
+    """
+    Whether the connection is open and ready to send messages.
+    """
+    return self._connected
+
   async def connect(self, hostname):
     """
     Opens a connection to the WebSocket server, enabling the client to send
     and receive messages.
+
+    Raises:
+      WebsocketClientException  : If the client is already connected.
+      Exception                 : If the first connection fails, the error
+                                  raised in connecting.
     """
-    ready = asyncio.Event()
+    if self._task is not None:
+      raise WebsocketClientException("Client is already connected!")
+
+    ready = asyncio.get_event_loop().create_future()
 
     url = "ws://%s" % hostname
-    self._task = asyncio.create_task(self._main_loop(url, ready))
+    self._task = asyncio.ensure_future(self._main_loop(url, ready))
 
-    await ready.wait()
+    try:
+      await ready
+    except BaseException:
+      await self._stop()
+      raise
 
   async def disconnect(self):
     """
@@ -48,29 +276,75 @@ class WebsocketClient(object):
     """
     # Terminate the main loop, if it is running.
     self._running = False
+    await self._stop()
 
-    # Close the underlying connection.
+  def abort(self):
+    """
+    Abandons the current connection without waiting for the server, as when
+    it has stopped responding. The client then reconnects.
+    """
     if self._socket is not None:
-      await self._socket.wait_closed()
+      # A closing handshake would wait on the unresponsive server, so the
+      # underlying TCP connection is dropped outright.
+      self._socket.writer.transport.abort()
 
-      await self._task
-      self._task = None
+  async def on_connect(self):
+    """
+    Called each time a connection is opened, before any waiting messages are
+    sent. Messages may be sent and received from within this method. Should
+    it raise, the connection is closed and re-opened. To be implemented by
+    subclasses.
+    """
+    pass
 
   async def send(self, msg):
     """
     Send a message to the server. The message is enqueued with other messages
     for this client, so it is not guaranteed to be sent immediately; it may
     not be sent at all if the connection is closed via 'disconnect'. If the
-    client requests a message be sent before connecting, an error is raised.
+    connection is lost, the message is sent once the client reconnects. If
+    the client requests a message be sent before connecting, an error is
+    raised.
+
+    Returns once the message is queued, or, while the queue is full, once
+    there is room.
 
     Args:
       msg (str)                 : Message, as a string, to send to the server.
+    Returns:
+      asyncio.Future            : Resolved with True once the message is
+                                  written to the connection, or with False if
+                                  the client disconnects first.
     Raises:
       WebsocketClientException  : If the client is not connected.
     """
-    if self._socket is None:
+    if not self._running:
       raise WebsocketClientException("Client is not connected!")
-    await self._socket.send(msg)
+
+    written = asyncio.get_event_loop().create_future()
+    if asyncio.current_task() is self._setup_task:
+      # Messages sent while setting up the connection go ahead of the queue.
+      await self._socket.send(msg)
+      written.set_result(True)
+      return written
+
+    await self._send_queue.put(
+        _Outgoing(msg, time.perf_counter(), written)
+    )
+    return written
+
+  def may_drop(self, msg):
+    """
+    Whether a message received while the dispatch queue is full may be
+    discarded, with DROP backpressure. To be overridden by subclasses which
+    must handle some messages whatever the load.
+
+    Args:
+      msg (str) : Message, as a string, received from the server.
+    Returns:
+      bool      : True, unless overridden.
+    """
+    return True
 
   async def recv(self, msg):
     """
@@ -84,6 +358,47 @@ class WebsocketClient(object):
     """
     pass
 
+  async def _stop(self):
+    # Closes the connection, and waits for the main loop to finish.
+    if self._task is None:
+      return
+
+    task, self._task = self._task, None
+    if self._socket is not None:
+      await self._socket.close()
+    else:
+      # The main loop is waiting to reconnect.
+      task.cancel()
+
+    try:
+      await task
+    except CancelledError:
+      pass
+
+  async def _set_connected(self, connected):
+    async with self._state:
+      self._connected = connected
+      self._state.notify_all()
+
+  async def _wait_connected(self, stale=None):
+    # Waits until a connection other than the given stale one is ready, and
+    # returns it, or None if the client is not connected.
+    async with self._state:
+      await self._state.wait_for(lambda: not self._running or (
+          self._connected and self._socket is not stale))
+      if not self._running:
+        return None
+      return self._socket
+
+  def _get_reconnect_delay(self, attempt):
+    # Draws the time to wait before the given reconnection attempt, counting
+    # from zero.
+    ceiling = min(
+        self._reconnect_interval_max,
+        self._reconnect_interval_min * (2 ** attempt)
+    )
+    return random.uniform(self._reconnect_interval_min, ceiling)
+
   async def _main_loop(self, url, ready):
     """
     The main loop which houses the client logic for handling send/recv events.
@@ -92,25 +407,194 @@ class WebsocketClient(object):
     intent.
 
     Args:
-      url (str)             : URL to connect to.
-      ready (asyncio.Event) : Used to signal when the main loop has been
-                              bootstrapped and is ready to process messages.
+      url (str)               : URL to connect to.
+      ready (asyncio.Future)  : Resolved once the first connection is ready,
+                                or with the error raised in making it.
     """
-    if self._running:
-      return
     self._running = True
 
-    ready.set()
+    dispatchers = [
+      asyncio.ensure_future(self._dispatch_loop())
+      for _ in range(self._dispatchers)
+    ]
+    writer = asyncio.ensure_future(self._write_loop())
+    self._metrics.register_gauge(
+        "queue_depth",
+        self._dispatch_queue.qsize,
+        stage="dispatch"
+    )
+    self._metrics.register_gauge(
+        "queue_depth",
+        self._send_queue.qsize,
+        stage="send"
+    )
 
-    while self._running:
-      # Set up the connection.
-      self._socket = await websockets.client.connect(url)
+    attempt = 0
+    try:
+      while self._running:
+        if ready.done():
+          await asyncio.sleep(self._get_reconnect_delay(attempt))
+          attempt += 1
 
-      try:
-        while True:
-          msg = await self._socket.recv()
-          await self.recv(msg)
-      except ConnectionClosed:
+        try:
+          await self._open(url)
+        except CancelledError:
+          raise
+        except Exception as e:
+          if not ready.done():
+            ready.set_exception(e)
+            return
+          logger.warning("Failed to reconnect to %s: %s", url, e)
+          continue
+
+        if ready.done():
+          self.reconnects += 1
+        else:
+          ready.set_result(None)
+        attempt = 0
+
+        # Read from the connection until it closes.
+        await self._reader
+        await self._set_connected(False)
+        self._socket = None
+
+        if self._running:
+          logger.warning("Lost connection to %s, reconnecting.", url)
+          # Handle every message received on the lost connection before
+          # opening the next one.
+          await self._dispatch_queue.join()
+    finally:
+      self._running = False
+      if self._socket is not None:
+        await self._socket.close()
+        self._socket = None
+      await self._set_connected(False)
+
+      self._metrics.unregister_gauge(
+          "queue_depth",
+          self._dispatch_queue.qsize,
+          stage="dispatch"
+      )
+      self._metrics.unregister_gauge(
+          "queue_depth",
+          self._send_queue.qsize,
+          stage="send"
+      )
+      for task in dispatchers + [ writer ]:
+        task.cancel()
+      await asyncio.gather(*dispatchers, writer, return_exceptions=True)
+
+  async def _open(self, url):
+    # Opens and sets up a connection, and starts reading from it.
+    socket = await websockets.client.connect(url, **self._connect_kwargs)
+    self._socket = socket
+    self.last_received = time.monotonic()
+    self._reader = asyncio.ensure_future(self._read_loop(socket))
+
+    # Messages are read while the connection is set up, since setting up may
+    # await responses.
+    self._setup_task = asyncio.ensure_future(self.on_connect())
+    try:
+      await asyncio.wait(
+          [ self._setup_task, self._reader ],
+          return_when=asyncio.FIRST_COMPLETED
+      )
+      if not self._setup_task.done():
+        raise ConnectionClosed(1006, "Connection lost while setting up.")
+      self._setup_task.result()
+    except BaseException:
+      self._setup_task.cancel()
+      self._socket = None
+      await socket.close()
+      await self._reader
+      raise
+    finally:
+      self._setup_task = None
+
+    await self._set_connected(True)
+
+  async def _write(self, socket, batch):
+    # Writes the batch of queued messages to the connection.
+    if len(batch) == 1:
+      await socket.send(batch[0].msg)
+    else:
+      await _write_messages(socket, [ item.msg for item in batch ])
+
+    now = time.perf_counter()
+    for item in batch:
+      self._metrics.observe(
+          "send_latency_seconds",
+          now - item.enqueued,
+          transport="websocket"
+      )
+      if not item.written.done():
+        item.written.set_result(True)
+    self.messages_written += len(batch)
+    self.writes += 1
+
+  async def _write_loop(self):
+    # Writes queued messages until cancelled, taking every message queued at
+    # once. Should the connection be lost, the messages being written are
+    # written again on the next connection.
+    batch = []
+    stale = None
+    try:
+      while True:
+        if not batch:
+          batch.append(await self._send_queue.get())
+        while not self._send_queue.empty():
+          batch.append(self._send_queue.get_nowait())
+
+        socket = await self._wait_connected(stale)
+        if socket is None:
+          return
+        try:
+          await self._write(socket, batch)
+        except ConnectionClosed:
+          stale = socket
+          continue
+        batch = []
+        stale = None
+    finally:
+      while not self._send_queue.empty():
+        batch.append(self._send_queue.get_nowait())
+      for item in batch:
+        if not item.written.done():
+          item.written.set_result(False)
+
+  async def _read_loop(self, socket):
+    # Queues messages received on the connection until it closes.
+    try:
+      while True:
+        msg = await socket.recv()
+        self.last_received = time.monotonic()
+        await self._dispatch(msg)
+    except ConnectionClosed:
+      pass
+
+  async def _dispatch(self, msg):
+    # Queues a received message for the dispatchers.
+    if self._backpressure == BLOCK:
+      await self._dispatch_queue.put(msg)
+      return
+
+    try:
+      self._dispatch_queue.put_nowait(msg)
+    except asyncio.QueueFull:
+      if not self.may_drop(msg):
+        await self._dispatch_queue.put(msg)
         return
-  
-    self._socket = None
\ No newline at end of file
+      if not self.dropped:
+        logger.warning("Dispatch queue is full, dropping messages.")
+      self.dropped += 1
+
+  async def _dispatch_loop(self):
+    # Handles queued messages until cancelled.
+    while True:
+      msg = await self._dispatch_queue.get()
+      try:
+        await self.recv(msg)
+      except Exception:
+        logger.exception("Failed to handle received message.")
+      finally:
+        self._dispatch_queue.task_done()
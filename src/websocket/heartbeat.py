@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+
+from nkn_client.rtt import RttEstimator
+
+logger = logging.getLogger(__name__)
+
+
+class HeartbeatMonitor(object):
+  """
+  Keeps a websocket connection alive, and detects when it has silently died.
+
+  Whenever nothing has been received on the connection for the given
+  interval, a heartbeat is sent. While other traffic is flowing, heartbeats
+  are skipped, since any message received shows the connection is alive.
+  The round-trip time of each heartbeat is recorded, and bounds the time to
+  await the next. Once several heartbeats in a row go unanswered, the
+  connection is abandoned, and the client reconnects.
+
+  Args:
+    client (NknWebsocketApiClient)  : The client to monitor.
+    interval (float)                : Time without receiving anything after
+                                      which a heartbeat is sent, in seconds.
+    max_missed (int)                : Number of heartbeats in a row left
+                                      unanswered after which the connection
+                                      is declared dead.
+    min_timeout (float)             : Shortest time to await a heartbeat, in
+                                      seconds.
+    estimator (RttEstimator)        : Estimator to record round-trip times
+                                      in. If not given, a new one is used.
+  """
+  def __init__(
+      self,
+      client,
+      interval=10.0,
+      max_missed=3,
+      min_timeout=1.0,
+      estimator=None
+  ):
+    self._client = client
+    self._interval = interval
+    self._max_missed = max_missed
+    self._min_timeout = min_timeout
+
+    # Round-trip times of answered heartbeats.
+    self.rtt = estimator if estimator is not None else RttEstimator()
+
+    # Number of heartbeats in a row left unanswered.
+    self.missed = 0
+
+    # Total numbers of heartbeats sent, and of connections declared dead.
+    self.sent = 0
+    self.deaths = 0
+
+    # Tracks the main loop execution.
+    self._task = None
+
+  def start(self):
+    """
+    Starts sending heartbeats.
+    """
+    if self._task is None:
+      self._task = asyncio.ensure_future(self._main_loop())
+
+  async def stop(self):
+    """
+    Stops sending heartbeats.
+    """
+    if self._task is None:
+      return
+
+    task, self._task = self._task, None
+    task.cancel()
+    try:
+      await task
+    except asyncio.CancelledError:
+      pass
+
+  def _get_timeout(self):
+    return min(max(self.rtt.rto, self._min_timeout), self._interval)
+
+  async def _beat(self):
+    # Sends a heartbeat, returning whether it was answered.
+    self.sent += 1
+    start = time.monotonic()
+    try:
+      await self._client.heartbeat(timeout=self._get_timeout())
+    except asyncio.TimeoutError:
+      return False
+    except asyncio.CancelledError:
+      raise
+    except Exception:
+      # Even an error in response shows the connection is alive.
+      logger.debug("Heartbeat failed.", exc_info=True)
+    self.rtt.record(time.monotonic() - start)
+    return True
+
+  async def _main_loop(self):
+    while True:
+      if not self._client.connected:
+        # The client is already reconnecting.
+        await asyncio.sleep(self._interval)
+        continue
+
+      idle = time.monotonic() - self._client.last_received
+      if idle < self._interval:
+        await asyncio.sleep(self._interval - idle)
+        continue
+
+      start = time.monotonic()
+      if await self._beat() or self._client.last_received > start:
+        # Anything received while awaiting the heartbeat will do.
+        self.missed = 0
+        continue
+
+      self.missed += 1
+      if self.missed >= self._max_missed:
+        logger.warning(
+            "Missed %d heartbeats, abandoning connection.",
+            self.missed
+        )
+        self.missed = 0
+        self.deaths += 1
+        self._client.abort()
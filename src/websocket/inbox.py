@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import pickle
+import tempfile
+
+from nkn_client.websocket.client import BLOCK
+
+logger = logging.getLogger(__name__)
+
+# Behaviours when the inbox is full, in addition to BLOCK.
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+SPILL = "spill"
+
+
+class Inbox(object):
+  """
+  A first-in, first-out queue of received packets, holding at most a given
+  number of packets in memory.
+
+  Args:
+    maxsize (int)     : Maximum number of packets held in memory. If 0, the
+                        inbox is unbounded, and never overflows.
+    overflow (str)    : What to do with a packet put while the inbox is full.
+                        If BLOCK, the put waits until there is room, which
+                        also holds up any other messages behind it on the
+                        connection. If DROP_OLDEST, the oldest packet in the
+                        inbox is discarded to make room. If DROP_NEWEST, the
+                        new packet is discarded. If SPILL, the packet is
+                        written to disk, and read back once there is room.
+    spill_path (str)  : File to which packets are spilled. If not given, a
+                        temporary file is used. Only used with SPILL, in
+                        which case packets must be picklable.
+  """
+  def __init__(self, maxsize=0, overflow=BLOCK, spill_path=None):
+    if overflow not in (BLOCK, DROP_OLDEST, DROP_NEWEST, SPILL):
+      raise ValueError("Unknown overflow behaviour '%s'!" % overflow)
+
+    self._queue = asyncio.Queue(maxsize=maxsize)
+    self._overflow = overflow
+    self._spill_path = spill_path
+
+    # File of spilled packets, opened on first use, along with the offset of
+    # the next packet to read back.
+    self._spill = None
+    self._spill_pos = 0
+
+    # Number of packets currently on disk.
+    self._spilled_count = 0
+
+    # Number of packets discarded because the inbox was full.
+    self.dropped = 0
+
+    # Number of packets written to disk because the inbox was full.
+    self.spilled = 0
+
+  def qsize(self):
+    """
+    Returns the number of packets in the inbox, including those on disk.
+    """
+    return self._queue.qsize() + self._spilled_count
+
+  async def put(self, packet):
+    """
+    Add a packet to the inbox, handling overflow as configured.
+
+    Args:
+      packet (object) : The packet to add.
+    """
+    if self._overflow == BLOCK:
+      await self._queue.put(packet)
+    elif self._overflow == SPILL:
+      # Once any packet is on disk, later packets follow it there, so that
+      # packets are read back in order.
+      if self._spilled_count or self._queue.full():
+        self._write_spill(packet)
+      else:
+        self._queue.put_nowait(packet)
+    elif not self._queue.full():
+      self._queue.put_nowait(packet)
+    elif self._overflow == DROP_OLDEST:
+      self._queue.get_nowait()
+      self._queue.put_nowait(packet)
+      self._count_drop()
+    else:
+      self._count_drop()
+
+  async def get(self):
+    """
+    Remove and return the oldest packet, waiting until one is available.
+
+    Returns:
+      object  : The packet.
+    """
+    packet = await self._queue.get()
+    self._refill()
+    return packet
+
+  def get_nowait(self):
+    """
+    Remove and return the oldest packet, if one is available.
+
+    Returns:
+      object              : The packet.
+    Raises:
+      asyncio.QueueEmpty  : If the inbox is empty.
+    """
+    packet = self._queue.get_nowait()
+    self._refill()
+    return packet
+
+  async def get_many(self, max_n, timeout=None):
+    """
+    Remove and return the oldest packets available, waiting until there is
+    at least one.
+
+    Args:
+      max_n (int)     : Maximum number of packets to return.
+      timeout (float) : Maximum time to wait for a packet, in seconds. If
+                        None, waits indefinitely.
+    Returns:
+      list            : The packets, oldest first. Empty if none arrived in
+                        time.
+    """
+    packets = []
+    if not self.qsize():
+      try:
+        packets.append(await asyncio.wait_for(self.get(), timeout=timeout))
+      except asyncio.TimeoutError:
+        return packets
+
+    while len(packets) < max_n:
+      try:
+        packets.append(self.get_nowait())
+      except asyncio.QueueEmpty:
+        break
+    return packets
+
+  def close(self):
+    """
+    Closes the spill file, discarding any packets on disk.
+    """
+    if self._spill is not None:
+      self._spill.close()
+      self._spill = None
+      self._spilled_count = 0
+
+  def _refill(self):
+    # Moves the oldest packet on disk into memory, now there is room.
+    if self._spilled_count:
+      self._queue.put_nowait(self._read_spill())
+
+  def _count_drop(self):
+    if not self.dropped:
+      logger.warning("Inbox is full, dropping packets.")
+    self.dropped += 1
+
+  def _write_spill(self, packet):
+    if self._spill is None:
+      if self._spill_path is None:
+        self._spill = tempfile.TemporaryFile()
+      else:
+        self._spill = open(self._spill_path, "w+b")
+      self._spill_pos = 0
+
+    self._spill.seek(0, 2)
+    pickle.dump(packet, self._spill)
+    self._spilled_count += 1
+    self.spilled += 1
+
+  def _read_spill(self):
+    self._spill.seek(self._spill_pos)
+    packet = pickle.load(self._spill)
+    self._spilled_count -= 1
+
+    if self._spilled_count:
+      self._spill_pos = self._spill.tell()
+    else:
+      # Reclaim the space once every spilled packet is read back.
+      self._spill.seek(0)
+      self._spill.truncate()
+      self._spill_pos = 0
+    return packet
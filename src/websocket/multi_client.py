@@ -0,0 +1,266 @@
+import asyncio
+import itertools
+import re
+
+from nkn_client.websocket.client import BLOCK
+from nkn_client.websocket.inbox import Inbox
+from nkn_client.websocket.nkn_api import NknWebsocketApiClient
+
+# Ways of choosing the connection on which to send each packet.
+ROUND_ROBIN = "round_robin"
+LEAST_IN_FLIGHT = "least_in_flight"
+
+# Prefix of the identifier of an additional connection of a client.
+_PREFIX_PATTERN = re.compile(r"^__\d+__\.")
+
+
+def get_sub_address(addr, index):
+  """
+  Returns the address registered on the given connection of a client with
+  several connections. The first connection registers the client address
+  itself, so that the client is reachable by those unaware of the others.
+  Each other connection registers the address with its identifier prefixed
+  by '__<index>__.'.
+
+  Args:
+    addr (str)  : NKN address of the client, as "identifier.pubkey".
+    index (int) : Index of the connection.
+  Returns:
+    str         : The address of the connection.
+  """
+  if index == 0:
+    return addr
+  return "__%d__.%s" % (index, addr)
+
+def strip_sub_address(addr):
+  """
+  Returns the client address of an address registered on one of its
+  connections, as from 'get_sub_address'.
+
+  Args:
+    addr (str)  : NKN address of a connection.
+  Returns:
+    str         : The address of the client.
+  """
+  if addr is None:
+    return None
+  return _PREFIX_PATTERN.sub("", addr, count=1)
+
+
+class NknWebsocketMultiClient(object):
+  """
+  Client for the NKN Websocket API which keeps several connections open, to
+  different nodes or repeatedly to the same node, and spreads sent packets
+  over them. Packets received on any connection are merged into one inbox.
+
+  Each connection registers its own address, as from 'get_sub_address'. The
+  node serving each address is found through 'getwsaddr', so connections are
+  usually spread over several nodes.
+
+  Args:
+    num_connections (int)     : Number of connections to keep open.
+    routing (str)             : How to choose the connection on which to send
+                                each packet. If ROUND_ROBIN, each connection
+                                is used in turn. If LEAST_IN_FLIGHT, the
+                                connection with the fewest calls awaiting a
+                                response is used. Connections which are
+                                reconnecting are skipped either way.
+    inbox_size (int)          : Maximum number of received packets held in
+                                memory, across all connections. If 0, there
+                                is no limit.
+    inbox_overflow (str)      : What to do with packets received while the
+                                inbox is full, as for
+                                nkn_client.websocket.inbox.Inbox.
+    inbox_spill_path (str)    : File to which packets are spilled, if the
+                                inbox overflow is SPILL.
+    kwargs                    : Passed to each NknWebsocketApiClient.
+  """
+  def __init__(
+      self,
+      num_connections=2,
+      routing=ROUND_ROBIN,
+      inbox_size=0,
+      inbox_overflow=BLOCK,
+      inbox_spill_path=None,
+      **kwargs
+  ):
+    if num_connections < 1:
+      raise ValueError("At least one connection is required!")
+    if routing not in (ROUND_ROBIN, LEAST_IN_FLIGHT):
+      raise ValueError("Unknown routing '%s'!" % routing)
+
+    self._routing = routing
+
+    # Retains incoming messages from every connection.
+    self._inbox = Inbox(
+        maxsize=inbox_size,
+        overflow=inbox_overflow,
+        spill_path=inbox_spill_path
+    )
+
+    # Client of each connection.
+    self._clients = [
+      NknWebsocketApiClient(inbox=self._inbox, **kwargs)
+      for _ in range(num_connections)
+    ]
+
+    # Offset of the connection tried first for the next packet.
+    self._next = itertools.count()
+
+  @property
+  def clients(self):
+    """
+    The client of each connection.
+    """
+    return list(self._clients)
+
+  @property
+  def connected(self):
+    """
+    Whether any connection is open and ready to send messages.
+    """
+    return any( client.connected for client in self._clients )
+
+  @property
+  def inbox(self):
+    """
+    The inbox of packets received on every connection.
+    """
+    return self._inbox
+
+  @property
+  def sig_chain_block_hash(self):
+    for client in self._clients:
+      if client.sig_chain_block_hash is not None:
+        return client.sig_chain_block_hash
+    return None
+
+  def get_addresses(self, addr):
+    """
+    Returns the address registered on each connection.
+
+    Args:
+      addr (str)  : NKN address of the client.
+    Returns:
+      list        : The address of each connection, as from
+                    'get_sub_address'.
+    """
+    return [ get_sub_address(addr, i) for i in range(len(self._clients)) ]
+
+  async def connect(self, hostnames):
+    """
+    Opens every connection.
+
+    Args:
+      hostnames (list)  : Hostname of the node for each connection. May also
+                          be a single hostname, to which every connection is
+                          opened.
+    Raises:
+      ValueError        : If the number of hostnames does not match the
+                          number of connections.
+      Exception         : If any connection fails, the error raised in
+                          connecting. The other connections are closed.
+    """
+    if isinstance(hostnames, str):
+      hostnames = [ hostnames ] * len(self._clients)
+    if len(hostnames) != len(self._clients):
+      raise ValueError("Must supply a hostname for each connection!")
+
+    results = await asyncio.gather(
+        *[ client.connect(hostname)
+           for client, hostname in zip(self._clients, hostnames) ],
+        return_exceptions=True
+    )
+    for result in results:
+      if isinstance(result, BaseException):
+        await self.disconnect()
+        raise result
+
+  async def disconnect(self):
+    """
+    Closes every connection.
+    """
+    await asyncio.gather(
+        *[ client.disconnect() for client in self._clients ]
+    )
+
+  def _route(self):
+    # Returns the client on which to send the next packet.
+    start = next(self._next)
+    count = len(self._clients)
+    clients = [ self._clients[(start + i) % count] for i in range(count) ]
+
+    # While every connection is reconnecting, the packet waits on any.
+    candidates = [ client for client in clients if client.connected ]
+    if not candidates:
+      candidates = clients
+
+    if self._routing == LEAST_IN_FLIGHT:
+      return min(candidates, key=lambda client: client.in_flight)
+    return candidates[0]
+
+  async def set_client(self, Addr):
+    """
+    Register the client on every connection, each under its own address.
+
+    See NknWebsocketApiClient.set_client()
+    """
+    return await asyncio.gather(
+        *[ client.set_client(addr)
+           for client, addr in zip(self._clients, self.get_addresses(Addr)) ]
+    )
+
+  async def send_packet(self, Dest, Payload, Signature):
+    """
+    Send a packet on one of the connections.
+
+    See NknWebsocketApiClient.send_packet()
+    """
+    return await self._route().send_packet(Dest, Payload, Signature)
+
+  async def get_latest_block_height(self):
+    """
+    See NknWebsocketApiClient.get_latest_block_height()
+    """
+    return await self._route().get_latest_block_height()
+
+  async def get_incoming_packet(self):
+    """
+    Get the next packet received on any connection. Where the source is
+    one of the connections of a client with several, its address is
+    replaced by that of the client.
+
+    Returns:
+      (str, str, str, str)
+                      : Source address, payload, digest, signature.
+    """
+    src, payload, digest, signature = await self._inbox.get()
+    return strip_sub_address(src), payload, digest, signature
+
+  async def get_incoming_packets(self, max_n, timeout=None):
+    """
+    Get the packets received on any connection which are waiting, with
+    source addresses as for 'get_incoming_packet'.
+
+    See NknWebsocketApiClient.get_incoming_packets()
+    """
+    packets = await self._inbox.get_many(max_n, timeout=timeout)
+    return [ (strip_sub_address(src), payload, digest, signature)
+             for src, payload, digest, signature in packets ]
+
+  def add_block_hash_listener(self, listener):
+    """
+    Register a function to be called with each new block hash pushed by any
+    node, so it may be called several times with each hash.
+
+    See NknWebsocketApiClient.add_block_hash_listener()
+    """
+    for client in self._clients:
+      client.add_block_hash_listener(listener)
+
+  def remove_block_hash_listener(self, listener):
+    """
+    See NknWebsocketApiClient.remove_block_hash_listener()
+    """
+    for client in self._clients:
+      client.remove_block_hash_listener(listener)
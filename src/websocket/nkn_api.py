@@ -1,7 +1,7 @@
-import asyncio
-import json
-
 from nkn_client.websocket.api_client import WebsocketApiClient
+from nkn_client.websocket.client import BLOCK
+from nkn_client.websocket.heartbeat import HeartbeatMonitor
+from nkn_client.websocket.inbox import Inbox
 
 
 class NknWebsocketApiClientError(Exception):
@@ -10,20 +10,118 @@ class NknWebsocketApiClientError(Exception):
     Exception.__init__(self, msg)
 
 class NknWebsocketApiClient(WebsocketApiClient):
-  def __init__(self):
-    WebsocketApiClient.__init__(self)
+  """
+  Client for the NKN Websocket API.
+
+  Args:
+    cache (ChainCache)  : Cache for blocks and transactions. If not given,
+                          every call is sent to the node.
+    codec (str)         : Name of the JSON codec to use, as for
+                          nkn_client.codec.get_codec.
+    metrics (MetricsRegistry)
+                        : Registry in which calls are recorded. If not given,
+                          the default registry is used.
+    inbox_size (int)    : Maximum number of received packets held in memory.
+                          If 0, there is no limit.
+    inbox_overflow (str): What to do with packets received while the inbox
+                          is full, as for nkn_client.websocket.inbox.Inbox.
+    inbox_spill_path (str)
+                        : File to which packets are spilled, if the inbox
+                          overflow is SPILL.
+    inbox (Inbox)       : Inbox in which to retain received packets, such as
+                          one shared with other clients. If given, the other
+                          inbox args are ignored.
+    heartbeat_interval (float)
+                        : Time without receiving anything after which a
+                          heartbeat is sent, in seconds. If None, no
+                          heartbeats are sent.
+    heartbeat_max_missed (int)
+                        : Number of heartbeats in a row left unanswered
+                          after which the connection is re-opened.
+    kwargs              : Passed to WebsocketClient.
+  """
+  def __init__(
+      self,
+      cache=None,
+      codec=None,
+      metrics=None,
+      inbox_size=0,
+      inbox_overflow=BLOCK,
+      inbox_spill_path=None,
+      inbox=None,
+      heartbeat_interval=10.0,
+      heartbeat_max_missed=3,
+      **kwargs
+  ):
+    WebsocketApiClient.__init__(self, codec=codec, metrics=metrics, **kwargs)
+
+    # Cache of immutable chain data.
+    self._cache = cache
 
     # Retains incoming messages, to be handled by other classes.
-    self._inbox = asyncio.Queue()
+    if inbox is None:
+      inbox = Inbox(
+          maxsize=inbox_size,
+          overflow=inbox_overflow,
+          spill_path=inbox_spill_path
+      )
+    self._inbox = inbox
 
     # The latest block hash.
     self._latest_hash = None
 
+    # Address registered with 'set_client', registered again on reconnecting.
+    self._addr = None
+
+    # Sends heartbeats while connected, measuring the round-trip time.
+    self._heartbeat = None
+    if heartbeat_interval is not None:
+      self._heartbeat = HeartbeatMonitor(
+          self,
+          interval=heartbeat_interval,
+          max_missed=heartbeat_max_missed
+      )
+
+    # Functions called with each new block hash pushed by the node.
+    self._block_hash_listeners = []
+
     self.INTERRUPT_HANDLERS = {
       "receivePacket": self.receive_packet,
       "updateSigChainBlockHash": self.update_sig_chain_block_hash
     }
 
+  async def connect(self, hostname):
+    """
+    See WebsocketClient.connect()
+    """
+    await WebsocketApiClient.connect(self, hostname)
+    if self._heartbeat is not None:
+      self._heartbeat.start()
+
+  async def disconnect(self):
+    """
+    See WebsocketClient.disconnect()
+    """
+    if self._heartbeat is not None:
+      await self._heartbeat.stop()
+    await WebsocketApiClient.disconnect(self)
+
+  async def on_connect(self):
+    """
+    See WebsocketClient.on_connect()
+
+    Registers the client address again, if one was registered on a previous
+    connection, before re-sending any unanswered calls.
+    """
+    unanswered = self._take_unanswered()
+
+    # An unanswered registration is re-sent along with the other calls, and
+    # a second would take its response.
+    registering = any( call.method == "setclient" for call in unanswered )
+    if self._addr is not None and not registering:
+      await self.set_client(self._addr)
+    await self._replay(unanswered)
+
   async def interrupt(self, msg):
     method = msg["Action"]
     try:
@@ -40,7 +138,7 @@ class NknWebsocketApiClient(WebsocketApiClient):
 
     See WebsocketApiClient.call_rpc for args.
     """
-    res = await self.call_rpc(self, method, **kwargs)
+    res = await self.call_rpc(method, **kwargs)
     self.raise_error(**res)
     return res["Result"]
 
@@ -80,13 +178,20 @@ class NknWebsocketApiClient(WebsocketApiClient):
     Returns:
       dict          : Block information.
     """
+    if self._cache is not None:
+      res = self._cache.get_block(height=height, hash=hash)
+      if res is not None:
+        return res
+
     if height is not None:
       assert hash is None
       res = await self._call_rpc("getblock", height=height)
-      return res
+    else:
+      assert hash is not None
+      res = await self._call_rpc("getblock", hash=hash)
 
-    assert hash is not None
-    res = await self._call_rpc("getblock", hash=hash)
+    if self._cache is not None and res is not None:
+      self._cache.put_block(res, height=height, hash=hash)
     return res
 
   async def get_connection_count(self):
@@ -108,14 +213,29 @@ class NknWebsocketApiClient(WebsocketApiClient):
     Returns:
       dict        : The transaction information.
     """
+    if self._cache is not None:
+      res = self._cache.get_transaction(hash)
+      if res is not None:
+        return res
+
     res = await self._call_rpc("gettransaction", hash=hash)
+
+    if self._cache is not None and res is not None:
+      self._cache.put_transaction(res, hash)
     return res
 
-  async def heartbeat(self):
+  async def heartbeat(self, timeout=None):
     """
     Send a heartbeat.
+
+    Args:
+      timeout (float)       : Maximum time to await a response, in seconds.
+    Raises:
+      asyncio.TimeoutError  : If no response is received in time.
     """
-    res = await self._call_rpc("heartbeat")
+    # Any response shows the connection is alive, so a heartbeat which times
+    # out is left to the monitor, rather than reconnecting at once.
+    res = await self._call_rpc("heartbeat", timeout=timeout, ordered=False)
     return res
 
   async def get_session_count(self, Addr):
@@ -140,6 +260,7 @@ class NknWebsocketApiClient(WebsocketApiClient):
       Addr (str)  : NKN address to register to the connected node.
     """
     res = await self._call_rpc("setclient", Addr=Addr)
+    self._addr = Addr
     return res
 
   async def send_packet(self, Dest, Payload, Signature):
@@ -165,31 +286,52 @@ class NknWebsocketApiClient(WebsocketApiClient):
       Action=None,
       Src=None,
       Payload=None,
-      Digest=None
+      Digest=None,
+      Signature=None
   ):
     """
     Push a packet to client.
 
     Args:
-      Action (str)  : Method of the API. Must be "receivePacket".
-      Src (str)     : NKN address of the source client.
-      Payload (str) : The message received.
-      Digest (str)  : Ignored currently.
+      Action (str)    : Method of the API. Must be "receivePacket".
+      Src (str)       : NKN address of the source client.
+      Payload (str)   : The message received.
+      Digest (str)    : Ignored currently.
+      Signature (str) : Signature of the packet by the source client, as
+                        hex, if the node forwards it.
     """
     assert Action == "receivePacket"
 
-    await self._inbox.put( (Src, Payload, Digest) )
+    await self._inbox.put( (Src, Payload, Digest, Signature) )
 
   async def get_incoming_packet(self):
     """
     Get the next packet received on this client.
 
     Returns:
-      (str, str, str) : Source address, payload, digest.
+      (str, str, str, str)
+                      : Source address, payload, digest, signature.
     """
     res = await self._inbox.get()
     return res
 
+  async def get_incoming_packets(self, max_n, timeout=None):
+    """
+    Get the packets received on this client which are waiting, waiting
+    until there is at least one.
+
+    Args:
+      max_n (int)     : Maximum number of packets to get.
+      timeout (float) : Maximum time to wait for a packet, in seconds. If
+                        None, waits indefinitely.
+    Returns:
+      list            : Source address, payload, digest and signature of
+                        each packet, oldest first. Empty if none arrived in
+                        time.
+    """
+    res = await self._inbox.get_many(max_n, timeout=timeout)
+    return res
+
   async def update_sig_chain_block_hash(
       self,
       Action=None,
@@ -210,6 +352,44 @@ class NknWebsocketApiClient(WebsocketApiClient):
       Version (str) : NKN version.
     """
     self._latest_hash = Result
+    for listener in list(self._block_hash_listeners):
+      listener(Result)
+
+  def add_block_hash_listener(self, listener):
+    """
+    Register a function to be called with each new block hash pushed by the
+    node. The function must not block.
+
+    Args:
+      listener (function) : Function taking the block hash as a string.
+    """
+    self._block_hash_listeners.append(listener)
+
+  def remove_block_hash_listener(self, listener):
+    """
+    Unregister a function added with 'add_block_hash_listener'.
+
+    Args:
+      listener (function) : The function to remove.
+    """
+    self._block_hash_listeners.remove(listener)
+
+  @property
+  def rtt(self):
+    """
+    Estimator of the round-trip time of the connection, measured by
+    heartbeats, or None if heartbeats are disabled.
+    """
+    if self._heartbeat is None:
+      return None
+    return self._heartbeat.rtt
+
+  @property
+  def inbox(self):
+    """
+    The inbox of received packets, with counters of any which overflowed.
+    """
+    return self._inbox
 
   @property
   def sig_chain_block_hash(self):
@@ -0,0 +1,140 @@
+import asyncio
+import asynctest
+from asynctest import CoroutineMock, MagicMock
+
+from nkn_client.client.blocks import BlockSubscriptionHub
+from nkn_client.websocket.nkn_api import NknWebsocketApiClient
+
+
+class MockJsonRpcApi(object):
+  def __init__(self, height):
+    self.height = height
+    self.fetched = []
+    # Heights at which fetching fails, once each.
+    self.failing = set()
+    self.get_latest_block_height = CoroutineMock(side_effect=self._height)
+
+  async def _height(self):
+    return self.height
+
+  async def iter_blocks(self, start, end, concurrency=8):
+    for height in range(start, end):
+      if height in self.failing:
+        self.failing.discard(height)
+        raise ConnectionError("failed")
+      self.fetched.append(height)
+      yield {"header": {"height": height}}
+
+
+class TestBlockSubscriptionHub(asynctest.TestCase):
+  def setUp(self):
+    self._jsonrpc = MockJsonRpcApi(10)
+    self._ws = NknWebsocketApiClient()
+    self._hub = BlockSubscriptionHub(
+        self._jsonrpc,
+        self._ws,
+        min_interval=0.01,
+        max_interval=0.02
+    )
+
+  async def tearDown(self):
+    await self._hub.close()
+
+  async def _next_heights(self, subscription, n):
+    heights = []
+    for _ in range(n):
+      block = await asyncio.wait_for(subscription.__anext__(), timeout=1)
+      heights.append(block["header"]["height"])
+    return heights
+
+  async def test_push_wakes_subscribers(self):
+    self._hub._max_interval = self._hub._min_interval = 10
+    subscription = self._hub.subscribe()
+    pending = asyncio.ensure_future(self._next_heights(subscription, 2))
+    await asyncio.sleep(0.01)
+
+    self._jsonrpc.height = 12
+    await self._ws.update_sig_chain_block_hash(Result="hash")
+
+    self.assertEqual(await pending, [11, 12])
+    await subscription.aclose()
+
+  async def test_polls_without_push(self):
+    subscription = self._hub.subscribe()
+    pending = asyncio.ensure_future(self._next_heights(subscription, 1))
+    await asyncio.sleep(0.01)
+
+    self._jsonrpc.height = 11
+
+    self.assertEqual(await pending, [11])
+    await subscription.aclose()
+
+  async def test_blocks_fetched_once_for_all_subscribers(self):
+    first = self._hub.subscribe()
+    second = self._hub.subscribe()
+    pending = asyncio.gather(
+        self._next_heights(first, 2),
+        self._next_heights(second, 2)
+    )
+    await asyncio.sleep(0.01)
+
+    self._jsonrpc.height = 12
+
+    self.assertEqual(await pending, [[11, 12], [11, 12]])
+    self.assertEqual(self._jsonrpc.fetched, [11, 12])
+    await first.aclose()
+    await second.aclose()
+
+  async def test_last_unsubscribe_stops_watching(self):
+    subscription = self._hub.subscribe()
+    pending = asyncio.ensure_future(self._next_heights(subscription, 1))
+    await asyncio.sleep(0.01)
+    self._jsonrpc.height = 11
+    await pending
+
+    await subscription.aclose()
+
+    self.assertIsNone(self._hub._task)
+    self.assertFalse(self._ws._block_hash_listeners)
+
+  async def test_poll_interval_backs_off(self):
+    self._hub._max_interval = 0.04
+    subscription = self._hub.subscribe()
+    pending = asyncio.ensure_future(subscription.__anext__())
+    await asyncio.sleep(0.05)
+
+    self.assertGreater(self._hub.interval, self._hub._min_interval)
+    pending.cancel()
+
+  async def test_close_ends_subscriptions(self):
+    subscription = self._hub.subscribe()
+    pending = asyncio.ensure_future(self._next_heights(subscription, 1))
+    await asyncio.sleep(0.01)
+
+    await self._hub.close()
+
+    with self.assertRaises(StopAsyncIteration):
+      await pending
+
+  async def test_initial_height_retried(self):
+    self._jsonrpc.get_latest_block_height.side_effect = [
+      ConnectionError("failed"),
+      10,
+      11
+    ]
+    subscription = self._hub.subscribe()
+
+    self.assertEqual(await self._next_heights(subscription, 1), [11])
+    await subscription.aclose()
+
+  async def test_partial_fetch_not_republished(self):
+    subscription = self._hub.subscribe()
+    pending = asyncio.ensure_future(self._next_heights(subscription, 3))
+    await asyncio.sleep(0.01)
+
+    self._jsonrpc.failing = {12}
+    self._jsonrpc.height = 13
+
+    self.assertEqual(await pending, [11, 12, 13])
+    self.assertEqual(self._jsonrpc.fetched, [11, 12, 13])
+    await subscription.aclose()
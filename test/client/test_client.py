@@ -1,9 +1,47 @@
 import asyncio
 import asynctest
 from asynctest import ANY, CoroutineMock, MagicMock, Mock, patch
+import random
 
 from nkn_client.client.client import NknClient
+from nkn_client.client.fragment import split_payload
 from nkn_client.client.packet import *
+from nkn_client.client.session import DeliveryError
+from nkn_client.websocket.inbox import Inbox
+from nkn_client.websocket.multi_client import NknWebsocketMultiClient
+
+
+class _Relay(object):
+  """
+  Stands in for the websocket clients of several NknClients, relaying
+  packets between them, and dropping some.
+  """
+  def __init__(self, loss=0.0, seed=0):
+    self._loss = loss
+    self._random = random.Random(seed)
+    self._inboxes = {}
+
+  def attach(self, client):
+    inbox = self._inboxes[client._addr] = Inbox()
+
+    async def send_packet(dest, payload, signature):
+      if dest in self._inboxes and self._random.random() >= self._loss:
+        await self._inboxes[dest].put(
+            (client._addr, payload, None, signature)
+        )
+
+    ws = MagicMock()
+    ws.connect = CoroutineMock()
+    ws.set_client = CoroutineMock()
+    ws.disconnect = CoroutineMock()
+    ws.send_packet = send_packet
+    ws.get_incoming_packet = inbox.get
+    ws.get_incoming_packets = inbox.get_many
+    client._ws = ws
+
+    client._jsonrpc = MagicMock()
+    client._jsonrpc.get_websocket_address = CoroutineMock()
+    client._jsonrpc.close = CoroutineMock()
 
 class TestNknClient(asynctest.TestCase):
   def setUp(self):
@@ -16,19 +54,71 @@ class TestNknClient(asynctest.TestCase):
     wsaddr = "host"
 
     mock_jsonrpc = MagicMock()
-    mock_getwsaddr = MagicMock(return_value=wsaddr)
+    mock_getwsaddr = CoroutineMock(return_value=wsaddr)
     mock_jsonrpc.get_websocket_address = mock_getwsaddr
     self._client._jsonrpc = mock_jsonrpc
 
     mock_ws = MagicMock()
     mock_connect = CoroutineMock()
     mock_ws.connect = mock_connect
+    mock_set_client = CoroutineMock()
+    mock_ws.set_client = mock_set_client
     self._client._ws = mock_ws
 
     await self._client.connect()
 
-    mock_getwsaddr.assert_called_once()
+    mock_getwsaddr.assert_awaited_once()
     mock_connect.assert_awaited_once_with(wsaddr)
+    mock_set_client.assert_awaited_once_with(self._client._addr)
+
+  async def test_connect_several_connections(self):
+    client = NknClient("id", num_connections=3)
+    self.assertIsInstance(client._ws, NknWebsocketMultiClient)
+
+    mock_jsonrpc = MagicMock()
+    mock_getwsaddr = CoroutineMock(side_effect=lambda addr: "host-" + addr)
+    mock_jsonrpc.get_websocket_address = mock_getwsaddr
+    client._jsonrpc = mock_jsonrpc
+
+    mock_ws = MagicMock(spec=NknWebsocketMultiClient)
+    mock_ws.get_addresses = client._ws.get_addresses
+    mock_connect = CoroutineMock()
+    mock_ws.connect = mock_connect
+    mock_ws.set_client = CoroutineMock()
+    client._ws = mock_ws
+
+    await client.connect()
+
+    addrs = client._ws.get_addresses(client._addr)
+    self.assertEqual(mock_getwsaddr.await_count, 3)
+    mock_connect.assert_awaited_once_with([ "host-" + a for a in addrs ])
+    mock_ws.set_client.assert_awaited_once_with(client._addr)
+
+  def test_address(self):
+    identifier, pubkey = self._client._addr.split(".")
+
+    self.assertEqual(identifier, "id")
+    self.assertEqual(len(pubkey), 64)
+    int(pubkey, 16)
+
+  def test_reconnect_intervals(self):
+    client = NknClient(
+        "id",
+        reconnect_interval_min=100,
+        reconnect_interval_max=2000
+    )
+
+    self.assertEqual(client._ws._reconnect_interval_min, 0.1)
+    self.assertEqual(client._ws._reconnect_interval_max, 2)
+
+  def test_websocket_options(self):
+    client = NknClient("id", inbox_size=8, max_size=2 ** 16)
+    self.assertEqual(client._ws._inbox._queue.maxsize, 8)
+
+    with self.assertRaisesRegex(TypeError, "inbox_sise, max_sise"):
+      NknClient("id", inbox_sise=8, max_sise=2 ** 16)
+    with self.assertRaisesRegex(TypeError, "inbox"):
+      NknClient("id", num_connections=2, inbox=Inbox())
 
   async def test_disconnect(self):
     mock_ws = MagicMock()
@@ -36,9 +126,15 @@ class TestNknClient(asynctest.TestCase):
     mock_ws.disconnect = mock_disconnect
     self._client._ws = mock_ws
 
+    mock_jsonrpc = MagicMock()
+    mock_close = CoroutineMock()
+    mock_jsonrpc.close = mock_close
+    self._client._jsonrpc = mock_jsonrpc
+
     await self._client.disconnect()
 
     mock_disconnect.assert_awaited_once()
+    mock_close.assert_awaited_once()
 
   async def test_send(self):
     mock_ws = MagicMock()
@@ -53,6 +149,22 @@ class TestNknClient(asynctest.TestCase):
 
     mock_send.assert_awaited_once_with(dest, payload, ANY)
 
+  async def test_send_signs_payload(self):
+    mock_ws = MagicMock()
+    mock_ws.send_packet = mock_send = CoroutineMock()
+    self._client._ws = mock_ws
+
+    # Each payload, its value once received, and the bytes signed.
+    for payload, received, data in (
+        ("payload", "payload", b"payload"),
+        (b"\x00\xff", b"\x00\xff", b"\x00\xff"),
+        (memoryview(b"binary"), b"binary", b"binary")):
+      await self._client.send("dest", payload)
+
+      _, wire, signature = mock_send.await_args[0]
+      self.assertEqual(decode_payload(wire), received)
+      self._client._key.verify_key.verify(data, bytes.fromhex(signature))
+
   async def test_recv(self):
     src = "src"
     payload = "payload"
@@ -61,10 +173,279 @@ class TestNknClient(asynctest.TestCase):
     expected = NknReceivedPacket(src, payload, digest)
 
     mock_ws = MagicMock()
-    mock_recv = CoroutineMock(return_value=(src, payload, digest))
+    mock_recv = CoroutineMock(return_value=(src, payload, digest, None))
     mock_ws.get_incoming_packet = mock_recv
     self._client._ws = mock_ws
 
     actual = await self._client.recv()
 
-    self.assertEqual(actual, expected)
\ No newline at end of file
+    self.assertEqual(actual, expected)
+
+  async def test_send_signs_on_threads(self):
+    client = NknClient("id", signing_workers=2)
+    mock_ws = MagicMock()
+    mock_ws.send_packet = mock_send = CoroutineMock()
+    client._ws = mock_ws
+
+    await asyncio.gather(*[ client.send("dest", "%d" % i) for i in range(8) ])
+
+    self.assertEqual(mock_send.await_count, 8)
+    for (_, payload, signature), _ in mock_send.await_args_list:
+      client._key.verify_key.verify(
+          payload.encode("utf-8"),
+          bytes.fromhex(signature)
+      )
+    client._signer.close()
+
+  async def test_recv_many(self):
+    packets = [ ("src", "payload %d" % i, "digest", None) for i in range(3) ]
+
+    mock_ws = MagicMock()
+    mock_recv = CoroutineMock(return_value=packets)
+    mock_ws.get_incoming_packets = mock_recv
+    self._client._ws = mock_ws
+
+    actual = await self._client.recv_many(10, timeout=1)
+
+    mock_recv.assert_awaited_once_with(10, timeout=1)
+    self.assertEqual(
+        actual,
+        [ NknReceivedPacket(*packet) for packet in packets ]
+    )
+
+  async def test_async_iteration(self):
+    packets = [ ("src", "payload %d" % i, "digest", None) for i in range(3) ]
+
+    mock_ws = MagicMock()
+    mock_ws.get_incoming_packet = CoroutineMock(side_effect=packets)
+    self._client._ws = mock_ws
+
+    actual = []
+    async for pkt in self._client:
+      actual.append(pkt)
+      if len(actual) == len(packets):
+        break
+
+    self.assertEqual(actual, [ NknReceivedPacket(*p) for p in packets ])
+
+  async def test_recv_verifies_packets(self):
+    client = NknClient("id", verify=True)
+    sender = NknClient("sender")
+    signed = [ await sender._sign_packet(NknSentPacket("id", p))
+               for p in ("a", b"\x00\xff") ]
+
+    packets = [
+      (sender._addr, "a", None, signed[0].signature),
+      (sender._addr, "forged", None, signed[0].signature),
+      (sender._addr, "unsigned", None, None),
+      ("id.notakey", "a", None, signed[0].signature),
+      (sender._addr, encode_payload(b"\x00\xff"), None, signed[1].signature)
+    ]
+    mock_ws = MagicMock()
+    mock_ws.get_incoming_packet = CoroutineMock(side_effect=packets)
+    mock_ws.get_incoming_packets = CoroutineMock(return_value=packets)
+    client._ws = mock_ws
+
+    pkt = await client.recv()
+    self.assertEqual(pkt.payload, "a")
+    pkt = await client.recv()
+    self.assertEqual(pkt.payload, b"\x00\xff")
+
+    pkts = await client.recv_many()
+    self.assertEqual([ pkt.payload for pkt in pkts ], ["a", b"\x00\xff"])
+    self.assertEqual(
+        client.verifier.stats(),
+        {"verified": 4, "failed": 4, "unsigned": 2}
+    )
+
+    # Unsigned packets cannot be verified, so are delivered only if allowed.
+    client = NknClient("id", verify=True, allow_unsigned=True)
+    client._ws = mock_ws
+    pkts = await client.recv_many()
+    self.assertEqual(
+        [ pkt.payload for pkt in pkts ],
+        ["a", "unsigned", b"\x00\xff"]
+    )
+    self.assertIsNone(pkts[1].signature)
+
+  async def test_recv_binary(self):
+    payload = b"\x00\xff"
+
+    mock_ws = MagicMock()
+    mock_ws.get_incoming_packet = CoroutineMock(
+        return_value=("src", encode_payload(payload), "digest", None)
+    )
+    self._client._ws = mock_ws
+
+    actual = await self._client.recv()
+
+    self.assertEqual(actual.payload, payload)
+  async def test_send_fragmented(self):
+    client = NknClient("id", fragment_size=4, fragment_window=2)
+    mock_ws = MagicMock()
+    mock_ws.send_packet = mock_send = CoroutineMock()
+    client._ws = mock_ws
+
+    await client.send("dest", "é" * 5)
+    await client.send("dest", "tiny")
+
+    # Ten bytes in three fragments, each signed, then the small payload.
+    self.assertEqual(mock_send.await_count, 4)
+    sent = [ args for args, _ in mock_send.await_args_list ]
+    for _, wire, signature in sent:
+      client._key.verify_key.verify(
+          get_payload_bytes(decode_payload(wire)),
+          bytes.fromhex(signature)
+      )
+    self.assertEqual(sent[3][1], "tiny")
+
+    # Received in any order, they are joined again.
+    receiver = NknClient("receiver", verify=True)
+    receiver._ws = MagicMock()
+    receiver._ws.get_incoming_packets = CoroutineMock(
+        return_value=[ (client._addr, wire, None, signature)
+                       for _, wire, signature in reversed(sent) ]
+    )
+    pkts = await receiver.recv_many()
+    self.assertEqual([ pkt.payload for pkt in pkts ], ["tiny", "é" * 5])
+
+  async def test_recv_drops_malformed(self):
+    packets = [ ("src", "\x00\x01bad", "digest", None),
+                ("src", "payload", "digest", None) ]
+
+    mock_ws = MagicMock()
+    mock_ws.get_incoming_packet = CoroutineMock(side_effect=packets)
+    self._client._ws = mock_ws
+
+    actual = await self._client.recv()
+
+    self.assertEqual(actual.payload, "payload")
+
+  async def test_recv_drops_invalid_text_fragments(self):
+    fragments = split_payload(b"\xff\xfe", 1, True)
+    packets = [ ("src", encode_payload(f), "digest", None) for f in fragments ]
+    packets.append(("src", "hello", "digest", None))
+
+    mock_ws = MagicMock()
+    mock_ws.get_incoming_packets = CoroutineMock(return_value=packets)
+    self._client._ws = mock_ws
+
+    pkts = await self._client.recv_many()
+
+    self.assertEqual([ pkt.payload for pkt in pkts ], ["hello"])
+
+  async def test_small_payloads_interleave_with_fragments(self):
+    client = NknClient("id", fragment_size=4, fragment_window=2)
+    mock_ws = MagicMock()
+    mock_ws.send_packet = mock_send = CoroutineMock(
+        side_effect=lambda *args: asyncio.sleep(0.01)
+    )
+    client._ws = mock_ws
+
+    await asyncio.gather(
+        client.send("dest", "x" * 32),
+        client.send("dest", "tiny")
+    )
+
+    payloads = [ args[1] for args, _ in mock_send.await_args_list ]
+    self.assertEqual(len(payloads), 9)
+    self.assertLess(payloads.index("tiny"), 8)
+
+  async def test_reliable_over_lossy_relay(self):
+    relay = _Relay(loss=0.2)
+    sender = NknClient(
+        "sender",
+        reliable=True,
+        fragment_size=64,
+        response_timeout_secs=0.05
+    )
+    receiver = NknClient("receiver", verify=True)
+    relay.attach(sender)
+    relay.attach(receiver)
+    await sender.connect()
+    await receiver.connect()
+
+    payloads = [ "%d" % i for i in range(50) ] + [ bytes(range(256)) * 4 ]
+
+    # Packets are acknowledged as the receiver reads them, so the sender
+    # waits on the receiver once its window is full.
+    async def send_all():
+      for payload in payloads:
+        await sender.send(receiver._addr, payload)
+      await sender.flush()
+    sending = asyncio.ensure_future(send_all())
+
+    received = []
+    while len(received) < len(payloads):
+      received += await asyncio.wait_for(receiver.recv_many(), 5)
+    await asyncio.wait_for(sending, 5)
+
+    self.assertEqual([ pkt.payload for pkt in received ], payloads)
+    self.assertEqual(receiver.verifier.failed, 0)
+    self.assertGreater(
+        sender.sessions.get_session(receiver._addr).retransmitted,
+        0
+    )
+    await sender.disconnect()
+    await receiver.disconnect()
+
+  async def test_reliable_send_fails_once_unacknowledged(self):
+    client = NknClient(
+        "id",
+        reliable=True,
+        response_timeout_secs=0.01,
+        msg_holding_secs=0.05
+    )
+    client._ws = MagicMock()
+    client._ws.send_packet = CoroutineMock()
+
+    await client.send("dest", "payload")
+    with self.assertRaises(DeliveryError):
+      await asyncio.wait_for(client.flush("dest"), 1)
+    client._sessions.close()
+
+  async def test_reliable_clients_receive_in_background(self):
+    relay = _Relay()
+    first = NknClient("first", reliable=True)
+    second = NknClient("second", reliable=True)
+    relay.attach(first)
+    relay.attach(second)
+    await first.connect()
+    await second.connect()
+
+    # Sent in full before either reads, as acknowledgements are handled in
+    # the background.
+    for i in range(64):
+      await first.send(second._addr, "%d" % i)
+    await asyncio.wait_for(first.flush(), 5)
+
+    received = [ (await second.recv()).payload for _ in range(64) ]
+    self.assertEqual(received, [ "%d" % i for i in range(64) ])
+    await first.disconnect()
+    await second.disconnect()
+
+  async def test_reliable_acks_handled_while_inbox_full(self):
+    relay = _Relay()
+    first = NknClient("first", reliable=True, response_timeout_secs=0.05)
+    second = NknClient("second", reliable=True, delivered_inbox_size=4)
+    relay.attach(first)
+    relay.attach(second)
+    await first.connect()
+    await second.connect()
+
+    async def send_all():
+      for i in range(16):
+        await first.send(second._addr, "%d" % i)
+      await first.flush()
+    sending = asyncio.ensure_future(send_all())
+    await asyncio.sleep(0.05)
+
+    # The packets sent by the client with a full inbox are acknowledged.
+    await second.send(first._addr, "payload")
+    await asyncio.wait_for(second.flush(), 1)
+
+    received = [ (await second.recv()).payload for _ in range(16) ]
+    self.assertEqual(received, [ "%d" % i for i in range(16) ])
+    await asyncio.wait_for(sending, 5)
+    await first.disconnect()
+    await second.disconnect()
@@ -0,0 +1,214 @@
+import asyncio
+import asynctest
+import gc
+
+from nkn_client.client.fragment import (
+  IncompleteMessageError,
+  PayloadStream,
+  Reassembler,
+  split_payload
+)
+from nkn_client.client.packet import Fragment, NknReceivedPacket
+
+
+def _packets(fragments, source="src"):
+  return [ NknReceivedPacket(source, f, "digest") for f in fragments ]
+
+
+class TestSplitPayload(asynctest.TestCase):
+  def test_split(self):
+    fragments = split_payload(b"abcdefg", 3, False)
+
+    self.assertEqual([ f.data for f in fragments ], [b"abc", b"def", b"g"])
+    self.assertEqual([ f.index for f in fragments ], [0, 1, 2])
+    self.assertEqual({ f.count for f in fragments }, {3})
+    self.assertEqual(len({ f.msg_id for f in fragments }), 1)
+
+  def test_message_ids_differ(self):
+    self.assertNotEqual(
+        split_payload(b"data", 2, True)[0].msg_id,
+        split_payload(b"data", 2, True)[0].msg_id
+    )
+
+
+class TestReassembler(asynctest.TestCase):
+  def setUp(self):
+    self.reassembler = Reassembler()
+
+  def tearDown(self):
+    self.reassembler.close()
+
+  def test_other_packets_passed_through(self):
+    pkt = NknReceivedPacket("src", "payload", "digest")
+
+    self.assertIs(self.reassembler.add(pkt), pkt)
+
+  def test_out_of_order(self):
+    text = "é" * 100
+    packets = _packets(split_payload(text.encode("utf-8"), 7, True))
+    packets.reverse()
+
+    for pkt in packets[:-1]:
+      self.assertIsNone(self.reassembler.add(pkt))
+    pkt = self.reassembler.add(packets[-1])
+
+    self.assertEqual(pkt, NknReceivedPacket("src", text, "digest"))
+    self.assertEqual(len(self.reassembler), 0)
+    self.assertEqual(self.reassembler.completed, 1)
+
+  def test_interleaved(self):
+    first = _packets(split_payload(b"a" * 10, 4, False))
+    second = _packets(split_payload(b"b" * 10, 4, False))
+    other = _packets(split_payload(b"c" * 10, 4, False), source="other")
+
+    delivered = []
+    for packets in zip(first, second, other):
+      for pkt in packets:
+        pkt = self.reassembler.add(pkt)
+        if pkt is not None:
+          delivered.append((pkt.source, pkt.payload))
+
+    self.assertEqual(
+        delivered,
+        [("src", b"a" * 10), ("src", b"b" * 10), ("other", b"c" * 10)]
+    )
+
+  def test_duplicates_ignored(self):
+    packets = _packets(split_payload(b"data", 2, False))
+
+    self.assertIsNone(self.reassembler.add(packets[0]))
+    self.assertIsNone(self.reassembler.add(packets[0]))
+    self.assertEqual(self.reassembler.add(packets[1]).payload, b"data")
+
+  async def test_late_duplicates_dropped(self):
+    for stream in (False, True):
+      reassembler = Reassembler(stream=stream)
+      packets = _packets(split_payload(b"data", 2, False))
+      for pkt in packets:
+        reassembler.add(pkt)
+
+      self.assertIsNone(reassembler.add(packets[0]))
+      self.assertEqual(len(reassembler), 0)
+      self.assertEqual(reassembler.completed, 1)
+      reassembler.close()
+
+  def test_eviction(self):
+    reassembler = Reassembler(max_bytes=12)
+    first = _packets(split_payload(b"a" * 8, 4, False))
+    second = _packets(split_payload(b"b" * 16, 4, False))
+
+    reassembler.add(first[0])
+    reassembler.add(second[0])
+    reassembler.add(second[1])
+    self.assertEqual(len(reassembler), 2)
+
+    # Over the bound, the payload least recently added to is abandoned.
+    reassembler.add(second[2])
+    self.assertEqual(reassembler.evicted, 1)
+    self.assertEqual(len(reassembler), 1)
+    self.assertEqual(reassembler.add(second[3]).payload, b"b" * 16)
+    reassembler.close()
+
+  async def test_timeout(self):
+    reassembler = Reassembler(timeout=0.05, stream=True)
+    packets = _packets(split_payload(b"data", 2, False))
+
+    stream = reassembler.add(packets[0]).payload
+    self.assertEqual(await stream.__anext__(), b"da")
+
+    await asyncio.sleep(0.1)
+    self.assertEqual(len(reassembler), 0)
+    self.assertEqual(reassembler.expired, 1)
+    with self.assertRaises(IncompleteMessageError):
+      await stream.read()
+
+  async def test_stream(self):
+    reassembler = Reassembler(stream=True)
+    packets = _packets(split_payload(b"abcdef", 2, False))
+
+    pkt = reassembler.add(packets[1])
+    self.assertIsInstance(pkt.payload, PayloadStream)
+    self.assertIsNone(reassembler.add(packets[0]))
+
+    stream = pkt.payload
+    self.assertEqual(await stream.__anext__(), b"ab")
+    self.assertEqual(await stream.__anext__(), b"cd")
+
+    reassembler.add(packets[2])
+    self.assertEqual([ chunk async for chunk in stream ], [b"ef"])
+    self.assertEqual(reassembler.completed, 1)
+
+  async def test_unread_stream_counted(self):
+    reassembler = Reassembler(max_bytes=8, stream=True)
+    first = _packets(split_payload(b"a" * 8, 4, False))
+    second = _packets(split_payload(b"b" * 8, 4, False))
+
+    stream = reassembler.add(first[0]).payload
+    reassembler.add(first[1])
+    self.assertEqual(reassembler.completed, 1)
+
+    # The unread payload takes up all of the room.
+    failed = reassembler.add(second[0]).payload
+    self.assertEqual(reassembler.evicted, 1)
+    with self.assertRaises(IncompleteMessageError):
+      await failed.read()
+
+    self.assertEqual(await stream.read(), b"a" * 8)
+    self.assertEqual(reassembler._size, 0)
+    reassembler.close()
+
+  async def test_dropped_stream_released(self):
+    reassembler = Reassembler(max_bytes=8, stream=True)
+    first = _packets(split_payload(b"a" * 8, 4, False))
+    second = _packets(split_payload(b"b" * 8, 4, False))
+
+    # Completed, then dropped unread.
+    reassembler.add(first[0])
+    reassembler.add(first[1])
+    gc.collect()
+
+    stream = reassembler.add(second[0]).payload
+    reassembler.add(second[1])
+    self.assertEqual(reassembler.evicted, 0)
+    self.assertEqual(await stream.read(), b"b" * 8)
+    reassembler.close()
+
+  async def test_stream_read_text(self):
+    reassembler = Reassembler(stream=True)
+    text = "é" * 10
+    packets = _packets(split_payload(text.encode("utf-8"), 3, True))
+
+    stream = reassembler.add(packets[0]).payload
+    for pkt in packets[1:]:
+      reassembler.add(pkt)
+
+    self.assertEqual(await stream.read(), text)
+
+  async def test_close_fails_streams(self):
+    reassembler = Reassembler(stream=True)
+    packets = _packets(split_payload(b"data", 2, False))
+
+    stream = reassembler.add(packets[0]).payload
+    reassembler.close()
+
+    with self.assertRaises(IncompleteMessageError):
+      await stream.read()
+
+  def test_invalid_text_dropped(self):
+    packets = _packets(split_payload(b"\xff\xfe", 1, True))
+
+    self.assertIsNone(self.reassembler.add(packets[0]))
+    self.assertIsNone(self.reassembler.add(packets[1]))
+    self.assertEqual(len(self.reassembler), 0)
+    self.assertEqual(self.reassembler.completed, 0)
+
+  def test_mismatched_count_ignored(self):
+    self.reassembler.add(_packets([ Fragment("id", 0, 2, False, b"a") ])[0])
+
+    pkt = _packets([ Fragment("id", 1, 3, False, b"b") ])[0]
+    self.assertIsNone(self.reassembler.add(pkt))
+    self.assertEqual(len(self.reassembler), 1)
+
+
+if __name__ == "__main__":
+  asynctest.main()
@@ -0,0 +1,170 @@
+import asynctest
+
+from nkn_client.client.packet import (
+  Fragment,
+  NknPacket,
+  NknReceivedPacket,
+  NknSentPacket,
+  SessionFrame,
+  decode_payload,
+  encode_payload,
+  get_payload_bytes,
+  sign
+)
+
+
+class TestNknPacket(asynctest.TestCase):
+  def test_sign_copies(self):
+    pkt = NknSentPacket("dest", b"payload")
+    signed = sign(pkt, "sig")
+
+    self.assertEqual(signed, NknPacket(None, "dest", b"payload", None, "sig"))
+    self.assertIsNone(pkt.signature)
+
+  def test_immutable(self):
+    pkt = NknSentPacket("dest", b"payload")
+
+    with self.assertRaises(AttributeError):
+      pkt.signature = "sig"
+    with self.assertRaises(AttributeError):
+      del pkt.payload
+
+  def test_tuple_protocol(self):
+    pkt = NknReceivedPacket("src", "payload", "digest", "sig")
+    source, destination, payload, digest, signature = pkt
+
+    self.assertEqual(
+        (source, destination, payload, digest, signature),
+        ("src", None, "payload", "digest", "sig")
+    )
+    self.assertEqual(len(pkt), 5)
+    self.assertEqual(pkt[0], "src")
+    self.assertEqual(pkt[-1], "sig")
+    self.assertEqual(pkt[2:4], ("payload", "digest"))
+    self.assertEqual(pkt._asdict()["payload"], "payload")
+    self.assertEqual(pkt._replace(payload="other").payload, "other")
+    self.assertEqual(pkt.payload, "payload")
+    with self.assertRaises(ValueError):
+      pkt._replace(other=None)
+
+  def test_equality(self):
+    pkt = NknReceivedPacket("src", "payload", "digest")
+
+    self.assertEqual(pkt, NknReceivedPacket("src", "payload", "digest"))
+    self.assertNotEqual(pkt, NknReceivedPacket("src", "other", "digest"))
+    self.assertNotEqual(pkt, ("src", "payload", "digest"))
+
+  def test_hash(self):
+    pkt = NknReceivedPacket("src", "payload", "digest")
+
+    self.assertIn(NknReceivedPacket("src", "payload", "digest"), { pkt })
+    self.assertNotIn(NknReceivedPacket("src", "other", "digest"), { pkt })
+
+  def test_no_instance_dict(self):
+    pkt = NknPacket()
+
+    with self.assertRaises(AttributeError):
+      pkt.other = None
+
+  def test_to_wire(self):
+    pkt = sign(NknSentPacket("dest", b"\x00\xff"), "sig")
+    dest, payload, signature = pkt.to_wire()
+
+    self.assertEqual(dest, "dest")
+    self.assertEqual(decode_payload(payload), b"\x00\xff")
+    self.assertEqual(signature, "sig")
+
+  def test_repr(self):
+    self.assertEqual(
+        repr(NknSentPacket("dest", "payload")),
+        "NknPacket(source=None, destination='dest', payload='payload', "
+        "digest=None, signature=None)"
+    )
+
+
+class TestPayload(asynctest.TestCase):
+  def test_text_sent_as_is(self):
+    payload = "payload"
+
+    self.assertIs(encode_payload(payload), payload)
+    self.assertIs(decode_payload(payload), payload)
+
+  def test_binary_round_trip(self):
+    payload = bytes(range(256))
+
+    for value in (payload, bytearray(payload), memoryview(payload)):
+      wire = encode_payload(value)
+      self.assertIsInstance(wire, str)
+      self.assertEqual(decode_payload(wire), payload)
+
+  def test_text_with_marker_round_trip(self):
+    for payload in ("\x00", "\x00text", "\x00\x00text", "\x00\x01", "AAAA"):
+      self.assertEqual(decode_payload(encode_payload(payload)), payload)
+
+  def test_empty_round_trip(self):
+    self.assertEqual(decode_payload(encode_payload("")), "")
+    self.assertEqual(decode_payload(encode_payload(b"")), b"")
+    self.assertIsNone(decode_payload(None))
+
+  def test_get_payload_bytes(self):
+    payload = b"payload"
+
+    self.assertIs(get_payload_bytes(payload), payload)
+    self.assertEqual(get_payload_bytes("payload"), payload)
+    self.assertEqual(get_payload_bytes(memoryview(payload)), payload)
+    self.assertEqual(get_payload_bytes("é"), b"\xc3\xa9")
+
+
+class TestFragment(asynctest.TestCase):
+  def test_round_trip(self):
+    for text in (True, False):
+      fragment = Fragment("0123abcd", 2, 5, text, bytes(range(256)))
+
+      wire = encode_payload(fragment)
+      self.assertIsInstance(wire, str)
+      self.assertEqual(decode_payload(wire), fragment)
+      self.assertEqual(hash(decode_payload(wire)), hash(fragment))
+
+  def test_get_payload_bytes(self):
+    fragment = Fragment("id", 0, 2, False, b"data")
+
+    self.assertEqual(get_payload_bytes(fragment), b"id:0:2:b:data")
+
+  def test_malformed(self):
+    for header in ("id:0:2:b", "id:x:2:b:", "id:2:2:b:", "id:0:2:z:"):
+      with self.assertRaises(ValueError):
+        decode_payload("\x00\x01" + header)
+
+
+class TestSessionFrame(asynctest.TestCase):
+  def test_round_trip(self):
+    for frame in (
+        SessionFrame("id", 3, 1, payload="text"),
+        SessionFrame("id", 0, 0, payload=b"\x00\xff"),
+        SessionFrame("id", 1, 0, payload=""),
+        SessionFrame("id", 2, 0, payload=Fragment("m", 0, 2, True, b"a")),
+        SessionFrame("id", 7, 4, ((6, 8), (9, 10)))):
+      wire = encode_payload(frame)
+      self.assertIsInstance(wire, str)
+      self.assertEqual(decode_payload(wire), frame)
+      self.assertEqual(hash(decode_payload(wire)), hash(frame))
+
+  def test_get_payload_bytes(self):
+    self.assertEqual(
+        get_payload_bytes(SessionFrame("id", 3, 1, payload="text")),
+        b"id:d:3:1::text"
+    )
+    self.assertEqual(
+        get_payload_bytes(SessionFrame("id", 7, 4, ((6, 8),))),
+        b"id:a:7:4:6-8:"
+    )
+
+  def test_malformed(self):
+    for header in ("id:d:0:0", "id:d:0:x::", "id:x:0:0::", "id:a:0:0:6:",
+                   "id:a:0:0:6-x:"):
+      with self.assertRaises(ValueError):
+        decode_payload("\x00\x02" + header)
+
+
+if __name__ == "__main__":
+  asynctest.main()
@@ -0,0 +1,245 @@
+import asyncio
+import asynctest
+from asynctest import CoroutineMock
+import functools
+import random
+
+from nkn_client.client.packet import (
+  NknReceivedPacket,
+  SessionFrame,
+  decode_payload,
+  encode_payload
+)
+from nkn_client.client.session import DeliveryError, SessionManager
+
+
+class _Link(object):
+  """
+  Carries frames between session managers, after a random delay, dropping
+  some in either direction.
+  """
+  def __init__(self, loss=0.0, delay=(0.001, 0.005), seed=0):
+    self._loss = loss
+    self._delay = delay
+    self._random = random.Random(seed)
+    self.managers = {}
+    self.received = {}
+
+  def attach(self, addr, **kwargs):
+    kwargs.setdefault("initial_rto", 0.05)
+    manager = SessionManager(functools.partial(self._send, addr), **kwargs)
+    self.managers[addr] = manager
+    self.received[addr] = []
+    return manager
+
+  async def _send(self, source, destination, frame):
+    if self._random.random() < self._loss:
+      return
+    asyncio.get_event_loop().call_later(
+        self._random.uniform(*self._delay),
+        self._arrive,
+        source,
+        destination,
+        encode_payload(frame)
+    )
+
+  def _arrive(self, source, destination, wire):
+    pkt = NknReceivedPacket(source, decode_payload(wire), None)
+    self.received[destination].extend(
+        p.payload for p in self.managers[destination].add(pkt)
+    )
+
+
+class TestSessionManager(asynctest.TestCase):
+  def setUp(self):
+    self.link = _Link(delay=(0.002, 0.002))
+    self.sender = self.link.attach("a")
+    self.receiver = self.link.attach("b")
+
+  def tearDown(self):
+    self.sender.close()
+    self.receiver.close()
+
+  async def test_delivered_in_order(self):
+    payloads = [ "%d" % i for i in range(100) ] + [ b"\x00\xff" ]
+    for payload in payloads:
+      await self.sender.send("b", payload)
+    await self.sender.flush()
+
+    self.assertEqual(self.link.received["b"], payloads)
+    self.assertEqual(self.sender.get_session("b").retransmitted, 0)
+
+  async def test_delivered_over_lossy_link(self):
+    link = _Link(loss=0.2, delay=(0.001, 0.01))
+    sender, receiver = link.attach("a"), link.attach("b")
+
+    payloads = [ "%d" % i for i in range(300) ]
+    for payload in payloads:
+      await sender.send("b", payload)
+    await asyncio.wait_for(sender.flush("b"), 10)
+
+    self.assertEqual(link.received["b"], payloads)
+    self.assertGreater(sender.get_session("b").retransmitted, 0)
+    sender.close()
+    receiver.close()
+
+  async def test_not_stop_and_wait(self):
+    link = _Link(delay=(0.05, 0.05))
+    sender, receiver = link.attach("a"), link.attach("b")
+
+    for i in range(10):
+      await sender.send("b", "%d" % i)
+    self.assertEqual(sender.get_session("b").in_flight, 10)
+
+    await sender.flush()
+    self.assertEqual(sender.get_session("b").in_flight, 0)
+    sender.close()
+    receiver.close()
+
+  async def test_window_limits_in_flight(self):
+    sender = SessionManager(CoroutineMock(), min_window=2, max_window=2)
+    await sender.send("b", "0")
+    await sender.send("b", "1")
+
+    sending = asyncio.ensure_future(sender.send("b", "2"))
+    await asyncio.sleep(0.01)
+    self.assertFalse(sending.done())
+
+    session = sender.get_session("b")
+    ack = SessionFrame(session.session_id, 0, 1)
+    sender.add(NknReceivedPacket("b", ack, None))
+    await asyncio.wait_for(sending, 1)
+    self.assertEqual(session.in_flight, 2)
+    sender.close()
+
+  async def test_lost_payload_sent_again_once_per_batch(self):
+    send_frame = CoroutineMock()
+    sender = SessionManager(send_frame, min_window=32)
+    await sender.send("b", "0")
+    await asyncio.sleep(0.05)
+    for i in range(1, 20):
+      await sender.send("b", "%d" % i)
+    session = sender.get_session("b")
+
+    # Payload 0 is lost, and the acknowledgements of the rest arrive
+    # together, handled before any payload is sent again.
+    send_frame.reset_mock()
+    for seq in range(1, 20):
+      ack = SessionFrame(session.session_id, seq, 0, ((1, seq + 1),))
+      sender.add(NknReceivedPacket("b", ack, None))
+    await asyncio.sleep(0)
+
+    sent = [ args[1].seq for args, _ in send_frame.await_args_list ]
+    self.assertEqual(sent, [0])
+    self.assertEqual(session.retransmitted, 1)
+    sender.close()
+
+  async def test_duplicates_suppressed(self):
+    frames = [ SessionFrame("s", seq, 0, payload="%d" % seq)
+               for seq in (0, 1, 1, 0, 2) ]
+
+    delivered = []
+    for frame in frames:
+      pkts = self.receiver.add(NknReceivedPacket("a", frame, None))
+      delivered.extend(pkt.payload for pkt in pkts)
+
+    self.assertEqual(delivered, ["0", "1", "2"])
+    self.assertEqual(self.receiver.duplicates, 2)
+
+  async def test_selective_acks(self):
+    send_frame = CoroutineMock()
+    receiver = SessionManager(send_frame)
+
+    for seq in (0, 2, 3, 5):
+      receiver.add(NknReceivedPacket(
+          "a",
+          SessionFrame("s", seq, 0, payload="x"),
+          None
+      ))
+    await asyncio.sleep(0.01)
+
+    destination, frame = send_frame.await_args[0]
+    self.assertEqual(destination, "a")
+    self.assertEqual(frame, SessionFrame("s", 5, 1, ((2, 4), (5, 6))))
+    receiver.close()
+
+  async def test_forgotten_state_recovered(self):
+    # A sender whose payloads below 5 were acknowledged, to a receiver which
+    # has since forgotten the session.
+    frame = SessionFrame("s", 5, 5, payload="x")
+
+    pkts = self.receiver.add(NknReceivedPacket("a", frame, None))
+
+    self.assertEqual([ pkt.payload for pkt in pkts ], ["x"])
+
+  def _receive(self, receiver, session_id, seqs, ack=0):
+    delivered = []
+    for seq in seqs:
+      frame = SessionFrame(session_id, seq, ack, payload="%d" % seq)
+      pkts = receiver.add(NknReceivedPacket("a", frame, None))
+      delivered.extend(pkt.payload for pkt in pkts)
+    return delivered
+
+  async def test_forgotten_state_not_delivered_again(self):
+    receiver = SessionManager(CoroutineMock(), max_sessions=1)
+    self.assertEqual(self._receive(receiver, "s", (0, 1, 2)), ["0", "1", "2"])
+
+    # Another session takes the place of the first, whose payloads are sent
+    # again, as their acknowledgements were lost.
+    self._receive(receiver, "t", (0,))
+    self.assertEqual(self._receive(receiver, "s", (0, 1, 2, 3)), ["3"])
+    self.assertEqual(receiver.duplicates, 3)
+
+    receiver.close()
+    self.assertEqual(self._receive(receiver, "s", (3, 4)), ["4"])
+    self.assertEqual(receiver.duplicates, 4)
+    receiver.close()
+
+  async def test_dropped_payloads_sent_again(self):
+    send_frame = CoroutineMock()
+    sender = SessionManager(send_frame, initial_rto=0.02)
+    for i in range(3):
+      await sender.send("b", "%d" % i)
+    session = sender.get_session("b")
+
+    # Payloads 1 and 2 arrive, then the receiver forgets them, before
+    # payload 0 is sent again.
+    ack = SessionFrame(session.session_id, 2, 0, ((1, 3),))
+    sender.add(NknReceivedPacket("b", ack, None))
+    ack = SessionFrame(session.session_id, 0, 1)
+    sender.add(NknReceivedPacket("b", ack, None))
+    self.assertEqual(session.in_flight, 2)
+
+    # Sent again once their timeouts pass, at least the shortest timeout.
+    send_frame.reset_mock()
+    await asyncio.sleep(0.3)
+    sent = { args[1].seq for args, _ in send_frame.await_args_list }
+    self.assertEqual(sent, {1, 2})
+    sender.close()
+
+  async def test_session_fails_once_held_too_long(self):
+    sender = SessionManager(
+        CoroutineMock(),
+        holding_secs=0.05,
+        initial_rto=0.02
+    )
+    await sender.send("b", "0")
+    session = sender.get_session("b")
+
+    with self.assertRaises(DeliveryError):
+      await asyncio.wait_for(sender.flush(), 1)
+    self.assertGreater(session.retransmitted, 0)
+
+    # The next payload starts a new session.
+    await sender.send("b", "1")
+    self.assertIsNot(sender.get_session("b"), session)
+    sender.close()
+
+  async def test_other_packets_passed_through(self):
+    pkt = NknReceivedPacket("a", "payload", None)
+
+    self.assertEqual(self.receiver.add(pkt), [ pkt ])
+
+
+if __name__ == "__main__":
+  asynctest.main()
@@ -0,0 +1,142 @@
+import asyncio
+import asynctest
+from concurrent.futures import ThreadPoolExecutor
+from nacl.signing import SigningKey
+
+from nkn_client.client.signing import PacketSigner, PacketVerifier
+
+
+class TestPacketSigner(asynctest.TestCase):
+  def setUp(self):
+    self.key = SigningKey.generate()
+
+  def _verify(self, data, signature):
+    self.key.verify_key.verify(data, bytes.fromhex(signature))
+
+  async def test_sign_on_event_loop(self):
+    signer = PacketSigner(self.key)
+
+    self._verify(b"payload", await signer.sign(b"payload"))
+    self.assertEqual(signer.signed, 1)
+    self.assertEqual(signer.batches, 0)
+
+  async def test_sign_in_batches(self):
+    signer = PacketSigner(self.key, workers=2, batch_size=4)
+    payloads = [ b"payload %d" % i for i in range(10) ]
+
+    signatures = await asyncio.gather(
+        *[ signer.sign(data) for data in payloads ]
+    )
+
+    for data, signature in zip(payloads, signatures):
+      self._verify(data, signature)
+    self.assertEqual(signer.signed, 10)
+    self.assertEqual(signer.batches, 3)
+    signer.close()
+
+  async def test_small_batches_spread_over_workers(self):
+    signer = PacketSigner(self.key, workers=4, batch_size=64)
+
+    await asyncio.gather(*[ signer.sign(b"payload") for _ in range(8) ])
+
+    self.assertEqual(signer.batches, 4)
+    signer.close()
+
+  async def test_sign_error(self):
+    signer = PacketSigner(self.key, workers=1)
+
+    signature, error = await asyncio.gather(
+        signer.sign(b"payload"),
+        signer.sign("payload"),
+        return_exceptions=True
+    )
+
+    self._verify(b"payload", signature)
+    self.assertIsInstance(error, TypeError)
+    signer.close()
+
+  async def test_sign_after_close(self):
+    signer = PacketSigner(self.key, workers=1)
+    await signer.sign(b"payload")
+    signer.close()
+
+    signature = await asyncio.wait_for(signer.sign(b"payload"), 1)
+
+    self._verify(b"payload", signature)
+    signer.close()
+
+  async def test_executor_error_fails_batch(self):
+    signer = PacketSigner(self.key, workers=1)
+    signer._executor = ThreadPoolExecutor(max_workers=1)
+    signer._executor.shutdown()
+
+    with self.assertRaises(RuntimeError):
+      await asyncio.wait_for(signer.sign(b"payload"), 1)
+
+  def test_invalid_args(self):
+    with self.assertRaises(ValueError):
+      PacketSigner(self.key, workers=-1)
+    with self.assertRaises(ValueError):
+      PacketSigner(self.key, batch_size=0)
+
+
+class TestPacketVerifier(asynctest.TestCase):
+  def setUp(self):
+    self.key = SigningKey.generate()
+    self.addr = "id." + self.key.verify_key.encode().hex()
+
+  def _packets(self):
+    signature = self.key.sign(b"payload").signature.hex()
+    return [
+      (self.addr, b"payload", signature),
+      (self.addr, b"forged", signature),
+      (self.addr, b"payload", None),
+      (self.addr, b"payload", "not hex"),
+      (self.addr, b"payload", signature[:64]),
+      ("id.notakey", b"payload", signature),
+      (None, b"payload", signature)
+    ]
+
+  async def _test_verify(self, verifier):
+    results = await verifier.verify(self._packets())
+
+    self.assertEqual(results, [True, False, None] + [False] * 4)
+    self.assertEqual(
+        verifier.stats(),
+        {"verified": 1, "failed": 5, "unsigned": 1}
+    )
+    verifier.close()
+
+  async def test_verify_on_event_loop(self):
+    await self._test_verify(PacketVerifier())
+
+  async def test_verify_on_threads(self):
+    await self._test_verify(PacketVerifier(workers=2))
+
+  async def test_verify_after_close(self):
+    verifier = PacketVerifier(workers=1)
+    await verifier.verify(self._packets()[:1])
+    verifier.close()
+
+    results = await asyncio.wait_for(
+        verifier.verify(self._packets()[:1]),
+        1
+    )
+
+    self.assertEqual(results, [True])
+    verifier.close()
+
+  async def test_keys_cached(self):
+    verifier = PacketVerifier(cache_size=2)
+    packets = self._packets()[:1]
+
+    await verifier.verify(packets)
+    key = verifier._keys.get(self.addr)
+    await verifier.verify(packets)
+
+    self.assertIs(verifier._keys.get(self.addr), key)
+    self.assertEqual(verifier.verified, 2)
+
+
+if __name__ == "__main__":
+  asynctest.main()
@@ -2,8 +2,11 @@ import functools
 import json
 import responses
 import unittest
+from unittest.mock import patch
 
+from nkn_client.cache import ChainCache
 import nkn_client.jsonrpc.api
+from nkn_client.metrics import MetricsRegistry
 
 
 class TestNknJsonRpcApi(unittest.TestCase):
@@ -353,6 +356,244 @@ class TestNknJsonRpcApi(unittest.TestCase):
     actual = self._with_success_response(method, expected)
     self.assertEqual(actual, expected)
 
+  def test_calls_reuse_session(self):
+    with patch.object(
+        self._api._session,
+        "post",
+        wraps=self._api._session.post
+    ) as mock_post:
+      self._with_success_response(self._api.get_block_count, 1)
+      self._with_success_response(self._api.get_block_count, 2)
+
+    self.assertEqual(mock_post.call_count, 2)
+
+  def test_session_retries_configured(self):
+    api = nkn_client.jsonrpc.api.NknJsonRpcApi(
+        self._host,
+        max_retries=3,
+        backoff_factor=0.5
+    )
+    adapter = api._session.get_adapter(self._api._url)
+
+    self.assertEqual(adapter.max_retries.total, 3)
+    self.assertEqual(adapter.max_retries.backoff_factor, 0.5)
+
+  def test_iter_blocks_yields_in_order(self):
+    def resp_callback(request):
+      req_body = json.loads(request.body)
+      height = req_body["params"]["height"]
+      resp_body = {
+        "jsonrpc": "2.0",
+        "result": {"header": {"height": height}},
+        "id": req_body["id"]
+      }
+      return (200, {}, json.dumps(resp_body))
+
+    method = lambda: [
+      block["header"]["height"]
+      for block in self._api.iter_blocks(3, 20, concurrency=4)
+    ]
+    actual = self._with_rpc_response(method, resp_callback)
+
+    self.assertEqual(actual, list(range(3, 20)))
+
+  def test_iter_blocks_transactions_only(self):
+    methods = []
+    def resp_callback(request):
+      req_body = json.loads(request.body)
+      methods.append(req_body["method"])
+      resp_body = {"jsonrpc": "2.0", "result": {}, "id": req_body["id"]}
+      return (200, {}, json.dumps(resp_body))
+
+    method = lambda: list(
+        self._api.iter_blocks(0, 2, transactions_only=True)
+    )
+    _ = self._with_rpc_response(method, resp_callback)
+
+    self.assertEqual(methods, ["getblocktxsbyheight"] * 2)
+
+  def test_get_block_uses_cache(self):
+    self._api = nkn_client.jsonrpc.api.NknJsonRpcApi(
+        self._host,
+        cache=ChainCache()
+    )
+    method = functools.partial(self._api.get_block, height=1)
+    expected = {
+      "hash": "5f85d1286801c2f1129a02b0b19a3312f8113aaa073b5987346c59e27a12bdc6"
+    }
+
+    actual = self._with_success_response(method, expected)
+    self.assertEqual(actual, expected)
+
+    # Served from the cache, without a server response.
+    self.assertEqual(method(), expected)
+    self.assertEqual(self._api.get_block(hash=expected["hash"]), expected)
+
+  def test_get_transaction_uses_cache(self):
+    cache = ChainCache()
+    self._api = nkn_client.jsonrpc.api.NknJsonRpcApi(self._host, cache=cache)
+    method = functools.partial(self._api.get_transaction, "327bb43c")
+    expected = {"hash": "327bb43c"}
+
+    _ = self._with_success_response(method, expected)
+    actual = method()
+
+    self.assertEqual(actual, expected)
+    self.assertEqual(cache.stats()["hits"], 1)
+
+  def test_calls_recorded_in_metrics(self):
+    metrics = MetricsRegistry()
+    self._api = nkn_client.jsonrpc.api.NknJsonRpcApi(
+        self._host,
+        metrics=metrics
+    )
+
+    _ = self._with_success_response(self._api.get_block_count, 270)
+    with self.assertRaises(RuntimeError):
+      _ = self._with_rpc_response(
+          self._api.get_block_count,
+          lambda request: (500, {}, "")
+      )
+
+    actual = metrics.snapshot()["http"]["getblockcount"]
+    self.assertEqual(actual["calls"], 2)
+    self.assertEqual(actual["errors"], 1)
+    self.assertGreater(actual["bytes_sent"], 0)
+    self.assertGreater(actual["bytes_received"], 0)
+
+  def test_close_closes_session(self):
+    with patch.object(self._api._session, "close") as mock_close:
+      with self._api:
+        pass
+
+    mock_close.assert_called_once()
+
+
+class TestNknJsonRpcBatch(unittest.TestCase):
+  def setUp(self):
+    self._host = "hostname"
+    self._api = nkn_client.jsonrpc.api.NknJsonRpcApi(self._host)
+
+  @responses.activate
+  def _with_batch_response(self, batch, resp_cb, **kwargs):
+    responses.add_callback(
+        responses.POST,
+        "http://%s/" % (self._host),
+        callback=resp_cb
+    )
+    return batch.execute(**kwargs)
+
+  def _reversed_results(self, results, requests=None):
+    # Responds to each call with the matching result, in reverse order.
+    def resp_callback(request):
+      req_body = json.loads(request.body)
+      if requests is not None:
+        requests.append(req_body)
+
+      resp_body = []
+      for req in req_body:
+        result = results[req["method"]]
+        if isinstance(result, Exception):
+          resp_body.append({
+            "jsonrpc": "2.0",
+            "error": {"code": -1, "message": str(result)},
+            "id": req["id"]
+          })
+        else:
+          resp_body.append({"jsonrpc": "2.0", "result": result, "id": req["id"]})
+      resp_body.reverse()
+
+      return (200, {}, json.dumps(resp_body))
+    return resp_callback
+
+  def test_execute_returns_results_in_order(self):
+    batch = self._api.batch()
+    self.assertEqual(batch.get_block_count(), 0)
+    self.assertEqual(batch.get_version(), 1)
+
+    callback = self._reversed_results({
+      "getblockcount": 270,
+      "getversion": "v0.1"
+    })
+    actual = self._with_batch_response(batch, callback)
+
+    self.assertEqual(actual, [270, "v0.1"])
+    self.assertEqual(len(batch), 0)
+
+  def test_execute_splits_large_batches(self):
+    requests = []
+    batch = self._api.batch(max_size=2)
+    for height in range(5):
+      batch.get_block(height=height)
+
+    callback = self._reversed_results({"getblock": {}}, requests)
+    actual = self._with_batch_response(batch, callback)
+
+    self.assertEqual(len(actual), 5)
+    self.assertEqual([ len(req) for req in requests ], [2, 2, 1])
+
+  def test_execute_raises_errors(self):
+    batch = self._api.batch()
+    batch.get_block_count()
+    batch.get_transaction("deadbeef")
+
+    callback = self._reversed_results({
+      "getblockcount": 270,
+      "gettransaction": Exception("unknown transaction")
+    })
+    with self.assertRaises(RuntimeError):
+      _ = self._with_batch_response(batch, callback)
+
+  def test_execute_returns_errors(self):
+    batch = self._api.batch()
+    batch.get_block_count()
+    batch.get_transaction("deadbeef")
+
+    callback = self._reversed_results({
+      "getblockcount": 270,
+      "gettransaction": Exception("unknown transaction")
+    })
+    actual = self._with_batch_response(batch, callback, raise_errors=False)
+
+    self.assertEqual(actual[0], 270)
+    self.assertIsInstance(actual[1], RuntimeError)
+
+  def test_execute_fails_with_missing_response(self):
+    batch = self._api.batch()
+    batch.get_block_count()
+    batch.get_version()
+
+    def resp_callback(request):
+      req_body = json.loads(request.body)
+      resp_body = [{"jsonrpc": "2.0", "result": 1, "id": req_body[0]["id"]}]
+      return (200, {}, json.dumps(resp_body))
+
+    with self.assertRaises(RuntimeError):
+      _ = self._with_batch_response(batch, resp_callback)
+
+  def test_context_manager_executes(self):
+    callback = self._reversed_results({"getblockcount": 270})
+
+    with responses.RequestsMock() as mock:
+      mock.add_callback(
+          responses.POST,
+          "http://%s/" % (self._host),
+          callback=callback
+      )
+      with self._api.batch() as batch:
+        batch.get_block_count()
+
+    self.assertEqual(batch.results, [270])
+
+  def test_non_queueable_methods_raise(self):
+    batch = self._api.batch()
+
+    with self.assertRaises(RuntimeError):
+      batch.batch()
+    with self.assertRaises(RuntimeError):
+      batch.iter_blocks(0, 10)
+    self.assertEqual(len(batch), 0)
+
 
 if __name__ == "__main__":
   unittest.main()
@@ -0,0 +1,151 @@
+from aiohttp import web
+from aiohttp import test_utils
+import asyncio
+import asynctest
+
+from nkn_client.jsonrpc.async_api import AsyncNknJsonRpcApi
+
+
+class TestAsyncNknJsonRpcApi(asynctest.TestCase):
+  async def setUp(self):
+    self._requests = []
+    self._responder = None
+
+    app = web.Application()
+    app.router.add_post("/", self._handle)
+    self._server = test_utils.TestServer(app)
+    await self._server.start_server(loop=self.loop)
+
+    self._api = AsyncNknJsonRpcApi(
+        "%s:%d" % (self._server.host, self._server.port)
+    )
+
+  async def tearDown(self):
+    await self._api.close()
+    await self._server.close()
+
+  async def _handle(self, request):
+    body = await request.json()
+    self._requests.append(body)
+    resp = self._responder(body)
+    if asyncio.iscoroutine(resp):
+      resp = await resp
+    return resp
+
+  def _respond_with(self, results):
+    def responder(body):
+      calls = body if isinstance(body, list) else [ body ]
+      resp = [
+        {"jsonrpc": "2.0", "result": results[call["method"]], "id": call["id"]}
+        for call in calls
+      ]
+      if not isinstance(body, list):
+        resp = resp[0]
+      return web.json_response(resp)
+    self._responder = responder
+
+  async def test_get_latest_block_height_succeeds(self):
+    expected = 5
+    self._respond_with({"getlatestblockheight": expected})
+
+    actual = await self._api.get_latest_block_height()
+
+    self.assertEqual(actual, expected)
+
+  async def test_get_block_sends_params(self):
+    expected = {"hash": "5f85d128"}
+    self._respond_with({"getblock": expected})
+
+    actual = await self._api.get_block(height=1)
+
+    self.assertEqual(actual, expected)
+    self.assertEqual(self._requests[0]["params"], {"height": 1})
+
+  async def test_calls_fail_with_wrong_id(self):
+    self._responder = lambda body: web.json_response(
+        {"jsonrpc": "2.0", "result": 5, "id": "BAD:%s" % body["id"]}
+    )
+
+    with self.assertRaises(RuntimeError):
+      _ = await self._api.get_latest_block_height()
+
+  async def test_calls_fail_with_error(self):
+    self._responder = lambda body: web.json_response(
+        {"jsonrpc": "2.0", "error": {"code": -1}, "id": body["id"]}
+    )
+
+    with self.assertRaises(RuntimeError):
+      _ = await self._api.get_latest_block_height()
+
+  async def test_calls_retry_unavailable_server(self):
+    self._api._max_retries = 2
+    self._respond_with({"getversion": "v0.1"})
+    respond = self._responder
+
+    def flaky(body):
+      if len(self._requests) < 3:
+        return web.Response(status=503)
+      return respond(body)
+    self._responder = flaky
+
+    actual = await self._api.get_version()
+
+    self.assertEqual(actual, "v0.1")
+    self.assertEqual(len(self._requests), 3)
+
+  async def test_calls_reuse_session(self):
+    self._respond_with({"getblockcount": 270})
+
+    await self._api.get_block_count()
+    session = self._api._session
+    await self._api.get_block_count()
+
+    self.assertIs(self._api._session, session)
+
+  async def test_batch_returns_results_in_order(self):
+    self._respond_with({"getblockcount": 270, "getversion": "v0.1"})
+
+    async with self._api.batch() as batch:
+      batch.get_block_count()
+      batch.get_version()
+
+    self.assertEqual(batch.results, [270, "v0.1"])
+    self.assertEqual(len(self._requests), 1)
+
+  async def test_iter_blocks_yields_in_order(self):
+    async def responder(body):
+      height = body["params"]["height"]
+      # Later heights are answered sooner, so they complete out of order.
+      await asyncio.sleep(0.001 * (height % 4))
+      return web.json_response({
+        "jsonrpc": "2.0",
+        "result": {"header": {"height": height}},
+        "id": body["id"]
+      })
+    self._responder = responder
+
+    actual = []
+    async for block in self._api.iter_blocks(0, 16, concurrency=4):
+      actual.append(block["header"]["height"])
+
+    self.assertEqual(actual, list(range(16)))
+
+  async def test_iter_blocks_bounds_in_flight_requests(self):
+    in_flight = []
+    current = 0
+    async def responder(body):
+      nonlocal current
+      current += 1
+      in_flight.append(current)
+      await asyncio.sleep(0.001)
+      current -= 1
+      return web.json_response(
+          {"jsonrpc": "2.0", "result": {}, "id": body["id"]}
+      )
+    self._responder = responder
+
+    async for _ in self._api.iter_blocks(0, 12, concurrency=3):
+      pass
+
+    self.assertLessEqual(max(in_flight), 3)
+    self.assertEqual(len(self._requests), 12)
@@ -0,0 +1,122 @@
+import asynctest
+from asynctest import CoroutineMock, MagicMock
+
+from nkn_client.jsonrpc.mempool import (
+  ADDED,
+  REMOVED,
+  MempoolEvent,
+  MempoolWatcher
+)
+
+
+class TestMempoolWatcher(asynctest.TestCase):
+  def setUp(self):
+    self._api = MagicMock()
+    self._api.get_raw_mempool = CoroutineMock()
+    self._api.get_transaction = CoroutineMock(
+        side_effect=lambda h: {"hash": h}
+    )
+
+  async def test_reports_only_changes(self):
+    watcher = MempoolWatcher(self._api)
+    self._api.get_raw_mempool.side_effect = [
+      ["a", "b"],
+      ["b", "c"]
+    ]
+
+    first = await watcher.poll()
+    second = await watcher.poll()
+
+    self.assertEqual(
+        first,
+        [MempoolEvent(ADDED, "a", None), MempoolEvent(ADDED, "b", None)]
+    )
+    self.assertEqual(
+        second,
+        [MempoolEvent(ADDED, "c", None), MempoolEvent(REMOVED, "a", None)]
+    )
+
+  async def test_reappearing_transaction_not_reported(self):
+    watcher = MempoolWatcher(self._api)
+    self._api.get_raw_mempool.side_effect = [["a"], [], ["a"]]
+
+    _ = await watcher.poll()
+    _ = await watcher.poll()
+    actual = await watcher.poll()
+
+    self.assertEqual(actual, [])
+
+  async def test_removed_hashes_expire(self):
+    watcher = MempoolWatcher(self._api, expiry=0)
+    self._api.get_raw_mempool.side_effect = [["a"], [], ["a"]]
+
+    _ = await watcher.poll()
+    _ = await watcher.poll()
+    actual = await watcher.poll()
+
+    self.assertEqual(actual, [MempoolEvent(ADDED, "a", None)])
+
+  async def test_fetches_new_transactions(self):
+    watcher = MempoolWatcher(self._api, fetch_transactions=True)
+    self._api.get_raw_mempool.side_effect = [["a"], ["a", "b"]]
+
+    _ = await watcher.poll()
+    actual = await watcher.poll()
+
+    self.assertEqual(actual, [MempoolEvent(ADDED, "b", {"hash": "b"})])
+    self.assertEqual(self._api.get_transaction.await_count, 2)
+
+  async def test_failed_fetch_reported_again(self):
+    watcher = MempoolWatcher(self._api, fetch_transactions=True)
+    self._api.get_raw_mempool.return_value = ["a"]
+    self._api.get_transaction.side_effect = [ OSError(), {"hash": "a"} ]
+
+    with self.assertRaises(OSError):
+      await watcher.poll()
+    actual = await watcher.poll()
+
+    self.assertEqual(actual, [MempoolEvent(ADDED, "a", {"hash": "a"})])
+
+  async def test_full_transactions_not_fetched(self):
+    watcher = MempoolWatcher(self._api, fetch_transactions=True)
+    self._api.get_raw_mempool.return_value = [{"hash": "a"}]
+
+    actual = await watcher.poll()
+
+    self.assertEqual(actual, [MempoolEvent(ADDED, "a", {"hash": "a"})])
+    self._api.get_transaction.assert_not_awaited()
+
+  async def test_interval_adapts(self):
+    watcher = MempoolWatcher(self._api, min_interval=1, max_interval=4)
+    self._api.get_raw_mempool.side_effect = [[], [], ["a"]]
+
+    _ = await watcher.poll()
+    self.assertEqual(watcher.interval, 1.5)
+    _ = await watcher.poll()
+    self.assertEqual(watcher.interval, 2.25)
+    _ = await watcher.poll()
+    self.assertEqual(watcher.interval, 1.125)
+
+  async def test_iterates_events(self):
+    watcher = MempoolWatcher(self._api, min_interval=0)
+    self._api.get_raw_mempool.side_effect = [["a"], ["b"]]
+
+    actual = []
+    async for event in watcher:
+      actual.append(event)
+      if len(actual) == 3:
+        break
+
+    self.assertEqual(
+        [ (event.kind, event.hash) for event in actual ],
+        [(ADDED, "a"), (ADDED, "b"), (REMOVED, "a")]
+    )
+
+  async def test_iteration_survives_failed_polls(self):
+    watcher = MempoolWatcher(self._api, min_interval=0, max_interval=0)
+    self._api.get_raw_mempool.side_effect = [ OSError(), ["a"] ]
+
+    async for event in watcher:
+      break
+
+    self.assertEqual((event.kind, event.hash), (ADDED, "a"))
@@ -0,0 +1,159 @@
+from aiohttp import web
+from aiohttp import test_utils
+import asyncio
+import asynctest
+import json
+import responses
+import time
+import unittest
+
+from nkn_client.jsonrpc.pool import (
+  AsyncNknJsonRpcPool,
+  Endpoint,
+  NknJsonRpcPool
+)
+
+
+class TestEndpoint(unittest.TestCase):
+  def test_score_prefers_unmeasured(self):
+    measured = Endpoint("a")
+    measured.record_success(0.1)
+
+    self.assertLess(Endpoint("b").score(10.0), measured.score(10.0))
+
+  def test_failures_inflate_score(self):
+    endpoint = Endpoint("a")
+    endpoint.record_success(0.1)
+    before = endpoint.score(10.0)
+    endpoint.record_failure(0)
+
+    self.assertGreater(endpoint.score(10.0), before)
+
+  def test_percentile(self):
+    endpoint = Endpoint("a", window=100)
+    for latency in range(1, 101):
+      endpoint.record_success(latency / 1000.0)
+
+    self.assertAlmostEqual(endpoint.percentile(95), 0.095)
+    self.assertIsNone(Endpoint("b").percentile(95))
+
+
+class TestNknJsonRpcPool(unittest.TestCase):
+  def setUp(self):
+    self._hosts = ["host-a", "host-b"]
+    self._calls = []
+
+  def _add_host(self, host, status=200, delay=0):
+    def resp_callback(request):
+      self._calls.append(host)
+      time.sleep(delay)
+      req_body = json.loads(request.body)
+      resp_body = {"jsonrpc": "2.0", "result": host, "id": req_body["id"]}
+      return (status, {}, json.dumps(resp_body))
+
+    responses.add_callback(
+        responses.POST,
+        "http://%s/" % (host),
+        callback=resp_callback
+    )
+
+  @responses.activate
+  def test_fails_over_to_next_endpoint(self):
+    self._add_host("host-a", status=500)
+    self._add_host("host-b")
+    pool = NknJsonRpcPool(self._hosts)
+
+    actual = pool.get_version()
+
+    self.assertEqual(actual, "host-b")
+    self.assertEqual(self._calls, ["host-a", "host-b"])
+    self.assertTrue(pool.endpoint_stats()[0]["down"])
+
+  @responses.activate
+  def test_routes_to_fastest_endpoint(self):
+    self._add_host("host-a")
+    self._add_host("host-b")
+    pool = NknJsonRpcPool(self._hosts)
+    pool._endpoints[0].record_success(0.5)
+    pool._endpoints[1].record_success(0.1)
+
+    actual = pool.get_version()
+
+    self.assertEqual(actual, "host-b")
+
+  @responses.activate
+  def test_all_endpoints_failing_raises(self):
+    self._add_host("host-a", status=500)
+    self._add_host("host-b", status=500)
+    pool = NknJsonRpcPool(self._hosts)
+
+    with self.assertRaises(RuntimeError):
+      _ = pool.get_version()
+
+  @responses.activate
+  def test_hedges_slow_endpoint(self):
+    self._add_host("host-a", delay=0.5)
+    self._add_host("host-b")
+    pool = NknJsonRpcPool(self._hosts, hedge=True, hedge_delay=0.01)
+
+    actual = pool.get_latest_block_height()
+    pool.close()
+
+    self.assertEqual(actual, "host-b")
+
+  @responses.activate
+  def test_does_not_hedge_other_methods(self):
+    self._add_host("host-a", delay=0.05)
+    self._add_host("host-b")
+    pool = NknJsonRpcPool(self._hosts, hedge=True, hedge_delay=0.01)
+
+    actual = pool.get_version()
+
+    self.assertEqual(actual, "host-a")
+    self.assertEqual(self._calls, ["host-a"])
+
+
+class TestAsyncNknJsonRpcPool(asynctest.TestCase):
+  async def setUp(self):
+    self._servers = []
+    self._delays = {}
+
+  async def tearDown(self):
+    for server in self._servers:
+      await server.close()
+
+  async def _start_server(self, name, delay=0):
+    async def handle(request):
+      body = await request.json()
+      await asyncio.sleep(delay)
+      return web.json_response(
+          {"jsonrpc": "2.0", "result": name, "id": body["id"]}
+      )
+
+    app = web.Application()
+    app.router.add_post("/", handle)
+    server = test_utils.TestServer(app)
+    await server.start_server(loop=self.loop)
+    self._servers.append(server)
+    return "%s:%d" % (server.host, server.port)
+
+  async def test_hedges_slow_endpoint(self):
+    hosts = [
+      await self._start_server("slow", delay=0.5),
+      await self._start_server("fast")
+    ]
+    pool = AsyncNknJsonRpcPool(hosts, hedge=True, hedge_delay=0.01)
+
+    actual = await pool.get_websocket_address("identifier.pubkey")
+    await pool.close()
+
+    self.assertEqual(actual, "fast")
+
+  async def test_fails_over_to_next_endpoint(self):
+    hosts = ["127.0.0.1:1", await self._start_server("up")]
+    pool = AsyncNknJsonRpcPool(hosts)
+
+    actual = await pool.get_version()
+    await pool.close()
+
+    self.assertEqual(actual, "up")
@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from nkn_client.cache import ChainCache, LruCache
+
+
+class TestLruCache(unittest.TestCase):
+  def test_get_missing_returns_none(self):
+    cache = LruCache(maxsize=2)
+
+    self.assertIsNone(cache.get("missing"))
+
+  def test_evicts_least_recently_used(self):
+    cache = LruCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    _ = cache.get("a")
+    cache.put("c", 3)
+
+    self.assertEqual(cache.get("a"), 1)
+    self.assertIsNone(cache.get("b"))
+    self.assertEqual(cache.get("c"), 3)
+    self.assertEqual(len(cache), 2)
+
+
+class TestChainCache(unittest.TestCase):
+  def setUp(self):
+    self._block = {
+      "hash": "5f85d1286801c2f1129a02b0b19a3312f8113aaa073b5987346c59e27a12bdc6",
+      "header": {"height": 1}
+    }
+
+  def test_block_indexed_by_hash_and_height(self):
+    cache = ChainCache()
+    cache.put_block(self._block, height=1)
+
+    self.assertEqual(cache.get_block(height=1), self._block)
+    self.assertEqual(cache.get_block(hash=self._block["hash"]), self._block)
+
+  def test_block_heights_not_cached_when_disabled(self):
+    cache = ChainCache(cache_heights=False)
+    cache.put_block(self._block, height=1)
+
+    self.assertIsNone(cache.get_block(height=1))
+    self.assertEqual(cache.get_block(hash=self._block["hash"]), self._block)
+
+  def test_transaction(self):
+    cache = ChainCache()
+    cache.put_transaction({"hash": "deadbeef"}, "deadbeef")
+
+    self.assertEqual(cache.get_transaction("deadbeef"), {"hash": "deadbeef"})
+
+  def test_stats_count_hits_and_misses(self):
+    cache = ChainCache()
+    cache.put_transaction({}, "a")
+    _ = cache.get_transaction("a")
+    _ = cache.get_transaction("b")
+
+    stats = cache.stats()
+    self.assertEqual(stats["hits"], 1)
+    self.assertEqual(stats["misses"], 1)
+    self.assertEqual(stats["size"], 1)
+
+  def test_disk_tier_persists(self):
+    with tempfile.TemporaryDirectory() as tmpdir:
+      path = os.path.join(tmpdir, "cache.db")
+      cache = ChainCache(path=path)
+      cache.put_block(self._block)
+      cache.close()
+
+      cache = ChainCache(path=path)
+      actual = cache.get_block(height=1)
+      cache.close()
+
+    self.assertEqual(actual, self._block)
+    self.assertEqual(cache.stats()["disk_hits"], 1)
+
+
+if __name__ == "__main__":
+  unittest.main()
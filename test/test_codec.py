@@ -0,0 +1,56 @@
+import unittest
+from unittest.mock import patch
+
+import nkn_client.codec as mod
+from nkn_client.codec import JsonCodec, get_codec
+
+
+class TestCodec(unittest.TestCase):
+  def setUp(self):
+    self._msg = {
+      "Action": "receivePacket",
+      "Src": "identifier.pubkey",
+      "Payload": "héllo",
+      "Digest": None
+    }
+
+  def _installed(self):
+    return [ name for name, (_, ok) in mod._CODECS.items() if ok ]
+
+  def test_round_trip(self):
+    for name in self._installed():
+      codec = get_codec(name)
+
+      self.assertEqual(codec.loads(codec.dumps(self._msg)), self._msg)
+      self.assertEqual(codec.loads(codec.dumpb(self._msg)), self._msg)
+      self.assertIsInstance(codec.dumps(self._msg), str)
+      self.assertIsInstance(codec.dumpb(self._msg), bytes)
+
+  def test_invalid_message_raises_value_error(self):
+    for name in self._installed():
+      with self.assertRaises(ValueError):
+        get_codec(name).loads("definitely_not_json")
+
+  def test_auto_falls_back_to_stdlib(self):
+    codecs = {
+      name: (cls, name == "json")
+      for name, (cls, _) in mod._CODECS.items()
+    }
+    with patch.object(mod, "_CODECS", codecs):
+      self.assertEqual(get_codec("auto").name, "json")
+      with self.assertRaises(ValueError):
+        get_codec("orjson")
+
+  def test_unknown_codec_raises(self):
+    with self.assertRaises(ValueError):
+      get_codec("yaml")
+
+  def test_codec_instances_pass_through(self):
+    codec = JsonCodec()
+
+    self.assertIs(get_codec(codec), codec)
+    self.assertIs(get_codec(None), mod.DEFAULT_CODEC)
+
+
+if __name__ == "__main__":
+  unittest.main()
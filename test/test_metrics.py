@@ -0,0 +1,123 @@
+import unittest
+
+from nkn_client.metrics import (
+  ERROR,
+  OK,
+  TIMEOUT,
+  MetricsRegistry,
+  REGISTRY,
+  get_registry
+)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+  def setUp(self):
+    self._metrics = MetricsRegistry(buckets=(0.01, 0.1))
+
+  def test_snapshot_counts_outcomes(self):
+    self._metrics.record("http", "getblock", 0.005, sent=10, received=100)
+    self._metrics.record("http", "getblock", 0.05, outcome=ERROR)
+    self._metrics.record("http", "getblock", 1.0, outcome=TIMEOUT)
+
+    actual = self._metrics.snapshot()["http"]["getblock"]
+
+    self.assertEqual(actual["calls"], 3)
+    self.assertEqual(actual["errors"], 1)
+    self.assertEqual(actual["timeouts"], 1)
+    self.assertEqual(actual["latency"], [(0.01, 1), (0.1, 1), (None, 1)])
+    self.assertAlmostEqual(actual["latency_sum"], 1.055)
+    self.assertEqual(actual["bytes_sent"], 10)
+    self.assertEqual(actual["bytes_received"], 100)
+
+  def test_record_received(self):
+    self._metrics.record("websocket", "getblock", 0.005, sent=10)
+    self._metrics.record_received("websocket", "getblock", 50)
+
+    actual = self._metrics.snapshot()["websocket"]["getblock"]
+
+    self.assertEqual(actual["bytes_received"], 50)
+
+  def test_reset(self):
+    self._metrics.record("http", "getblock", 0.005)
+    self._metrics.reset()
+
+    self.assertEqual(self._metrics.snapshot(), {})
+
+  def test_to_prometheus(self):
+    self._metrics.record("http", "getblock", 0.005, sent=10, received=100)
+    self._metrics.record("http", "getblock", 0.05, outcome=ERROR)
+
+    lines = self._metrics.to_prometheus().splitlines()
+    labels = 'transport="http",method="getblock"'
+
+    self.assertIn("# TYPE nkn_rpc_latency_seconds histogram", lines)
+    self.assertIn('nkn_rpc_calls_total{%s,outcome="ok"} 1' % labels, lines)
+    self.assertIn('nkn_rpc_calls_total{%s,outcome="error"} 1' % labels, lines)
+    self.assertIn(
+        'nkn_rpc_latency_seconds_bucket{%s,le="0.1"} 2' % labels,
+        lines
+    )
+    self.assertIn(
+        'nkn_rpc_latency_seconds_bucket{%s,le="+Inf"} 2' % labels,
+        lines
+    )
+    self.assertIn('nkn_rpc_latency_seconds_count{%s} 2' % labels, lines)
+    self.assertIn('nkn_rpc_bytes_sent_total{%s} 10' % labels, lines)
+
+  def test_gauges_sum_registered_functions(self):
+    first = lambda: 2
+    second = lambda: 3
+    self._metrics.register_gauge("queue_depth", first, stage="dispatch")
+    self._metrics.register_gauge("queue_depth", second, stage="dispatch")
+    self._metrics.register_gauge("queue_depth", lambda: 1, stage="inbox")
+
+    self.assertEqual(self._metrics.gauges(), {
+      "queue_depth": [ ({"stage": "dispatch"}, 5), ({"stage": "inbox"}, 1) ]
+    })
+
+    self._metrics.unregister_gauge("queue_depth", first, stage="dispatch")
+    self._metrics.unregister_gauge("queue_depth", second, stage="dispatch")
+
+    self.assertEqual(self._metrics.gauges(), {
+      "queue_depth": [ ({"stage": "inbox"}, 1) ]
+    })
+
+  def test_gauges_to_prometheus(self):
+    self._metrics.register_gauge("queue_depth", lambda: 4, stage="dispatch")
+
+    lines = self._metrics.to_prometheus().splitlines()
+
+    self.assertIn("# TYPE nkn_rpc_queue_depth gauge", lines)
+    self.assertIn('nkn_rpc_queue_depth{stage="dispatch"} 4', lines)
+
+  def test_histograms(self):
+    self._metrics.observe("send_latency_seconds", 0.005, transport="ws")
+    self._metrics.observe("send_latency_seconds", 0.5, transport="ws")
+
+    self.assertEqual(self._metrics.histograms(), {
+      "send_latency_seconds": [
+        ({"transport": "ws"}, [(0.01, 1), (0.1, 0), (None, 1)], 0.505)
+      ]
+    })
+
+    lines = self._metrics.to_prometheus().splitlines()
+    self.assertIn("# TYPE nkn_rpc_send_latency_seconds histogram", lines)
+    self.assertIn(
+        'nkn_rpc_send_latency_seconds_bucket{transport="ws",le="0.1"} 1',
+        lines
+    )
+    self.assertIn(
+        'nkn_rpc_send_latency_seconds_count{transport="ws"} 2',
+        lines
+    )
+
+    self._metrics.reset()
+    self.assertEqual(self._metrics.histograms(), {})
+
+  def test_get_registry_defaults(self):
+    self.assertIs(get_registry(), REGISTRY)
+    self.assertIs(get_registry(self._metrics), self._metrics)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+from nkn_client.rtt import RttEstimator
+
+
+class TestRttEstimator(unittest.TestCase):
+  def test_initial_rto(self):
+    rtt = RttEstimator(initial_rto=3.0)
+
+    self.assertIsNone(rtt.srtt)
+    self.assertEqual(rtt.rto, 3.0)
+
+  def test_first_sample(self):
+    rtt = RttEstimator(min_rto=0)
+    rtt.record(0.1)
+
+    self.assertAlmostEqual(rtt.srtt, 0.1)
+    self.assertAlmostEqual(rtt.rttvar, 0.05)
+    self.assertAlmostEqual(rtt.rto, 0.3)
+
+  def test_converges(self):
+    rtt = RttEstimator(min_rto=0)
+    rtt.record(1.0)
+    for _ in range(100):
+      rtt.record(0.1)
+
+    self.assertAlmostEqual(rtt.srtt, 0.1, places=3)
+    self.assertLess(rtt.rto, 0.11)
+    self.assertEqual(rtt.min_rtt, 0.1)
+    self.assertEqual(rtt.latest, 0.1)
+    self.assertEqual(rtt.samples, 101)
+
+  def test_rto_bounds(self):
+    rtt = RttEstimator(min_rto=0.2, max_rto=5.0)
+    rtt.record(0.001)
+    self.assertEqual(rtt.rto, 0.2)
+
+    rtt.record(100)
+    self.assertEqual(rtt.rto, 5.0)
+
+
+if __name__ == "__main__":
+  unittest.main()
@@ -4,14 +4,34 @@ from asynctest import CoroutineMock, MagicMock, Mock, patch
 import json
 
 from nkn_client.websocket.api_client import WebsocketApiClient
+from nkn_client.metrics import MetricsRegistry
+from nkn_client.websocket.client import DROP, WebsocketClientException
 
 class TestWebsocketApiClient(asynctest.TestCase):
   def setUp(self):
     self._client = WebsocketApiClient()
+    self._client.send = CoroutineMock(side_effect=self._send)
 
   def tearDown(self):
     pass
 
+  async def _send(self, msg):
+    written = asyncio.get_event_loop().create_future()
+    written.set_result(True)
+    return written
+
+  async def _call(self, method, timeout=1, **kwargs):
+    # Starts a call, and waits until its request is sent.
+    sent = self._client.send.await_count
+    task = asyncio.ensure_future(
+        self._client.call_rpc(method, timeout=timeout, **kwargs)
+    )
+    while self._client.send.await_count == sent:
+      await asyncio.sleep(0)
+    # Let the call learn its request was written.
+    await asyncio.sleep(0)
+    return task
+
   async def test_json_parse_fails_interrupt(self):
     msg = "definitely_not_json"
 
@@ -38,50 +58,197 @@ class TestWebsocketApiClient(asynctest.TestCase):
   async def test_call_rpc_successful_response(self):
     method = "method"
     expected = {
-      "Action": method
+      "Action": method,
+      "Result": "result"
     }
 
-    mock_send = CoroutineMock()
-    self._client.send = mock_send
-
-    mock_wait = CoroutineMock()
-    asyncio.wait_for = mock_wait
-
-    await self._client.call_rpc(method)
+    call = await self._call(method)
+    self.assertEqual(self._client.in_flight, 1)
+    await self._client.recv(json.dumps(expected))
 
-    mock_send.assert_awaited()
-
-    handlers = self._client._handlers
-    self.assertIn(method, handlers)
-    self.assertFalse(handlers[method])
+    self.assertEqual(await call, expected)
+    self.assertEqual(self._client.in_flight, 0)
+    self.assertFalse(self._client._pending[method])
 
   async def test_call_rpc_with_kwargs(self):
     method = "method"
     kwargs = {"a": "b"}
 
-    expected = json.dumps({
+    expected = {
       "Action": method,
       "a": "b"
-    })
+    }
+
+    call = await self._call(method, **kwargs)
+    await self._client.recv(json.dumps(expected))
+    await call
 
-    mock_send = CoroutineMock()
-    self._client.send = mock_send
+    self._client.send.assert_awaited()
+    self.assertEqual(
+        json.loads(self._client.send.await_args[0][0]),
+        expected
+    )
 
-    call_task = self._client.call_rpc(method, **kwargs)
-    await self._client.recv(expected)
-    await call_task
+  async def test_call_rpc_records_bytes(self):
+    metrics = MetricsRegistry()
+    self._client = WebsocketApiClient(metrics=metrics)
+    self._client.send = CoroutineMock(side_effect=self._send)
+    resp = '{"Action": "method", "Result": "\u00e9t\u00e9"}'
 
-    mock_send.assert_awaited_with(expected)
+    call = await self._call("method")
+    await self._client.recv(resp)
+    await call
+
+    sent = len(self._client.send.await_args[0][0])
+    actual = metrics.snapshot()["websocket"]["method"]
+    self.assertEqual(actual["bytes_sent"], sent)
+    self.assertEqual(actual["bytes_received"], len(resp.encode("utf-8")))
+    self.assertEqual(actual["bytes_received"], len(resp) + 2)
+
+  async def test_call_rpc_pipelined(self):
+    calls = [ await self._call("method") for _ in range(3) ]
+    other = await self._call("other")
+
+    self.assertEqual(self._client.in_flight, 4)
+
+    await self._client.recv(json.dumps({"Action": "other", "Result": "x"}))
+    for i in range(3):
+      await self._client.recv(json.dumps({"Action": "method", "Result": i}))
+
+    results = await asyncio.gather(*calls)
+    self.assertEqual([ r["Result"] for r in results ], [0, 1, 2])
+    self.assertEqual((await other)["Result"], "x")
 
   async def test_call_rpc_timeout(self):
-    asyncio.wait_for = CoroutineMock(side_effect=asyncio.TimeoutError)
     method = "method"
 
-    mock_send = CoroutineMock()
-    self._client.send = mock_send
+    with self.assertRaises(asyncio.TimeoutError):
+      await self._client.call_rpc(method, timeout=0.01)
+
+    self.assertEqual(self._client.in_flight, 0)
+
+  async def test_call_rpc_timeout_reconnects(self):
+    method = "method"
+    self._client.abort = Mock()
+
+    call = await self._call(method, timeout=0.01)
+    with self.assertRaises(asyncio.TimeoutError):
+      await call
+
+    self._client.abort.assert_called_once_with()
+    self.assertFalse(self._client._pending[method])
+
+  async def test_call_rpc_unordered_timeout_does_not_reconnect(self):
+    method = "method"
+    self._client.abort = Mock()
+
+    call = await self._call(method, timeout=0.01, ordered=False)
+    with self.assertRaises(asyncio.TimeoutError):
+      await call
+
+    self._client.abort.assert_not_called()
+    self.assertFalse(self._client._pending[method])
+
+  async def test_call_rpc_late_response_discarded(self):
+    # A call which times out before its request is written, whose response
+    # comes once it is.
+    method = "method"
+    self._client.abort = Mock()
+    written = asyncio.get_event_loop().create_future()
+    async def send(msg):
+      return written
+    self._client.send = send
+
+    with self.assertRaises(asyncio.TimeoutError):
+      await self._client.call_rpc(method, timeout=0.01)
+    written.set_result(True)
+    self._client.send = CoroutineMock(side_effect=self._send)
+
+    call = await self._call(method)
+    await self._client.recv(json.dumps({"Action": method, "Result": "late"}))
+    await self._client.recv(json.dumps({"Action": method, "Result": "mine"}))
+
+    self.assertEqual((await call)["Result"], "mine")
+    self.assertFalse(self._client._pending[method])
+    self._client.abort.assert_not_called()
+
+  async def test_call_rpc_send_fails(self):
+    method = "method"
+    self._client.send = CoroutineMock(side_effect=RuntimeError)
+
+    with self.assertRaises(RuntimeError):
+      await self._client.call_rpc(method)
+
+    self.assertFalse(self._client._pending[method])
+
+  async def test_call_rpc_fails_if_never_written(self):
+    written = asyncio.get_event_loop().create_future()
+    async def send(msg):
+      return written
+    self._client.send = send
+
+    call = asyncio.ensure_future(self._client.call_rpc("method"))
+    await asyncio.sleep(0)
+    written.set_result(False)
+
+    with self.assertRaises(WebsocketClientException):
+      await call
+
+  async def test_full_queue_keeps_responses(self):
+    self._client = WebsocketApiClient(
+        backpressure=DROP,
+        dispatch_queue_size=1
+    )
+    self._client.send = CoroutineMock(side_effect=self._send)
+    first = await self._call("getblock")
+    second = await self._call("getblock")
+    push = json.dumps({"Action": "receivePacket"})
+
+    await self._client._dispatch(push)
+    await self._client._dispatch(push)
+    self.assertEqual(self._client.dropped, 1)
+
+    # Responses wait for room instead.
+    dispatching = asyncio.ensure_future(asyncio.gather(
+        self._client._dispatch(json.dumps({"Action": "getblock", "n": 1})),
+        self._client._dispatch(json.dumps({"Action": "getblock", "n": 2}))
+    ))
+    for _ in range(3):
+      await asyncio.sleep(0.01)
+      await self._client.recv(self._client._dispatch_queue.get_nowait())
+    await dispatching
+
+    self.assertEqual((await first)["n"], 1)
+    self.assertEqual((await second)["n"], 2)
+    self.assertEqual(self._client.dropped, 1)
+
+  async def test_stray_response_dropped(self):
+    method = "method"
+    mock_interrupt = CoroutineMock()
+    self._client.interrupt = mock_interrupt
+
+    call = await self._call(method)
+    await self._client.recv(json.dumps({"Action": method}))
+    await call
+    await self._client.recv(json.dumps({"Action": method}))
+
+    mock_interrupt.assert_not_awaited()
+
+  async def test_on_connect_replays_unanswered_calls(self):
+    first = await self._call("method", a=1)
+    with self.assertRaises(asyncio.TimeoutError):
+      await self._client.call_rpc("method", timeout=0.01, a=2)
+    other = await self._call("other")
+    self._client.send.reset_mock()
+
+    await self._client.on_connect()
 
-    await self._client.call_rpc(method)
+    self.assertEqual(
+        [ json.loads(args[0]) for args, _ in self._client.send.await_args_list ],
+        [ {"Action": "method", "a": 1}, {"Action": "other"} ]
+    )
 
-    handlers = self._client._handlers
-    self.assertIn(method, handlers)
-    self.assertFalse(handlers[method])
\ No newline at end of file
+    await self._client.recv(json.dumps({"Action": "method", "Result": 1}))
+    await self._client.recv(json.dumps({"Action": "other", "Result": 2}))
+    self.assertEqual((await first)["Result"], 1)
+    self.assertEqual((await other)["Result"], 2)
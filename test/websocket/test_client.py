@@ -5,40 +5,57 @@ import threading
 import websockets
 from websockets.exceptions import ConnectionClosed
 
+from nkn_client.metrics import MetricsRegistry
 import nkn_client.websocket.client as mod
 from nkn_client.websocket.client import (
+  DROP,
   WebsocketClient,
   WebsocketClientException
 )
 
 
 class MockWebsocketsConnection(object):
-  def __init__(self):
-    self._running = True
-    self.send = CoroutineMock()
+  def __init__(self, messages=()):
+    self._closed = asyncio.Event()
+    self._messages = list(messages)
+    self.send = CoroutineMock(side_effect=self._send)
     self.recv = CoroutineMock(side_effect=self._recv)
     self.wait_closed = CoroutineMock(side_effect=self._close)
     self.close = CoroutineMock(side_effect=self._close)
+    self.writer = Mock()
+    self.writer.transport.abort = Mock(side_effect=self._close)
     self.__aiter__ = self.recv
 
   def _close(self):
-    self._running = False
+    self._closed.set()
+
+  async def _send(self, msg):
+    if self._closed.is_set():
+      raise ConnectionClosed(1006, "str")
 
   async def _recv(self):
-    if not self._running:
-      raise ConnectionClosed(1, "str")
-    val = MagicMock()
-    val.result = MagicMock(return_value="OK")
-    return val
+    if self._messages:
+      return self._messages.pop(0)
+    await self._closed.wait()
+    raise ConnectionClosed(1, "str")
 
 class TestWebsocketClient(asynctest.TestCase):
   def setUp(self):
-    self.client = WebsocketClient()
-    self.client.recv = CoroutineMock(side_effect=ConnectionClosed(1, "reason"))
+    self.metrics = MetricsRegistry()
+    self.client = WebsocketClient(metrics=self.metrics)
+    self.client.recv = CoroutineMock()
 
   def tearDown(self):
     self.client = None
 
+  def _handle_slowly(self, handled):
+    # Returns a message handler which waits until the event is set.
+    self.received = []
+    async def handle(msg):
+      self.received.append(msg)
+      await handled.wait()
+    return handle
+
   @patch("websockets.client")
   async def test_connect_opens_connection(self, mock_ws):
     mock_ws.connect = mock_connect = CoroutineMock(
@@ -50,6 +67,32 @@ class TestWebsocketClient(asynctest.TestCase):
 
     mock_connect.assert_awaited()
 
+  @patch("websockets.client")
+  async def test_connect_passes_limits(self, mock_ws):
+    mock_ws.connect = mock_connect = CoroutineMock(
+        return_value=MockWebsocketsConnection()
+    )
+    client = WebsocketClient(
+        compression=None,
+        max_size=2 ** 24,
+        max_queue=4,
+        read_limit=2 ** 20,
+        write_limit=2 ** 18
+    )
+
+    await client.connect("url")
+    await client.disconnect()
+
+    mock_connect.assert_awaited_once_with(
+        "ws://url",
+        compression=None,
+        extensions=None,
+        max_size=2 ** 24,
+        max_queue=4,
+        read_limit=2 ** 20,
+        write_limit=2 ** 18
+    )
+
   async def test_disconnect_before_connect_succeeds(self):
     # No errors raised.
     await self.client.disconnect()
@@ -62,7 +105,8 @@ class TestWebsocketClient(asynctest.TestCase):
     await self.client.connect("ws://url")
     await self.client.disconnect()
 
-    connection.wait_closed.assert_awaited()
+    connection.close.assert_awaited()
+    self.assertFalse(self.client.connected)
 
   @patch("websockets.client")
   async def test_send_one_succeeds(self, mock_ws):
@@ -72,7 +116,7 @@ class TestWebsocketClient(asynctest.TestCase):
 
     await self.client.connect("ws://url")
 
-    await self.client.send("message")
+    await (await self.client.send("message"))
     mock_send.assert_awaited()
 
     await self.client.disconnect()
@@ -85,21 +129,255 @@ class TestWebsocketClient(asynctest.TestCase):
 
     await self.client.connect("ws://url")
 
-    await self.client.send("message")
+    await (await self.client.send("message"))
     mock_send.assert_awaited()
     mock_send.reset_mock()
 
-    await self.client.send("next")
+    await (await self.client.send("next"))
     mock_send.assert_awaited()
     mock_send.reset_mock()
 
     await self.client.disconnect()
 
+  @patch("websockets.client")
+  async def test_received_messages_dispatched(self, mock_ws):
+    connection = MockWebsocketsConnection(["a", "b", "c"])
+    mock_ws.connect = CoroutineMock(return_value=connection)
+
+    await self.client.connect("ws://url")
+    while self.client.recv.await_count < 3:
+      await asyncio.sleep(0)
+    await self.client.disconnect()
+
+    self.assertEqual(
+        [ args[0] for args, _ in self.client.recv.await_args_list ],
+        ["a", "b", "c"]
+    )
+
+  @patch("websockets.client")
+  async def test_slow_handler_does_not_block_reading(self, mock_ws):
+    connection = MockWebsocketsConnection(["a", "b", "c"])
+    mock_ws.connect = CoroutineMock(return_value=connection)
+    handled = asyncio.Event()
+    self.client.recv = self._handle_slowly(handled)
+
+    await self.client.connect("ws://url")
+    await asyncio.sleep(0.01)
+
+    self.assertEqual(self.received, ["a"])
+    self.assertEqual(self.client._dispatch_queue.qsize(), 2)
+    self.assertEqual(
+        self.metrics.gauges()["queue_depth"],
+        [ ({"stage": "dispatch"}, 2), ({"stage": "send"}, 0) ]
+    )
+
+    handled.set()
+    await self.client.disconnect()
+    self.assertEqual(self.metrics.gauges(), {})
+
+  @patch("websockets.client")
+  async def test_drop_when_queue_full(self, mock_ws):
+    connection = MockWebsocketsConnection(["a", "b", "c", "d"])
+    mock_ws.connect = CoroutineMock(return_value=connection)
+    handled = asyncio.Event()
+    self.client = WebsocketClient(
+        dispatch_queue_size=2,
+        backpressure=DROP,
+        metrics=self.metrics
+    )
+    self.client.recv = self._handle_slowly(handled)
+
+    await self.client.connect("ws://url")
+    await asyncio.sleep(0.01)
+
+    self.assertEqual(self.received, ["a"])
+    self.assertEqual(self.client.dropped, 2)
+
+    handled.set()
+    await self.client.disconnect()
+
+  def test_invalid_backpressure(self):
+    with self.assertRaises(ValueError):
+      WebsocketClient(backpressure="unknown")
+
+  @patch("websockets.client")
+  async def test_first_connect_failure_raises(self, mock_ws):
+    mock_ws.connect = CoroutineMock(side_effect=OSError)
+
+    with self.assertRaises(OSError):
+      await self.client.connect("ws://url")
+
+    self.assertIsNone(self.client._task)
+    with self.assertRaises(WebsocketClientException):
+      await self.client.send("message")
+
+  @patch("websockets.client")
+  async def test_reconnects_after_connection_lost(self, mock_ws):
+    first = MockWebsocketsConnection()
+    second = MockWebsocketsConnection()
+    mock_ws.connect = CoroutineMock(side_effect=[first, OSError, second])
+    self.client._reconnect_interval_min = 0.001
+    self.client._reconnect_interval_max = 0.002
+    self.client.on_connect = CoroutineMock()
+
+    await self.client.connect("ws://url")
+    first._close()
+    await (await self.client.send("message"))
+
+    second.send.assert_awaited_once_with("message")
+    self.assertEqual(self.client.reconnects, 1)
+    self.assertEqual(self.client.on_connect.await_count, 2)
+
+    await self.client.disconnect()
+
+  @patch("websockets.client")
+  async def test_send_waits_while_reconnecting(self, mock_ws):
+    first = MockWebsocketsConnection()
+    second = MockWebsocketsConnection()
+    reconnect = asyncio.Event()
+    async def connect(url, **kwargs):
+      if mock_ws.connect.await_count > 1:
+        await reconnect.wait()
+        return second
+      return first
+    mock_ws.connect = CoroutineMock(side_effect=connect)
+    self.client._reconnect_interval_min = 0.001
+
+    await self.client.connect("ws://url")
+    first._close()
+    written = await self.client.send("message")
+    await asyncio.sleep(0.01)
+
+    self.assertFalse(written.done())
+    self.assertFalse(self.client.connected)
+
+    reconnect.set()
+    self.assertTrue(await written)
+    second.send.assert_awaited_once_with("message")
+
+    await self.client.disconnect()
+
+  @patch("websockets.client")
+  async def test_disconnect_while_reconnecting(self, mock_ws):
+    first = MockWebsocketsConnection()
+    mock_ws.connect = CoroutineMock(side_effect=[first, OSError, OSError])
+    self.client._reconnect_interval_min = 10
+
+    await self.client.connect("ws://url")
+    first._close()
+    written = await self.client.send("message")
+    await asyncio.sleep(0.01)
+    await self.client.disconnect()
+
+    self.assertFalse(await written)
+
+  @patch("websockets.client")
+  async def test_abort_reconnects(self, mock_ws):
+    first = MockWebsocketsConnection()
+    second = MockWebsocketsConnection()
+    mock_ws.connect = CoroutineMock(side_effect=[first, second])
+    self.client._reconnect_interval_min = 0.001
+
+    await self.client.connect("ws://url")
+    self.client.abort()
+    await (await self.client.send("message"))
+
+    first.writer.transport.abort.assert_called_once()
+    second.send.assert_awaited_once_with("message")
+    await self.client.disconnect()
+
+  def test_reconnect_delay_within_bounds(self):
+    client = WebsocketClient(
+        reconnect_interval_min=1,
+        reconnect_interval_max=8
+    )
+
+    for attempt in range(10):
+      delay = client._get_reconnect_delay(attempt)
+      self.assertGreaterEqual(delay, 1)
+      self.assertLessEqual(delay, min(8, 2 ** attempt))
+
   async def test_send_after_disconnect_fails(self):
     await self.client.disconnect()
     with self.assertRaises(WebsocketClientException):
       await self.client.send("message")
 
 
+class TestWebsocketClientWithServer(asynctest.TestCase):
+  async def setUp(self):
+    self.received = []
+    self.server = await websockets.serve(self._handle, "127.0.0.1", 0)
+    port = self.server.sockets[0].getsockname()[1]
+    self.hostname = "127.0.0.1:%d" % port
+
+  async def tearDown(self):
+    self.server.close()
+    await self.server.wait_closed()
+
+  async def _handle(self, socket, path):
+    async for msg in socket:
+      self.received.append(msg)
+
+  async def test_queued_messages_written_together(self):
+    metrics = MetricsRegistry()
+    client = WebsocketClient(metrics=metrics)
+    await client.connect(self.hostname)
+
+    expected = [ "message %d" % i for i in range(100) ] + [ b"bytes" ]
+    await self._send_all(client, expected)
+    self.assertEqual(client.messages_written, len(expected))
+    self.assertLess(client.writes, len(expected))
+
+    (_, counts, _), = metrics.histograms()["send_latency_seconds"]
+    self.assertEqual(sum( count for _, count in counts ), len(expected))
+
+    await client.disconnect()
+
+  async def _send_all(self, client, expected):
+    # Sends the messages, and waits until the server has received them.
+    written = [ await client.send(msg) for msg in expected ]
+    self.assertTrue(all(await asyncio.gather(*written)))
+    while len(self.received) < len(expected):
+      await asyncio.sleep(0.01)
+    self.assertEqual(self.received, expected)
+
+  async def test_compression_negotiated(self):
+    client = WebsocketClient()
+    await client.connect(self.hostname)
+
+    extension, = client._socket.extensions
+    self.assertEqual(extension.name, "permessage-deflate")
+    await self._send_all(client, [ "x" * 4096 ] * 10 + [ "message" ])
+
+    await client.disconnect()
+
+  async def test_compression_settings(self):
+    client = WebsocketClient(
+        compression_level=9,
+        compression_window_bits=10
+    )
+    await client.connect(self.hostname)
+
+    extension, = client._socket.extensions
+    self.assertEqual(extension.local_max_window_bits, 10)
+    self.assertEqual(extension.remote_max_window_bits, 10)
+    await self._send_all(client, [ "x" * 4096 ] * 10)
+
+    await client.disconnect()
+
+  async def test_compression_disabled(self):
+    client = WebsocketClient(compression=None)
+    await client.connect(self.hostname)
+
+    self.assertEqual(client._socket.extensions, [])
+    await self._send_all(client, [ "x" * 4096 ] * 10)
+
+    await client.disconnect()
+
+  def test_unknown_compression(self):
+    with self.assertRaises(ValueError):
+      WebsocketClient(compression="gzip")
+
+
 if __name__ == "__main__":
   unittest.main()
\ No newline at end of file
@@ -0,0 +1,86 @@
+import asyncio
+import asynctest
+from asynctest import CoroutineMock, Mock
+import time
+
+from nkn_client.rtt import RttEstimator
+from nkn_client.websocket.heartbeat import HeartbeatMonitor
+
+
+class MockClient(object):
+  def __init__(self):
+    self.connected = True
+    self.last_received = time.monotonic()
+    self.heartbeat = CoroutineMock(side_effect=self._heartbeat)
+    self.abort = Mock()
+    self.answer = True
+
+  async def _heartbeat(self, timeout=None):
+    if not self.answer:
+      await asyncio.sleep(timeout)
+      raise asyncio.TimeoutError()
+    self.last_received = time.monotonic()
+
+
+class TestHeartbeatMonitor(asynctest.TestCase):
+  def setUp(self):
+    self._client = MockClient()
+    self._monitor = HeartbeatMonitor(
+        self._client,
+        interval=0.02,
+        max_missed=2,
+        min_timeout=0.01
+    )
+
+  async def tearDown(self):
+    await self._monitor.stop()
+
+  async def test_beats_when_idle(self):
+    self._monitor.start()
+    await asyncio.sleep(0.1)
+
+    self.assertGreater(self._monitor.sent, 1)
+    self.assertEqual(self._monitor.rtt.samples, self._monitor.sent)
+    self._client.abort.assert_not_called()
+
+  async def test_skips_beats_while_traffic_flows(self):
+    self._monitor.start()
+    for _ in range(10):
+      self._client.last_received = time.monotonic()
+      await asyncio.sleep(0.01)
+
+    self.assertEqual(self._monitor.sent, 0)
+
+  async def test_skips_beats_while_disconnected(self):
+    self._client.connected = False
+    self._client.last_received = 0
+    self._monitor.start()
+    await asyncio.sleep(0.05)
+
+    self.assertEqual(self._monitor.sent, 0)
+
+  async def test_aborts_after_missed_beats(self):
+    self._client.answer = False
+    self._monitor.start()
+    await asyncio.sleep(0.1)
+
+    self._client.abort.assert_called()
+    self.assertGreaterEqual(self._monitor.deaths, 1)
+    self.assertEqual(self._monitor.rtt.samples, 0)
+
+  def test_timeout_bounded_by_rtt(self):
+    monitor = HeartbeatMonitor(
+        self._client,
+        interval=5,
+        min_timeout=0.01,
+        estimator=RttEstimator(min_rto=0)
+    )
+    for _ in range(10):
+      monitor.rtt.record(0.001)
+    self.assertEqual(monitor._get_timeout(), 0.01)
+
+    monitor.rtt.record(0.5)
+    self.assertEqual(monitor._get_timeout(), monitor.rtt.rto)
+
+    monitor.rtt.record(100)
+    self.assertEqual(monitor._get_timeout(), 5)
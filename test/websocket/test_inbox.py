@@ -0,0 +1,130 @@
+import asyncio
+import asynctest
+import os
+import tempfile
+
+from nkn_client.websocket.client import BLOCK
+from nkn_client.websocket.inbox import DROP_NEWEST, DROP_OLDEST, SPILL, Inbox
+
+
+class TestInbox(asynctest.TestCase):
+  async def _drain(self, inbox):
+    packets = []
+    while inbox.qsize():
+      packets.append(await inbox.get())
+    return packets
+
+  async def test_unbounded(self):
+    inbox = Inbox()
+    for i in range(100):
+      await inbox.put(i)
+
+    self.assertEqual(await self._drain(inbox), list(range(100)))
+
+  async def test_block(self):
+    inbox = Inbox(maxsize=2, overflow=BLOCK)
+    await inbox.put(0)
+    await inbox.put(1)
+
+    pending = asyncio.ensure_future(inbox.put(2))
+    await asyncio.sleep(0)
+    self.assertFalse(pending.done())
+
+    self.assertEqual(await inbox.get(), 0)
+    await pending
+    self.assertEqual(await self._drain(inbox), [1, 2])
+    self.assertEqual(inbox.dropped, 0)
+
+  async def test_drop_oldest(self):
+    inbox = Inbox(maxsize=2, overflow=DROP_OLDEST)
+    for i in range(4):
+      await inbox.put(i)
+
+    self.assertEqual(await self._drain(inbox), [2, 3])
+    self.assertEqual(inbox.dropped, 2)
+
+  async def test_drop_newest(self):
+    inbox = Inbox(maxsize=2, overflow=DROP_NEWEST)
+    for i in range(4):
+      await inbox.put(i)
+
+    self.assertEqual(await self._drain(inbox), [0, 1])
+    self.assertEqual(inbox.dropped, 2)
+
+  async def test_spill_keeps_order(self):
+    inbox = Inbox(maxsize=2, overflow=SPILL)
+    for i in range(5):
+      await inbox.put(("src", "payload %d" % i, None))
+
+    self.assertEqual(inbox.qsize(), 5)
+    self.assertEqual(inbox.spilled, 3)
+
+    self.assertEqual(await inbox.get(), ("src", "payload 0", None))
+    await inbox.put(("src", "payload 5", None))
+
+    self.assertEqual(
+        [ p[1] for p in await self._drain(inbox) ],
+        [ "payload %d" % i for i in range(1, 6) ]
+    )
+    self.assertEqual(inbox.spilled, 4)
+    self.assertEqual(inbox.dropped, 0)
+    inbox.close()
+
+  async def test_spill_to_path(self):
+    path = os.path.join(tempfile.mkdtemp(), "spill")
+    inbox = Inbox(maxsize=1, overflow=SPILL, spill_path=path)
+    for i in range(3):
+      await inbox.put(i)
+
+    self.assertGreater(os.path.getsize(path), 0)
+    self.assertEqual(await self._drain(inbox), [0, 1, 2])
+    self.assertEqual(os.path.getsize(path), 0)
+    inbox.close()
+
+  async def test_get_many(self):
+    inbox = Inbox()
+    for i in range(5):
+      await inbox.put(i)
+
+    self.assertEqual(await inbox.get_many(3), [0, 1, 2])
+    self.assertEqual(await inbox.get_many(3), [3, 4])
+
+  async def test_get_many_waits_for_one(self):
+    inbox = Inbox()
+
+    pending = asyncio.ensure_future(inbox.get_many(3))
+    await asyncio.sleep(0)
+    self.assertFalse(pending.done())
+
+    await inbox.put(0)
+    self.assertEqual(await pending, [0])
+
+  async def test_get_many_timeout(self):
+    inbox = Inbox()
+
+    self.assertEqual(await inbox.get_many(3, timeout=0.01), [])
+    self.assertEqual(await inbox.get_many(3, timeout=0), [])
+
+  async def test_get_many_reads_spill(self):
+    inbox = Inbox(maxsize=2, overflow=SPILL)
+    for i in range(5):
+      await inbox.put(i)
+
+    self.assertEqual(await inbox.get_many(10), list(range(5)))
+    self.assertEqual(inbox.qsize(), 0)
+    inbox.close()
+
+  async def test_get_many_wakes_blocked_put(self):
+    inbox = Inbox(maxsize=2, overflow=BLOCK)
+    await inbox.put(0)
+    await inbox.put(1)
+    pending = asyncio.ensure_future(inbox.put(2))
+    await asyncio.sleep(0)
+
+    self.assertEqual(await inbox.get_many(2), [0, 1])
+    await pending
+    self.assertEqual(await inbox.get_many(2), [2])
+
+  def test_invalid_overflow(self):
+    with self.assertRaises(ValueError):
+      Inbox(overflow="unknown")
@@ -0,0 +1,132 @@
+import asyncio
+import asynctest
+import json
+import websockets
+
+from nkn_client.websocket.multi_client import (
+    LEAST_IN_FLIGHT,
+    NknWebsocketMultiClient,
+    get_sub_address,
+    strip_sub_address
+)
+
+
+class TestSubAddress(asynctest.TestCase):
+  def test_get_sub_address(self):
+    self.assertEqual(get_sub_address("id.key", 0), "id.key")
+    self.assertEqual(get_sub_address("id.key", 3), "__3__.id.key")
+
+  def test_strip_sub_address(self):
+    self.assertEqual(strip_sub_address("__3__.id.key"), "id.key")
+    self.assertEqual(strip_sub_address("id.key"), "id.key")
+    self.assertEqual(strip_sub_address("id.__3__.key"), "id.__3__.key")
+    self.assertIsNone(strip_sub_address(None))
+
+
+class TestNknWebsocketMultiClient(asynctest.TestCase):
+  async def setUp(self):
+    # Messages received by the server, for each registered address.
+    self.received = {}
+    self.sockets = {}
+
+    self.server = await websockets.serve(self._handle, "127.0.0.1", 0)
+    port = self.server.sockets[0].getsockname()[1]
+    self.hostname = "127.0.0.1:%d" % port
+
+    self.client = NknWebsocketMultiClient(
+        num_connections=3,
+        heartbeat_interval=None
+    )
+
+  async def tearDown(self):
+    await self.client.disconnect()
+    self.server.close()
+    await self.server.wait_closed()
+
+  async def _handle(self, socket, path):
+    addr = None
+    async for msg in socket:
+      msg = json.loads(msg)
+      if msg["Action"] == "setclient":
+        addr = msg["Addr"]
+        self.sockets[addr] = socket
+      self.received.setdefault(addr, []).append(msg)
+      await socket.send(
+          json.dumps({"Action": msg["Action"], "Error": 0, "Result": None})
+      )
+
+  async def test_set_client_registers_each_connection(self):
+    await self.client.connect(self.hostname)
+    await self.client.set_client("id.key")
+
+    self.assertEqual(
+        sorted(self.received),
+        ["__1__.id.key", "__2__.id.key", "id.key"]
+    )
+    self.assertTrue(self.client.connected)
+
+  async def test_send_packet_round_robin(self):
+    await self.client.connect([ self.hostname ] * 3)
+    await self.client.set_client("id.key")
+
+    await asyncio.gather(
+        *[ self.client.send_packet("dest", str(i), "sig") for i in range(9) ]
+    )
+
+    for addr, msgs in self.received.items():
+      packets = [ msg for msg in msgs if msg["Action"] == "sendPacket" ]
+      self.assertEqual(len(packets), 3)
+
+  async def test_route_least_in_flight(self):
+    client = NknWebsocketMultiClient(
+        num_connections=3,
+        routing=LEAST_IN_FLIGHT,
+        heartbeat_interval=None
+    )
+    for ws, in_flight in zip(client.clients, [5, 1, 3]):
+      ws._connected = True
+      ws._in_flight = in_flight
+
+    for _ in range(3):
+      self.assertIs(client._route(), client.clients[1])
+
+    # Connections which are reconnecting are skipped.
+    client.clients[1]._connected = False
+    self.assertIs(client._route(), client.clients[2])
+
+  async def test_packets_merged_into_one_inbox(self):
+    await self.client.connect(self.hostname)
+    await self.client.set_client("id.key")
+
+    for i, addr in enumerate(["id.key", "__1__.id.key", "__2__.id.key"]):
+      await self.sockets[addr].send(json.dumps({
+        "Action": "receivePacket",
+        "Src": "__%d__.src.key" % (i + 1),
+        "Payload": str(i),
+        "Digest": None
+      }))
+
+    packets = [ await self.client.get_incoming_packet() for _ in range(2) ]
+    packets += await self.client.get_incoming_packets(10)
+    self.assertEqual(
+        sorted(packets),
+        [ ("src.key", str(i), None, None) for i in range(3) ]
+    )
+
+  async def test_connect_fails(self):
+    with self.assertRaises(OSError):
+      await self.client.connect([ self.hostname, self.hostname, "127.0.0.1:1" ])
+
+    self.assertFalse(self.client.connected)
+
+  async def test_connect_wrong_number_of_hostnames(self):
+    with self.assertRaises(ValueError):
+      await self.client.connect([ self.hostname ])
+
+  def test_unknown_routing(self):
+    with self.assertRaises(ValueError):
+      NknWebsocketMultiClient(routing="random")
+
+
+if __name__ == "__main__":
+  asynctest.main()
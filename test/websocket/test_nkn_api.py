@@ -1,7 +1,11 @@
 import asyncio
 import asynctest
+import json
 from asynctest import CoroutineMock, MagicMock, Mock, patch
 
+from nkn_client.cache import ChainCache
+from nkn_client.websocket.inbox import DROP_OLDEST
+from test.websocket.test_client import MockWebsocketsConnection
 from nkn_client.websocket.nkn_api import (
     NknWebsocketApiClient,
     NknWebsocketApiClientError
@@ -166,6 +170,45 @@ class TestNknWebsocketApiClient(asynctest.TestCase):
     with self.assertRaises(NknWebsocketApiClientError):
       _ = await self._client.get_block(hash="deadbeef")
 
+  async def test_get_block_uses_cache(self):
+    expected = {
+      "hash": "5f85d1286801c2f1129a02b0b19a3312f8113aaa073b5987346c59e27a12bdc6",
+      "header": {"height": 1}
+    }
+    mock_call = CoroutineMock(return_value={
+      "Action": "getblock",
+      "Error": 0,
+      "Desc": "SUCCESS",
+      "Result": expected,
+      "Version": "1.0.0"
+    })
+    client = NknWebsocketApiClient(cache=ChainCache())
+    client.call_rpc = mock_call
+
+    _ = await client.get_block(height=1)
+    actual = await client.get_block(hash=expected["hash"])
+
+    self.assertEqual(actual, expected)
+    mock_call.assert_awaited_once()
+
+  async def test_get_transaction_uses_cache(self):
+    expected = {"hash": "327bb43c"}
+    mock_call = CoroutineMock(return_value={
+      "Action": "gettransaction",
+      "Error": 0,
+      "Desc": "SUCCESS",
+      "Result": expected,
+      "Version": "1.0.0"
+    })
+    client = NknWebsocketApiClient(cache=ChainCache())
+    client.call_rpc = mock_call
+
+    _ = await client.get_transaction("327bb43c")
+    actual = await client.get_transaction("327bb43c")
+
+    self.assertEqual(actual, expected)
+    mock_call.assert_awaited_once()
+
   async def test_get_connection_count_success(self):
     expected = 3
     mock_call = CoroutineMock(return_value={
@@ -255,6 +298,28 @@ class TestNknWebsocketApiClient(asynctest.TestCase):
     with self.assertRaises(NknWebsocketApiClientError):
       _ = await self._client.heartbeat()
 
+  async def test_slow_heartbeat_does_not_reconnect(self):
+    async def send(msg):
+      written = asyncio.get_event_loop().create_future()
+      written.set_result(True)
+      return written
+    self._client.send = send
+    self._client.abort = Mock()
+    response = json.dumps({"Action": "heartbeat", "Error": 0, "Result": "x"})
+
+    with self.assertRaises(asyncio.TimeoutError):
+      await self._client.heartbeat(timeout=0.01)
+    self._client.abort.assert_not_called()
+
+    # The late response answers the next heartbeat.
+    beat = asyncio.ensure_future(self._client.heartbeat(timeout=1))
+    await asyncio.sleep(0.01)
+    await self._client.recv(response)
+    self.assertEqual(await beat, "x")
+    await self._client.recv(response)
+    self.assertFalse(self._client._pending["heartbeat"])
+    self._client.abort.assert_not_called()
+
   async def test_get_session_count_success(self):
     expected = 1
     mock_call = CoroutineMock(return_value={
@@ -356,11 +421,85 @@ class TestNknWebsocketApiClient(asynctest.TestCase):
         Digest=Digest
     )
 
-    asrc, apayload, adigest = await self._client.get_incoming_packet()
+    asrc, apayload, adigest, asig = await self._client.get_incoming_packet()
 
     self.assertEqual(asrc, Src)
     self.assertEqual(apayload, Payload)
     self.assertEqual(adigest, Digest)
+    self.assertIsNone(asig)
+
+  async def test_get_incoming_packets(self):
+    for i in range(3):
+      await self._client.receive_packet(
+          Action="receivePacket",
+          Src="source",
+          Payload=str(i),
+          Digest="digest",
+          Signature="sig"
+      )
+
+    packets = await self._client.get_incoming_packets(10)
+
+    self.assertEqual(
+        packets,
+        [ ("source", str(i), "digest", "sig") for i in range(3) ]
+    )
+    self.assertEqual(
+        await self._client.get_incoming_packets(10, timeout=0.01),
+        []
+    )
+
+  async def test_on_connect_registers_again(self):
+    mock_call = CoroutineMock(return_value={
+      "Action": "setclient",
+      "Error": 0,
+      "Desc": "SUCCESS",
+      "Result": None,
+      "Version": "1.0.0"
+    })
+    self._client.call_rpc = mock_call
+
+    await self._client.on_connect()
+    mock_call.assert_not_awaited()
+
+    await self._client.set_client("id.pubkey")
+    mock_call.reset_mock()
+    await self._client.on_connect()
+
+    mock_call.assert_awaited_once_with("setclient", Addr="id.pubkey")
+
+  @patch("websockets.client")
+  async def test_connect_starts_heartbeat(self, mock_ws):
+    mock_ws.connect = CoroutineMock(return_value=MockWebsocketsConnection())
+    client = NknWebsocketApiClient(heartbeat_interval=60)
+
+    await client.connect("url")
+    self.assertIsNotNone(client._heartbeat._task)
+    self.assertIsNotNone(client.rtt)
+
+    await client.disconnect()
+    self.assertIsNone(client._heartbeat._task)
+
+  def test_heartbeat_disabled(self):
+    client = NknWebsocketApiClient(heartbeat_interval=None)
+
+    self.assertIsNone(client.rtt)
+
+  async def test_inbox_overflow(self):
+    client = NknWebsocketApiClient(inbox_size=1, inbox_overflow=DROP_OLDEST)
+
+    for payload in ("first", "second"):
+      await client.receive_packet(
+          Action="receivePacket",
+          Src="source",
+          Payload=payload,
+          Digest="digest"
+      )
+
+    _, payload, _, _ = await client.get_incoming_packet()
+
+    self.assertEqual(payload, "second")
+    self.assertEqual(client.inbox.dropped, 1)
 
   async def test_sig_chain_block_hash(self):
     Action = "updateSigChainBlockHash"